@@ -0,0 +1,391 @@
+#!/usr/bin/env python3
+"""
+Replay benchmark for the bot message pipeline, without a Telegram account.
+
+Synthetic pyrogram Messages (URL and text-link entities, photo captions, link
+previews, article + Hacker News pairs) are fed to
+BookmarkBot.process_message_for_urls in a burst, as when a chat is bulk
+forwarded. The rest of the pipeline is real: ingest queue and workers,
+scraping, tagging queue, database thread and reply aggregation. Only the
+outside world is replaced:
+
+- a fake Telegram client that answers send/edit calls after a delay;
+- a local stub HTTP server, used as HTTP proxy, serving synthetic pages (or
+  recorded ones from --pages-dir) for every domain;
+- a fake Gemini endpoint on the same server (GEMINI_API_BASE).
+
+For every concurrency level (number of ingest workers) it reports messages
+per second, p50/p99 latency from the message to its saved reply, and the
+time spent waiting for the SQLite write lock.
+
+Usage:
+  python scripts/bench_bot_pipeline.py --messages 200 --concurrency 1,4,16
+  python scripts/bench_bot_pipeline.py --lock-holder-ms 20 --stages
+"""
+import os
+import sys
+import json
+import time
+import random
+import sqlite3
+import asyncio
+import logging
+import argparse
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+# Add the project root to the path
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.dirname(SCRIPT_DIR))
+
+import requests
+from pyrogram import enums, types
+
+from shared.async_db import AsyncDatabase
+from shared.database import init_database
+from shared.metrics import get_metrics
+from shared.saved_urls import SavedUrlIndex
+from shared.search import SearchCache
+from shared.tag_queue import TagWorker
+from shared.telegram_links import TelegramUserRouter
+from telegram_bot.bot import BookmarkBot, ReplyAggregator
+
+CHAT_ID = 1000
+TELEGRAM_USER_ID = 12345
+STUB_HEADER = 'X-Bench-Stub'
+# Reserved .example domains: nothing leaves the machine even if the proxy were bypassed
+DOMAINS = [f"{name}.example" for name in (
+    "blog", "news", "docs", "lwn", "papers", "github", "medium", "substack", "wiki", "dev",
+    "research", "engineering", "status", "changelog", "forum", "gist", "arxiv", "notes", "talks", "slow",
+)]
+WORDS = ("sqlite", "python", "latency", "kernel", "compiler", "queue", "cache", "index", "rust",
+         "postgres", "scheduler", "btree", "telegram", "bookmark", "parser", "async", "thread")
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Serves every proxied page and the fake Gemini API."""
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _delay(self, seconds):
+        if seconds > 0:
+            time.sleep(seconds * random.uniform(0.5, 1.5))
+
+    def _page(self):
+        parts = urlsplit(self.path)
+        settings = self.server.settings
+        if parts.hostname == 'slow.example':
+            self._delay(settings['page_delay'] * 10)
+        if settings['pages']:
+            return settings['pages'][hash(self.path) % len(settings['pages'])]
+        rng = random.Random(self.path)
+        title = " ".join(rng.sample(WORDS, 4)).title()
+        description = f"Notes about {' and '.join(rng.sample(WORDS, 3))}."
+        body = "".join(f"<p>{' '.join(rng.choices(WORDS, k=40))}</p>\n" for _ in range(settings['paragraphs']))
+        return (
+            f'<!DOCTYPE html><html><head><title>{title}</title>'
+            f'<meta property="og:title" content="{title}">'
+            f'<meta property="og:description" content="{description}">'
+            f'<meta property="og:image" content="http://{parts.hostname}/image.png">'
+            f'</head><body><h1>{title}</h1>{body}</body></html>'
+        ).encode('utf-8')
+
+    def _send(self, status, content_type, body, head_only=False):
+        self.send_response(status)
+        self.send_header(STUB_HEADER, '1')
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if not head_only:
+            self.wfile.write(body)
+
+    def do_HEAD(self):
+        self._delay(self.server.settings['page_delay'] / 2)
+        self._send(200, 'text/html; charset=utf-8', self._page(), head_only=True)
+
+    def do_GET(self):
+        self._delay(self.server.settings['page_delay'])
+        self._send(200, 'text/html; charset=utf-8', self._page())
+
+    def do_POST(self):
+        # Fake Gemini generateContent
+        length = int(self.headers.get('Content-Length') or 0)
+        prompt = json.loads(self.rfile.read(length) or b'{}')
+        self._delay(self.server.settings['llm_delay'])
+        text = json.dumps(prompt)
+        tags = [word for word in WORDS if word in text.lower()][:3] or ["misc"]
+        answer = {
+            "candidates": [{"content": {"parts": [{"text": json.dumps({"tags": tags})}]}}],
+            "usageMetadata": {"totalTokenCount": 120},
+        }
+        self._send(200, 'application/json', json.dumps(answer).encode('utf-8'))
+
+
+def start_stub_server(args):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    server.daemon_threads = True
+    pages = []
+    if args.pages_dir:
+        for name in sorted(os.listdir(args.pages_dir)):
+            if name.endswith(('.html', '.htm')):
+                with open(os.path.join(args.pages_dir, name), 'rb') as f:
+                    pages.append(f.read())
+    server.settings = {
+        'page_delay': args.page_delay_ms / 1000,
+        'llm_delay': args.llm_delay_ms / 1000,
+        'paragraphs': max(1, args.page_kb * 1024 // 300),
+        'pages': pages,
+    }
+    threading.Thread(target=server.serve_forever, name="bench-stub", daemon=True).start()
+
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    # Page fetches go through the stub as an HTTP proxy, whatever the domain
+    for name in ('HTTP_PROXY', 'http_proxy'):
+        os.environ[name] = base
+    for name in ('NO_PROXY', 'no_proxy'):
+        os.environ[name] = '127.0.0.1,localhost'
+    if args.no_llm:
+        os.environ['GEMINI_ENABLED'] = 'false'
+    else:
+        os.environ.update(GEMINI_ENABLED='true', GEMINI_API_KEY='bench', GEMINI_API_BASE=base)
+
+    probe = requests.get("http://probe.example/", timeout=5)
+    if probe.headers.get(STUB_HEADER) != '1':
+        raise RuntimeError("Requests do not go through the stub server; check the proxy settings")
+    return server
+
+
+class FakeClient:
+    """Stands in for pyrogram.Client: replies take `delay` seconds."""
+
+    def __init__(self, delay):
+        self.delay = delay
+        self._next_id = 10 ** 6
+
+    async def send_message(self, chat_id, text, reply_to_message_id=None, **kwargs):
+        await asyncio.sleep(self.delay)
+        self._next_id += 1
+        return types.Message(id=self._next_id, chat=types.Chat(id=chat_id, type=enums.ChatType.PRIVATE))
+
+    async def edit_message_text(self, chat_id, message_id, text, **kwargs):
+        await asyncio.sleep(self.delay)
+
+
+def _url_entity(text, url):
+    return types.MessageEntity(type=enums.MessageEntityType.URL, offset=text.index(url), length=len(url))
+
+
+def build_messages(count, run, rng):
+    """Synthetic messages with the link layouts the bot handles."""
+    chat = types.Chat(id=CHAT_ID, type=enums.ChatType.PRIVATE)
+    sender = types.User(id=TELEGRAM_USER_ID)
+    messages = []
+    for n in range(1, count + 1):
+        url = f"http://{rng.choice(DOMAINS)}/{run}/post-{n}"
+        kind = rng.random()
+        fields = {}
+        if kind < 0.4:
+            text = f"Worth a read: {url}"
+            fields.update(text=text, entities=[_url_entity(text, url)])
+        elif kind < 0.6:
+            text = "this article"
+            link = types.MessageEntity(type=enums.MessageEntityType.TEXT_LINK, offset=5, length=7, url=url)
+            fields.update(text=text, entities=[link])
+        elif kind < 0.75:
+            caption = f"Screenshot from {url}"
+            fields.update(caption=caption, caption_entities=[_url_entity(caption, url)])
+        elif kind < 0.85:
+            fields.update(text="shared a link", web_page=types.WebPage(id=str(n), url=url, display_url=url))
+        else:
+            hn_url = f"http://news.ycombinator.com/item?id={run * 10 ** 6 + n}"
+            text = f"{url}\n{hn_url}"
+            fields.update(text=text, entities=[_url_entity(text, url), _url_entity(text, hn_url)])
+        messages.append(types.Message(id=n, chat=chat, from_user=sender, **fields))
+    return messages
+
+
+def build_bot(db_path, client, workers):
+    """A BookmarkBot wired to the fake client, without credentials (see BookmarkBot.__init__)."""
+    bot = BookmarkBot.__new__(BookmarkBot)
+    bot.app = client
+    bot.saved_urls = SavedUrlIndex()
+    bot.user_router = TelegramUserRouter(db_path)
+    bot.user_router.load()
+    bot.db = AsyncDatabase(db_path)
+    bot.tag_worker = None
+    bot._loop = None
+    bot._ingest_wakeup = None
+    bot._pending_replies = {}
+    bot._pending_tags = {}
+    bot.replies = ReplyAggregator(client)
+    bot.search_cache = SearchCache()
+    bot._catching_up = {}
+    return bot
+
+
+def hold_write_lock(db_path, hold_seconds, stop):
+    """Takes the write lock for `hold_seconds` every 50ms, like a busy webserver."""
+    conn = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+    try:
+        while not stop.is_set():
+            conn.execute("BEGIN IMMEDIATE")
+            time.sleep(hold_seconds)
+            conn.execute("COMMIT")
+            stop.wait(0.05)
+    finally:
+        conn.close()
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(q * len(ordered))) - 1))]
+
+
+async def run_level(args, workers, run):
+    """Replays one burst of messages with `workers` ingest workers. Returns the results."""
+    tmp_dir = tempfile.mkdtemp(prefix="bench-bot-")
+    db_path = os.path.join(tmp_dir, "bookmarks.db")
+    conn = init_database(sqlite3.connect(db_path))
+    conn.execute("INSERT INTO users (id, username, password_hash) VALUES (1, 'bench', 'x')")
+    conn.commit()
+    conn.close()
+
+    get_metrics().reset()
+    bot = build_bot(db_path, FakeClient(args.telegram_delay_ms / 1000), workers)
+    bot._loop = asyncio.get_running_loop()
+    bot._ingest_wakeup = asyncio.Event()
+    bot.db.start()
+    bot.tag_worker = TagWorker(origin='bot', on_tagged=bot._on_tags_ready, db_path=db_path, poll_interval=0.2)
+    bot.tag_worker.start()
+
+    stop_holder = threading.Event()
+    holder = None
+    if args.lock_holder_ms:
+        holder = threading.Thread(target=hold_write_lock, args=(db_path, args.lock_holder_ms / 1000, stop_holder), daemon=True)
+        holder.start()
+
+    messages = build_messages(args.messages, run, random.Random(run))
+    started_at = {}
+    latencies = {}
+    done = asyncio.Event()
+    post = bot.replies.post
+
+    def timed_post(chat_id, key, text, reply_to=None):
+        # The first reply that is not the "queued" acknowledgment ends the message
+        if key in started_at and key not in latencies and not text.startswith("⏳"):
+            latencies[key] = time.perf_counter() - started_at[key]
+            if len(latencies) == len(messages):
+                done.set()
+        post(chat_id, key, text, reply_to)
+
+    bot.replies.post = timed_post
+    tasks = [asyncio.create_task(bot._ingest_worker(i)) for i in range(workers)]
+    wall_start = time.perf_counter()
+    try:
+        async def feed(message):
+            started_at[message.id] = time.perf_counter()
+            await bot.process_message_for_urls(message)
+
+        await asyncio.gather(*(feed(message) for message in messages))
+        try:
+            await asyncio.wait_for(done.wait(), args.timeout)
+        except asyncio.TimeoutError:
+            logging.warning("Timed out with %s/%s messages done", len(latencies), len(messages))
+        wall = time.perf_counter() - wall_start
+        if args.wait_tags:
+            # Let the background LLM tagging finish so that its stage is complete
+            deadline = time.monotonic() + args.timeout
+            while bot._pending_tags and time.monotonic() < deadline:
+                await asyncio.sleep(0.1)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        stop_holder.set()
+        if holder is not None:
+            holder.join()
+        bot.tag_worker.stop()
+        await bot.replies.drain()
+        bot.db.close()
+        bot.user_router.close()
+
+    snapshot = get_metrics().snapshot()
+    lock = [s for s in snapshot['stages'] if s['stage'] == 'db_lock']
+    return {
+        'workers': workers,
+        'messages': len(latencies),
+        'wall': wall,
+        'latencies': list(latencies.values()),
+        'lock_batches': sum(s['count'] for s in lock),
+        # Batches that waited more than 1ms for the lock
+        'lock_waits': sum(s['count'] - s['buckets'].get('0.001', 0) for s in lock),
+        'lock_seconds': sum(s['sum_seconds'] for s in lock),
+        'lock_max': max((s['max_seconds'] for s in lock), default=0.0),
+        'stages': snapshot['stages'],
+    }
+
+
+def print_stages(stages):
+    totals = {}
+    for s in stages:
+        entry = totals.setdefault((s['stage'], s['outcome']), {'count': 0, 'sum': 0.0, 'max': 0.0})
+        entry['count'] += s['count']
+        entry['sum'] += s['sum_seconds']
+        entry['max'] = max(entry['max'], s['max_seconds'])
+    print(f"    {'stage':<10} {'outcome':<14} {'count':>6} {'mean ms':>9} {'max ms':>9}")
+    for (stage, outcome), entry in sorted(totals.items()):
+        mean = entry['sum'] / entry['count'] * 1000 if entry['count'] else 0.0
+        print(f"    {stage:<10} {outcome:<14} {entry['count']:>6} {mean:>9.1f} {entry['max'] * 1000:>9.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the bot message pipeline with synthetic messages")
+    parser.add_argument('--messages', type=int, default=200, help='Messages per concurrency level')
+    parser.add_argument('--concurrency', default='1,4,16', help='Comma-separated numbers of ingest workers')
+    parser.add_argument('--page-delay-ms', type=float, default=50, help='Stub page latency (slow.example: 10x)')
+    parser.add_argument('--page-kb', type=int, default=50, help='Size of the synthetic pages')
+    parser.add_argument('--pages-dir', help='Directory of recorded .html pages to serve instead')
+    parser.add_argument('--llm-delay-ms', type=float, default=800, help='Fake Gemini latency')
+    parser.add_argument('--no-llm', action='store_true', help='Disable Gemini tagging (local tags only)')
+    parser.add_argument('--telegram-delay-ms', type=float, default=30, help='Fake Telegram send/edit latency')
+    parser.add_argument('--lock-holder-ms', type=float, default=0,
+                        help='Hold the write lock this long every 50ms from another connection')
+    parser.add_argument('--wait-tags', action='store_true', help='Also wait for the background LLM tags')
+    parser.add_argument('--stages', action='store_true', help='Print the per-stage timings of every level')
+    parser.add_argument('--timeout', type=float, default=300, help='Seconds to wait for one level')
+    parser.add_argument('--verbose', action='store_true', help='Keep the pipeline logs')
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.INFO if args.verbose else logging.WARNING)
+    levels = [int(level) for level in args.concurrency.split(',') if level.strip()]
+    server = start_stub_server(args)
+    try:
+        print(f"{args.messages} messages per level, pages {args.page_delay_ms:g}ms, "
+              f"LLM {'off' if args.no_llm else f'{args.llm_delay_ms:g}ms'}, Telegram {args.telegram_delay_ms:g}ms")
+        print(f"{'workers':>7} {'msg/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'lock waits':>11} {'lock s':>8} {'lock max ms':>12}")
+        for run, workers in enumerate(levels, start=1):
+            result = asyncio.run(run_level(args, workers, run))
+            latencies = result['latencies']
+            rate = result['messages'] / result['wall'] if result['wall'] else 0.0
+            print(
+                f"{workers:>7} {rate:>8.1f} {percentile(latencies, 0.5) * 1000:>8.0f} "
+                f"{percentile(latencies, 0.99) * 1000:>8.0f} "
+                f"{result['lock_waits']:>5}/{result['lock_batches']:<5} {result['lock_seconds']:>8.3f} "
+                f"{result['lock_max'] * 1000:>12.1f}"
+            )
+            if args.stages:
+                print_stages(result['stages'])
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark: legacy frequency tagger vs. the corpus-aware TF-IDF engine.
+
+Runs on a synthetic corpus, no database needed.
+Usage:
+  python scripts/bench_tag_engine.py --docs 5000 --repeat 3
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import timeit
+from collections import Counter
+
+# Add the project root to the path
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.dirname(SCRIPT_DIR))
+
+from shared.tagging import TagEngine
+
+
+def legacy_generate_tags(text, n=3):
+    """Copy of the previous generate_tags(): rebuilds stopwords and regex on every call."""
+    if not text:
+        return []
+    stopwords = {
+        'the','and','for','with','that','this','from','are','was','will','have','has','not','but','you','your',
+        'per','una','un','il','la','le','di','e','che','da','in','su','con','del','della'
+    }
+    tokens = [t.lower() for t in re.findall(r"\w+", text, flags=re.UNICODE) if len(t) > 2]
+    tokens = [t for t in tokens if t not in stopwords and not t.isdigit()]
+    if not tokens:
+        return []
+    counts = Counter(tokens)
+    most_common = [t for t, _ in counts.most_common(n*3)]
+    seen = set()
+    tags = []
+    for t in most_common:
+        if t in seen: continue  # noqa: E701
+        seen.add(t)
+        tags.append(t)
+        if len(tags) >= n:
+            break
+    return tags
+
+
+GENERIC = ["guide", "introduction", "using", "how", "why", "new", "blog", "post", "article", "release"]
+TOPICS = ["sqlite", "python", "rust", "kubernetes", "postgres", "compiler", "webassembly", "telegram",
+          "linux", "kernel", "gpu", "llm", "tokenizer", "garbage", "collector", "scheduler", "btree"]
+
+
+def synthetic_text(rng):
+    """A title with generic words up front and one distinctive topic word."""
+    title = " ".join(rng.sample(GENERIC, 3) + rng.sample(TOPICS, 1))
+    description = " ".join(rng.sample(GENERIC, 2)) + " notes for the reader"
+    return f"{title}\n{description}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark local tag generation")
+    parser.add_argument('--docs', type=int, default=5000, help='Synthetic corpus size')
+    parser.add_argument('--repeat', type=int, default=3, help='Timing repetitions (best is reported)')
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    texts = [synthetic_text(rng) for _ in range(args.docs)]
+
+    engine = TagEngine()
+    for text in texts:
+        engine.observe(1, text)
+
+    def run_legacy():
+        for text in texts:
+            legacy_generate_tags(text)
+
+    def run_tfidf():
+        for text in texts:
+            engine.score(1, text)
+
+    def run_tfidf_batch():
+        engine.score_batch(1, texts)
+
+    print(f"Corpus: {args.docs} documents, {len(engine._df[1])} terms")
+    for name, func in (("legacy frequency", run_legacy), ("tfidf score()", run_tfidf), ("tfidf score_batch()", run_tfidf_batch)):
+        best = min(timeit.repeat(func, number=1, repeat=args.repeat))
+        print(f"{name:<22} {best * 1000:8.1f} ms total  {best / args.docs * 1e6:7.2f} us/doc")
+
+    sample = texts[0]
+    print(f"\nSample: {sample!r}")
+    print(f"  legacy: {legacy_generate_tags(sample)}")
+    print(f"  tfidf:  {engine.score(1, sample)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Requests per second over one TLS connection, with and without keep-alive.
+
+Starts the web server on a temporary database (--bookmarks synthetic rows)
+with a self-signed certificate, then replays the requests of a browsing
+session (infinite-scroll pages, mark-read toggles, the bookmark API) from a
+single client:
+
+- "HTTP/1.0": the handler speaks HTTP/1.0 as before, every request opens a
+  new TCP connection and pays a TLS handshake;
+- "HTTP/1.1 keep-alive": every request reuses the same connection.
+
+Usage:
+  python scripts/bench_web_keepalive.py --requests 500 --engine threads
+  python scripts/bench_web_keepalive.py --engine asyncio --http
+"""
+import os
+import sys
+import ssl
+import time
+import asyncio
+import sqlite3
+import argparse
+import tempfile
+import threading
+import http.client
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+# Add the project root to the path
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.dirname(SCRIPT_DIR))
+
+from shared.database import init_database
+from webserver import server as server_module
+from webserver.async_engine import AsyncBookmarkServer
+
+SESSION_ID = "bench-session"
+
+
+def create_database(path, bookmarks):
+    conn = sqlite3.connect(path)
+    init_database(conn)
+    conn.execute("INSERT INTO users (id, username, password_hash) VALUES (1, 'bench', 'unused')")
+    conn.execute("INSERT INTO sessions (session_id, user_id, expires_at) VALUES (?, 1, ?)",
+                 (SESSION_ID, datetime.now() + timedelta(days=1)))
+    conn.executemany(
+        "INSERT INTO bookmarks (user_id, url, title, description, domain, tags) VALUES (1, ?, ?, ?, ?, ?)",
+        [(f"https://site{n % 50}.example/post/{n}", f"Bookmark number {n}", "A synthetic description. " * 4,
+          f"site{n % 50}.example", '["bench", "synthetic"]') for n in range(bookmarks)],
+    )
+    conn.commit()
+    conn.close()
+
+
+@contextmanager
+def running_server(engine, ssl_context, workers):
+    if engine == 'asyncio':
+        loop = asyncio.new_event_loop()
+        thread = threading.Thread(target=loop.run_forever, daemon=True)
+        thread.start()
+        httpd = AsyncBookmarkServer(server_module.BookmarkHandler, server_module.ROUTES, host='127.0.0.1',
+                                    ssl_context=ssl_context, workers=workers)
+        asyncio.run_coroutine_threadsafe(httpd.start(), loop).result()
+        try:
+            yield httpd.port
+        finally:
+            asyncio.run_coroutine_threadsafe(httpd.close(timeout=5), loop).result()
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join()
+            loop.close()
+    else:
+        httpd = server_module.PooledHTTPServer(('127.0.0.1', 0), server_module.BookmarkHandler,
+                                               workers=workers, ssl_context=ssl_context)
+        thread = threading.Thread(target=httpd.serve_forever, args=(0.05,), daemon=True)
+        thread.start()
+        try:
+            yield httpd.server_address[1]
+        finally:
+            httpd.shutdown()
+            httpd.close_gracefully(timeout=5)
+
+
+def session_requests(count, bookmarks):
+    """A browsing session: scroll pages, mark-read toggles and API reads, in turn."""
+    headers = {'Cookie': f'session_id={SESSION_ID}'}
+    json_headers = {**headers, 'Content-Type': 'application/json'}
+    for n in range(count):
+        kind = n % 3
+        if kind == 0:
+            offset = (n * 20) % max(bookmarks, 1)
+            yield 'GET', f'/ui/bookmarks/scroll?offset={offset}&limit=20&hide_read=false', None, headers
+        elif kind == 1:
+            yield 'PUT', f'/api/bookmarks/{n % max(bookmarks, 1) + 1}/read', b'{"is_read": %d}' % (n % 2), json_headers
+        else:
+            yield 'GET', '/api/bookmarks?limit=20', None, headers
+
+
+def run_client(port, client_context, count, bookmarks):
+    """Sends the session from one client; returns (requests/s, connections opened)."""
+    def connect():
+        if client_context is None:
+            return http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+        return http.client.HTTPSConnection('127.0.0.1', port, timeout=30, context=client_context)
+
+    connection = connect()
+    opened = 0
+    started = time.perf_counter()
+    for method, path, body, headers in session_requests(count, bookmarks):
+        if connection.sock is None:
+            opened += 1
+        connection.request(method, path, body=body, headers=headers)
+        response = connection.getresponse()
+        response.read()
+        if response.status >= 400:
+            raise RuntimeError(f"{method} {path} -> {response.status}")
+        if response.will_close:
+            connection.close()
+    elapsed = time.perf_counter() - started
+    connection.close()
+    return count / elapsed, opened
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark persistent connections of the web server")
+    parser.add_argument('--requests', type=int, default=300, help='Requests per run')
+    parser.add_argument('--bookmarks', type=int, default=500, help='Synthetic bookmarks in the database')
+    parser.add_argument('--engine', choices=['threads', 'asyncio'], default='threads')
+    parser.add_argument('--workers', type=int, default=server_module.DEFAULT_WORKERS)
+    parser.add_argument('--http', action='store_true', help='Plain HTTP instead of TLS')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        server_module.DB_PATH = os.path.join(tmp, "bench.db")
+        create_database(server_module.DB_PATH, args.bookmarks)
+        server_module.logger.setLevel('WARNING')
+        server_module.BookmarkHandler.log_message = lambda *a: None
+
+        server_context = client_context = None
+        if not args.http:
+            cert_file, key_file = os.path.join(tmp, "server.pem"), os.path.join(tmp, "server.key")
+            server_module.create_self_signed_cert(cert_file, key_file)
+            server_context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+            server_context.load_cert_chain(cert_file, key_file)
+            client_context = ssl.create_default_context(cafile=cert_file)
+            client_context.check_hostname = False
+
+        print(f"{args.requests} requests, engine {args.engine}, {'HTTP' if args.http else 'HTTPS'}")
+        for label, protocol in (("HTTP/1.0", "HTTP/1.0"), ("HTTP/1.1 keep-alive", "HTTP/1.1")):
+            server_module.BookmarkHandler.protocol_version = protocol
+            with running_server(args.engine, server_context, args.workers) as port:
+                run_client(port, client_context, min(args.requests, 20), args.bookmarks)  # warm-up
+                rate, opened = run_client(port, client_context, args.requests, args.bookmarks)
+            print(f"{label:<22} {rate:8.1f} req/s  {opened:5d} connections")
+
+
+if __name__ == '__main__':
+    main()
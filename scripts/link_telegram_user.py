@@ -0,0 +1,54 @@
+"""
+Script to link a Telegram account to a web user, so that the bot saves the
+links sent by that account into the user's bookmarks.
+
+While no link exists, the bot saves everything for the first web user.
+"""
+import os
+import sys
+import sqlite3
+
+# Add the project root to the path to import shared modules
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.dirname(SCRIPT_DIR))
+
+from shared.database import get_db_path, init_database
+from shared.telegram_links import link_telegram_user, unlink_telegram_user
+
+
+def link_user():
+    """Links (or unlinks) a Telegram account interactively."""
+    print("--- Linking a Telegram account to a web user ---")
+    print("The bot shows the Telegram id to senders that are not linked yet.")
+    telegram_id = input("Enter Telegram user id: ").strip()
+    if not telegram_id.lstrip('-').isdigit():
+        print("❌ The Telegram user id must be a number.")
+        return
+    username = input("Enter web username (leave empty to unlink): ").strip()
+
+    conn = sqlite3.connect(get_db_path())
+    try:
+        cursor = conn.cursor()
+        if not username:
+            if unlink_telegram_user(cursor, int(telegram_id)):
+                print(f"✅ Telegram user {telegram_id} unlinked.")
+            else:
+                print(f"ℹ️ Telegram user {telegram_id} was not linked.")
+            conn.commit()
+            return
+
+        cursor.execute("SELECT id FROM users WHERE username = ?", (username,))
+        user = cursor.fetchone()
+        if not user:
+            print(f"❌ Error: User '{username}' does not exist.")
+            return
+        link_telegram_user(cursor, int(telegram_id), user[0])
+        conn.commit()
+        print(f"✅ Telegram user {telegram_id} linked to '{username}'.")
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    init_database().close() # Ensure the tables exist
+    link_user()
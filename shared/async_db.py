@@ -0,0 +1,173 @@
+"""
+Asynchronous access to the database for the Telegram bot.
+
+SQLite calls block on disk I/O and on the write lock (held, for instance, by
+the webserver), so the bot never runs them on its event loop. `AsyncDatabase`
+owns one connection on a dedicated thread and serves a queue of calls:
+
+- `execute(fn, *args)` runs fn(conn, *args) on its own; fn may open its own
+  transaction (e.g. claim_ingest_job) or only read.
+- `write(fn, *args)` runs fn(cursor, *args) inside a shared transaction: writes
+  arriving within a few milliseconds of each other are committed together,
+  each under a savepoint so that a failing write does not undo the others.
+
+Both return awaitables; `submit()` gives a concurrent Future for callers on
+worker threads.
+"""
+import time
+import queue
+import sqlite3
+import asyncio
+import logging
+import threading
+from collections import namedtuple
+from concurrent.futures import Future
+
+from shared.database import connect_autocommit
+from shared.metrics import get_metrics
+
+logger = logging.getLogger(__name__)
+
+BUSY_TIMEOUT_SECONDS = 5
+BUSY_RETRIES = 3
+BATCH_WINDOW_SECONDS = 0.005
+MAX_BATCH_SIZE = 100
+
+_Call = namedtuple('_Call', 'fn args write future')
+_NO_CALL = object()  # the queue was empty when a batch was closed
+
+
+class AsyncDatabase(threading.Thread):
+    """
+    Dedicated database thread with a call queue.
+
+    Args:
+        db_path (str, optional): Database path; defaults to get_db_path().
+        busy_timeout (float): Seconds SQLite waits for a lock before a batch is retried.
+        batch_window (float): Seconds a write waits for others to share its transaction.
+    """
+
+    def __init__(self, db_path=None, busy_timeout=BUSY_TIMEOUT_SECONDS, batch_window=BATCH_WINDOW_SECONDS,
+                 max_batch_size=MAX_BATCH_SIZE):
+        super().__init__(name="async-db", daemon=True)
+        self.db_path = db_path
+        self.busy_timeout = busy_timeout
+        self.batch_window = batch_window
+        self.max_batch_size = max_batch_size
+        self._queue = queue.Queue()
+        self._closed = False
+
+    def submit(self, fn, *args, write=False):
+        """Queues a call and returns a concurrent.futures.Future with its result."""
+        if self._closed:
+            raise RuntimeError("AsyncDatabase is closed")
+        future = Future()
+        self._queue.put(_Call(fn, args, write, future))
+        return future
+
+    async def execute(self, fn, *args):
+        """Runs fn(conn, *args) on the database thread."""
+        return await asyncio.wrap_future(self.submit(fn, *args))
+
+    async def write(self, fn, *args):
+        """Runs fn(cursor, *args) in a write transaction shared with concurrent writes."""
+        return await asyncio.wrap_future(self.submit(fn, *args, write=True))
+
+    def close(self, timeout=5):
+        """Runs the calls already queued, then stops the thread."""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        if self.is_alive():
+            self.join(timeout)
+
+    def run(self):
+        conn = connect_autocommit(self.db_path, timeout=self.busy_timeout)
+        try:
+            call = self._queue.get()
+            while call is not None:
+                if call.write:
+                    batch, call = self._collect_writes(call)
+                    self._run_batch(conn, batch)
+                else:
+                    self._run_call(conn, call)
+                    call = _NO_CALL
+                if call is _NO_CALL:
+                    call = self._queue.get()
+        finally:
+            conn.close()
+
+    def _collect_writes(self, first):
+        """Gathers the writes queued within the batch window. Returns (batch, next call)."""
+        batch = [first]
+        deadline = time.monotonic() + self.batch_window
+        while len(batch) < self.max_batch_size:
+            try:
+                call = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                return batch, _NO_CALL
+            if call is None or not call.write:
+                return batch, call
+            batch.append(call)
+        return batch, _NO_CALL
+
+    @staticmethod
+    def _run_call(conn, call):
+        if not call.future.set_running_or_notify_cancel():
+            return
+        try:
+            call.future.set_result(call.fn(conn, *call.args))
+        except Exception as e:
+            call.future.set_exception(e)
+
+    def _begin(self, conn):
+        """BEGIN IMMEDIATE, retried with backoff while another process holds the write lock."""
+        for attempt in range(BUSY_RETRIES + 1):
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                return
+            except sqlite3.OperationalError as e:
+                if attempt == BUSY_RETRIES or 'locked' not in str(e) and 'busy' not in str(e):
+                    raise
+                delay = 0.1 * 2 ** attempt
+                logger.warning("Database busy, retrying the write batch in %ss: %s", delay, e)
+                time.sleep(delay)
+
+    def _run_batch(self, conn, batch):
+        batch = [call for call in batch if call.future.set_running_or_notify_cancel()]
+        if not batch:
+            return
+        try:
+            # Time spent waiting for the write lock (webserver, importer, tag worker)
+            with get_metrics().time('db_lock'):
+                self._begin(conn)
+        except sqlite3.Error as e:
+            logger.error("Could not start a write batch of %s calls: %s", len(batch), e)
+            for call in batch:
+                call.future.set_exception(e)
+            return
+
+        results = []
+        cursor = conn.cursor()
+        for call in batch:
+            conn.execute("SAVEPOINT batch_call")
+            try:
+                results.append((call, call.fn(cursor, *call.args), None))
+                conn.execute("RELEASE batch_call")
+            except Exception as e:
+                conn.execute("ROLLBACK TO batch_call")
+                conn.execute("RELEASE batch_call")
+                results.append((call, None, e))
+        try:
+            conn.execute("COMMIT")
+        except sqlite3.Error as e:
+            conn.execute("ROLLBACK")
+            logger.error("Could not commit a write batch of %s calls: %s", len(batch), e)
+            results = [(call, None, error or e) for call, _, error in results]
+
+        for call, result, error in results:
+            if error is None:
+                call.future.set_result(result)
+            else:
+                call.future.set_exception(error)
@@ -3,8 +3,10 @@ Module for centralized SQLite database management.
 Contains the logic for schema initialization and migration.
 """
 import os
+import json
 import sqlite3
 import logging
+from contextlib import contextmanager
 from datetime import datetime
 
 __version__ = "1.0"
@@ -62,6 +64,9 @@ def init_database(conn=None):
             telegram_message_id INTEGER,
             comments_url TEXT,
             is_read INTEGER DEFAULT 0,
+            tags_status TEXT DEFAULT 'done',
+            last_seen_at TIMESTAMP,
+            row_version INTEGER NOT NULL DEFAULT 0,
             FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE,
             UNIQUE(user_id, url)
         )
@@ -86,6 +91,107 @@ def init_database(conn=None):
         )
     """)
 
+    # Per-user document-frequency statistics for the local TF-IDF tag engine (shared/tagging.py)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS tag_term_stats (
+            user_id INTEGER NOT NULL,
+            term TEXT NOT NULL,
+            df INTEGER NOT NULL,
+            PRIMARY KEY (user_id, term),
+            FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE
+        ) WITHOUT ROWID
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS tag_corpus_stats (
+            user_id INTEGER PRIMARY KEY,
+            doc_count INTEGER NOT NULL,
+            FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE
+        )
+    """)
+
+    # Durable queue of bookmarks waiting for LLM tags (shared/tag_queue.py)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS tag_jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            bookmark_id INTEGER NOT NULL UNIQUE,
+            origin TEXT NOT NULL DEFAULT 'web',
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at REAL NOT NULL DEFAULT 0,
+            chat_id INTEGER,
+            reply_message_id INTEGER,
+            last_error TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (bookmark_id) REFERENCES bookmarks (id) ON DELETE CASCADE
+        )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_tag_jobs_status ON tag_jobs (status, next_attempt_at)")
+
+    # Gemini budgets and cooldown shared by every process on this database (shared/llm_limiter.py).
+    # NULL budget columns: that bucket has not been used yet and starts full.
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS llm_budget (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            requests REAL,
+            requests_at REAL,
+            tokens REAL,
+            tokens_at REAL,
+            unavailable_until REAL NOT NULL DEFAULT 0
+        )
+    """)
+
+    # Durable queue of Telegram messages waiting to be ingested (shared/ingest_queue.py)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS ingest_jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            chat_id INTEGER NOT NULL,
+            message_id INTEGER NOT NULL,
+            telegram_user_id INTEGER,
+            urls TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at REAL NOT NULL DEFAULT 0,
+            last_error TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE (chat_id, message_id)
+        )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_ingest_jobs_status ON ingest_jobs (status, next_attempt_at)")
+    # Last processed message per chat, for the offline catch-up of the bot
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS telegram_chat_state (
+            chat_id INTEGER PRIMARY KEY,
+            last_message_id INTEGER NOT NULL
+        )
+    """)
+
+    # Telegram sender -> web user routing for the bot (shared/telegram_links.py)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS telegram_links (
+            telegram_user_id INTEGER PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            linked_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE
+        )
+    """)
+    # Bumped by triggers whenever the routing may change, so the bot's cache
+    # can tell cheaply whether it must reload.
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS telegram_routing_version (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            version INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    cursor.execute("INSERT OR IGNORE INTO telegram_routing_version (id, version) VALUES (1, 0)")
+    for table, event in (('telegram_links', 'INSERT'), ('telegram_links', 'UPDATE'), ('telegram_links', 'DELETE'),
+                         ('users', 'INSERT'), ('users', 'DELETE')):
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {table}_routing_{event.lower()} AFTER {event} ON {table}
+            BEGIN
+                UPDATE telegram_routing_version SET version = version + 1 WHERE id = 1;
+            END
+        """)
+
     # Migration logic
     try:
         cursor.execute("PRAGMA table_info(bookmarks)")
@@ -100,8 +206,89 @@ def init_database(conn=None):
             cursor.execute("ALTER TABLE bookmarks ADD COLUMN is_read INTEGER DEFAULT 0")
         if "user_id" not in columns:
             cursor.execute("ALTER TABLE bookmarks ADD COLUMN user_id INTEGER")
+        if "tags_status" not in columns:
+            cursor.execute("ALTER TABLE bookmarks ADD COLUMN tags_status TEXT DEFAULT 'done'")
+        if "last_seen_at" not in columns:
+            cursor.execute("ALTER TABLE bookmarks ADD COLUMN last_seen_at TIMESTAMP")
+        if "row_version" not in columns:
+            cursor.execute("ALTER TABLE bookmarks ADD COLUMN row_version INTEGER NOT NULL DEFAULT 0")
     except Exception as e:
         logger.warning("Could not perform database migration: %s", e)
 
+    # Bumped on every change of a displayed field, whoever writes (web UI, bot, tag
+    # worker): the web UI's fragment cache is keyed by it. Bookkeeping columns
+    # (tags_status, last_seen_at) do not invalidate the rendering.
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS bookmarks_row_version AFTER UPDATE OF
+            url, title, description, image_url, domain, tags, saved_at,
+            telegram_user_id, telegram_message_id, comments_url, is_read
+        ON bookmarks
+        BEGIN
+            UPDATE bookmarks SET row_version = old.row_version + 1 WHERE id = new.id;
+        END
+    """)
+
+    # Newest-first listing of a user's bookmarks, all or unread only (bot search, /recent, /unread)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_bookmarks_user_id ON bookmarks (user_id, id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_bookmarks_user_unread ON bookmarks (user_id, is_read, id)")
+
+    # Full-text index over title, domain and tags for the bot's search (shared/search.py),
+    # kept in sync with the bookmarks table by triggers
+    fts_exists = cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'bookmarks_fts'").fetchone()
+    cursor.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS bookmarks_fts USING fts5(
+            title, domain, tags,
+            content='bookmarks', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+        )
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS bookmarks_fts_insert AFTER INSERT ON bookmarks
+        BEGIN
+            INSERT INTO bookmarks_fts (rowid, title, domain, tags) VALUES (new.id, new.title, new.domain, new.tags);
+        END
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS bookmarks_fts_delete AFTER DELETE ON bookmarks
+        BEGIN
+            INSERT INTO bookmarks_fts (bookmarks_fts, rowid, title, domain, tags)
+            VALUES ('delete', old.id, old.title, old.domain, old.tags);
+        END
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS bookmarks_fts_update AFTER UPDATE OF title, domain, tags ON bookmarks
+        BEGIN
+            INSERT INTO bookmarks_fts (bookmarks_fts, rowid, title, domain, tags)
+            VALUES ('delete', old.id, old.title, old.domain, old.tags);
+            INSERT INTO bookmarks_fts (rowid, title, domain, tags) VALUES (new.id, new.title, new.domain, new.tags);
+        END
+    """)
+    if not fts_exists:
+        # Existing database: index the bookmarks saved so far
+        cursor.execute("INSERT INTO bookmarks_fts (bookmarks_fts) VALUES ('rebuild')")
+
     conn.commit()
-    return conn
\ No newline at end of file
+    return conn
+
+def connect_autocommit(db_path=None, timeout=30, check_same_thread=True):
+    """
+    Opens a connection in autocommit mode for the job queues.
+
+    Writes are grouped explicitly with `immediate_transaction`, which takes the
+    write lock up front so that concurrent workers never claim the same job.
+    `timeout` is the busy timeout in seconds.
+    """
+    db_path = db_path or get_db_path()
+    return sqlite3.connect(db_path, uri=db_path.startswith('file:'), timeout=timeout, isolation_level=None,
+                           check_same_thread=check_same_thread)
+
+
+@contextmanager
+def immediate_transaction(conn):
+    """Explicit write transaction on an autocommit connection (isolation_level=None)."""
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
@@ -0,0 +1,261 @@
+"""
+Streaming bookmark export, shared by the webserver (/api/export/*) and the
+bot (/export).
+
+Rows are read with fetchmany and written to a file object as they come, so
+memory use stays flat whatever the size of the library. `export_to_file`
+writes a temporary file (optionally gzip-compressed) ready to be sent.
+"""
+import io
+import os
+import csv
+import gzip
+import json
+import tempfile
+import textwrap
+from datetime import datetime
+
+from shared.database import connect_autocommit
+
+EXPORT_BATCH_SIZE = 500
+
+# format -> (content type, file name)
+EXPORT_FORMATS = {
+    'html': ('text/html; charset=utf-8', 'bookmarks.html'),
+    'json': ('application/json; charset=utf-8', 'bookmarks.json'),
+    'csv': ('text/csv; charset=utf-8', 'bookmarks.csv'),
+}
+
+CSV_HEADER = [
+    'id', 'url', 'title', 'description', 'image_url', 'domain', 'saved_at',
+    'telegram_user_id', 'telegram_message_id', 'comments_url', 'tags', 'is_read',
+]
+
+ICON_OPEN = '<svg width="16" height="16" viewBox="0 0 24 24" fill="none" stroke="currentColor" stroke-width="2" stroke-linecap="round" stroke-linejoin="round"><path d="M18 13v6a2 2 0 0 1-2 2H5a2 2 0 0 1-2-2V8a2 2 0 0 1 2-2h6"></path><polyline points="15 3 21 3 21 9"></polyline><line x1="10" y1="14" x2="21" y2="3"></line></svg>'
+ICON_HN = '<svg width="16" height="16" viewBox="0 0 24 24" fill="none" stroke="currentColor" stroke-width="2" stroke-linecap="round" stroke-linejoin="round"><path d="M21 15a2 2 0 0 1-2 2H7l-4 4V5a2 2 0 0 1 2-2h14a2 2 0 0 1 2 2z"></path></svg>'
+
+
+def count_export_rows(cursor, user_id):
+    """Returns the number of bookmarks of a user."""
+    cursor.execute("SELECT COUNT(*) FROM bookmarks WHERE user_id = ?", (user_id,))
+    return cursor.fetchone()[0]
+
+
+def iter_export_rows(cursor, user_id, batch_size=EXPORT_BATCH_SIZE):
+    """Yields the bookmark rows of a user (newest first, CSV_HEADER order), `batch_size` at a time."""
+    cursor.execute(
+        """
+        SELECT id, url, title, description, image_url, domain,
+            datetime(saved_at, 'localtime') as saved_at,
+            telegram_user_id, telegram_message_id, comments_url, tags,
+            COALESCE(is_read, 0) as is_read
+        FROM bookmarks
+        WHERE user_id = ?
+        ORDER BY id DESC
+        """,
+        (user_id,),
+    )
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            return
+        yield from rows
+
+
+def parse_export_tags(tags):
+    """Normalizes tag values from DB rows for export payloads."""
+    if isinstance(tags, str) and tags:
+        try:
+            return json.loads(tags)
+        except json.JSONDecodeError:
+            return [tags]
+    if isinstance(tags, (list, dict)):
+        return tags
+    return []
+
+
+def export_row_to_dict(row):
+    """Converts a bookmark row (see iter_export_rows) to the dictionary used by the exports."""
+    return {
+        'id': row[0],
+        'url': row[1],
+        'title': row[2],
+        'description': row[3],
+        'image_url': row[4],
+        'domain': row[5],
+        'saved_at': row[6],
+        'telegram_user_id': row[7],
+        'telegram_message_id': row[8],
+        'comments_url': row[9],
+        'tags': parse_export_tags(row[10]),
+        'is_read': bool(row[11]),
+    }
+
+
+def render_bookmark_card_export(bookmark, translations):
+    """Renders a single bookmark as an HTML card for export (no action buttons)."""
+    # Handle both tuple and dict formats
+    if isinstance(bookmark, tuple):
+        (id, url, title, description, image_url, domain, saved_at, telegram_user_id, telegram_message_id, comments_url, tags, is_read) = bookmark
+    else:  # dict format
+        id = bookmark['id']
+        url = bookmark['url']
+        title = bookmark['title']
+        description = bookmark['description']
+        image_url = bookmark['image_url']
+        domain = bookmark['domain']
+        saved_at = bookmark['saved_at']
+        telegram_user_id = bookmark['telegram_user_id']
+        telegram_message_id = bookmark['telegram_message_id']
+        comments_url = bookmark['comments_url']
+        tags = bookmark['tags']
+        is_read = bookmark['is_read']
+    
+    def escape_html(text):
+        if text is None: return ""  # noqa: E701
+        return str(text).replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;").replace('"', '&quot;')
+
+    # Handle tags safely - they might be JSON string, empty, or invalid
+    try:
+        if isinstance(tags, str) and tags.strip():
+            parsed_tags = json.loads(tags)
+        elif isinstance(tags, (list, dict)):
+            parsed_tags = tags
+        else:
+            parsed_tags = []
+    except (json.JSONDecodeError, AttributeError):
+        parsed_tags = []
+
+    class_attr = f"bookmark-card {'read' if is_read else ''}".strip()
+
+    return f"""
+    <div id="bookmark-card-{id}" class="{class_attr}" data-id="{id}" data-is-read="{1 if is_read else 0}">
+        <div class="bookmark-main">
+            <div class="bookmark-visuals">
+                <div class="image-placeholder{'' if image_url else ' has-error'}">
+                    {f'<img src="{escape_html(image_url)}" alt="Preview" class="bookmark-image">' if image_url else ''}
+                </div>
+                <div class="bookmark-actions">
+                    <a href="{escape_html(url)}" target="_blank" class="icon-btn" title="{translations.get('tooltip_open_link', 'Open link')}">{ICON_OPEN}</a>                    
+                </div>
+            </div>
+            <div class="bookmark-details">
+                <h3 class="bookmark-title"><a href="{escape_html(url)}" target="_blank">{escape_html(title)}</a></h3>
+            </div>
+        </div>
+        <p class="bookmark-description">{escape_html(description)}</p>
+        <div class="bookmark-tags">
+            {''.join(f'<span class="tag">{escape_html(t)}</span>' for t in parsed_tags)}
+        </div>
+        <div class="bookmark-footer">
+            <div class="bookmark-footer-meta">
+                <span class="bookmark-date">{saved_at.split(' ')[0]}</span>
+                <span class="bookmark-id">ID {id}</span>
+            </div>
+            {f'<a href="{escape_html(comments_url)}" target="_blank" class="hn-link" title="{translations.get("tooltip_hn_comments", "View HN comments")}">{ICON_HN} HN Comments</a>' if comments_url else ''}
+        </div>
+    </div>
+    """
+
+
+def export_html_head(total_count, generated_at):
+    """Opening part of the HTML export document, up to the bookmark cards."""
+    generated_at_text = generated_at.strftime('%Y-%m-%d %H:%M:%S')
+    return f"""<!DOCTYPE html>
+<html lang="en">
+<head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <title>Bookmarks Export</title>
+    <link rel="stylesheet" href="/static/export-page.css">
+</head>
+<body>
+    <div class="container">
+        <h1>📚 Bookmarks Export</h1>
+        <p class="export-info">Exported on {generated_at_text} | Total: {total_count} bookmarks</p>
+        <div class="bookmarks-container">
+            """
+
+
+EXPORT_HTML_TAIL = """
+        </div>
+    </div>
+</body>
+</html>"""
+
+
+def build_export_html_document(html_content, total_count, generated_at):
+    """Builds a complete HTML document for bookmark export."""
+    return f"{export_html_head(total_count, generated_at)}{html_content}{EXPORT_HTML_TAIL}"
+
+
+def _sanitize_csv_field(field):
+    if field is None:
+        return ""
+    # Replace quotes with double quotes and remove newlines to ensure single-line rows.
+    return str(field).replace('"', '""').replace('\n', ' ').replace('\r', ' ')
+
+
+def write_export(cursor, user_id, export_format, out, translations=None, generated_at=None):
+    """
+    Writes the bookmarks of a user to the binary file object `out`.
+
+    Returns the number of exported bookmarks.
+    """
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format: {export_format}")
+    text = io.TextIOWrapper(out, encoding='utf-8', newline='')
+    count = 0
+    try:
+        if export_format == 'csv':
+            writer = csv.writer(text, quoting=csv.QUOTE_ALL)
+            writer.writerow(CSV_HEADER)
+            for row in iter_export_rows(cursor, user_id):
+                writer.writerow([_sanitize_csv_field(field) for field in row])
+                count += 1
+        elif export_format == 'json':
+            for row in iter_export_rows(cursor, user_id):
+                item = textwrap.indent(json.dumps(export_row_to_dict(row), indent=2, ensure_ascii=False), '  ')
+                text.write(f"{',' if count else '['}\n{item}")
+                count += 1
+            text.write("\n]" if count else "[]")
+        else:
+            total_count = count_export_rows(cursor, user_id)
+            text.write(export_html_head(total_count, generated_at or datetime.now()))
+            for row in iter_export_rows(cursor, user_id):
+                text.write(render_bookmark_card_export(export_row_to_dict(row), translations or {}))
+                count += 1
+            if not count:
+                text.write(f"<p>{(translations or {}).get('no_bookmarks_found', 'No bookmarks found.')}</p>")
+            text.write(EXPORT_HTML_TAIL)
+        text.flush()
+    finally:
+        # Leave `out` open for the caller
+        text.detach()
+    return count
+
+
+def export_to_file(db_path, user_id, export_format, compress=False, translations=None, directory=None):
+    """
+    Exports the bookmarks of a user to a temporary file, read through its own
+    connection (db_path None means get_db_path()).
+
+    Returns (path, count); the caller removes the file.
+    """
+    suffix = os.path.splitext(EXPORT_FORMATS[export_format][1])[1] + ('.gz' if compress else '')
+    fd, path = tempfile.mkstemp(prefix='bookmarks-', suffix=suffix, dir=directory)
+    conn = connect_autocommit(db_path)
+    try:
+        with os.fdopen(fd, 'wb') as raw:
+            out = gzip.GzipFile(fileobj=raw, mode='wb') if compress else raw
+            try:
+                count = write_export(conn.cursor(), user_id, export_format, out, translations)
+            finally:
+                if compress:
+                    out.close()
+    except Exception:
+        os.remove(path)
+        raise
+    finally:
+        conn.close()
+    return path, count
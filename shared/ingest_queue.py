@@ -0,0 +1,127 @@
+"""
+Durable queue of Telegram messages waiting to be ingested.
+
+The bot handler only records (chat_id, message_id, urls) and acknowledges the
+message; worker coroutines in the bot scrape, tag and save the links, then
+report the result in the chat's reply summary. Jobs live in SQLite, so links
+received right before a restart are processed once the bot is back.
+"""
+import json
+import time
+import logging
+from collections import namedtuple
+
+from shared.database import immediate_transaction
+
+logger = logging.getLogger(__name__)
+
+MAX_ATTEMPTS = 5
+BASE_RETRY_DELAY_SECONDS = 5
+MAX_RETRY_DELAY_SECONDS = 300
+
+IngestJob = namedtuple('IngestJob', 'id chat_id message_id telegram_user_id urls attempts')
+
+
+def enqueue_ingest_job(cursor, chat_id, message_id, urls, telegram_user_id=None):
+    """
+    Queues the URLs of one message.
+
+    Returns the job id, or None if the message was already queued (Telegram
+    may deliver the same update twice).
+    """
+    cursor.execute(
+        """
+        INSERT OR IGNORE INTO ingest_jobs (chat_id, message_id, telegram_user_id, urls, next_attempt_at)
+        VALUES (?, ?, ?, ?, ?)
+        """,
+        (chat_id, message_id, telegram_user_id, json.dumps(list(urls)), time.time()),
+    )
+    return cursor.lastrowid if cursor.rowcount else None
+
+
+def claim_ingest_job(conn, now=None):
+    """
+    Atomically marks the oldest due job as running and returns it (or None).
+    `conn` must be in autocommit mode (see connect_autocommit).
+    """
+    now = time.time() if now is None else now
+    with immediate_transaction(conn):
+        row = conn.execute(
+            """
+            SELECT id, chat_id, message_id, telegram_user_id, urls, attempts
+            FROM ingest_jobs
+            WHERE status = 'pending' AND next_attempt_at <= ?
+            ORDER BY id
+            LIMIT 1
+            """,
+            (now,),
+        ).fetchone()
+        if row is None:
+            return None
+        conn.execute("UPDATE ingest_jobs SET status = 'running' WHERE id = ?", (row[0],))
+    return IngestJob(*row[:4], json.loads(row[4]), row[5])
+
+
+def complete_ingest_job(conn, job):
+    """Removes a processed job."""
+    with immediate_transaction(conn):
+        conn.execute("DELETE FROM ingest_jobs WHERE id = ?", (job.id,))
+
+
+def fail_ingest_job(conn, job, error):
+    """
+    Reschedules a failed job with exponential backoff.
+
+    Returns the delay in seconds, or None once MAX_ATTEMPTS is reached and the
+    job is parked as 'failed' (kept for inspection).
+    """
+    attempts = job.attempts + 1
+    delay = None
+    if attempts < MAX_ATTEMPTS:
+        delay = min(MAX_RETRY_DELAY_SECONDS, BASE_RETRY_DELAY_SECONDS * 2 ** job.attempts)
+    with immediate_transaction(conn):
+        conn.execute(
+            """
+            UPDATE ingest_jobs
+            SET status = ?, attempts = ?, next_attempt_at = ?, last_error = ?
+            WHERE id = ?
+            """,
+            (
+                'pending' if delay is not None else 'failed',
+                attempts,
+                time.time() + (delay or 0),
+                str(error)[:500],
+                job.id,
+            ),
+        )
+    return delay
+
+
+def recover_ingest_jobs(conn):
+    """Crash recovery, run at startup: jobs left running go back to pending."""
+    with immediate_transaction(conn):
+        reset = conn.execute("UPDATE ingest_jobs SET status = 'pending' WHERE status = 'running'").rowcount
+    if reset:
+        logger.info("Recovered %s interrupted ingest jobs", reset)
+    return reset
+
+
+def ingest_queue_stats(conn):
+    """Returns the number of jobs per status."""
+    return dict(conn.execute("SELECT status, COUNT(*) FROM ingest_jobs GROUP BY status").fetchall())
+
+
+def update_chat_checkpoint(cursor, chat_id, message_id):
+    """Records that the messages of a chat were processed up to `message_id`."""
+    cursor.execute(
+        """
+        INSERT INTO telegram_chat_state (chat_id, last_message_id) VALUES (?, ?)
+        ON CONFLICT(chat_id) DO UPDATE SET last_message_id = MAX(last_message_id, excluded.last_message_id)
+        """,
+        (chat_id, message_id),
+    )
+
+
+def get_chat_checkpoints(cursor):
+    """Returns {chat_id: last processed message id} for the offline catch-up."""
+    return dict(cursor.execute("SELECT chat_id, last_message_id FROM telegram_chat_state").fetchall())
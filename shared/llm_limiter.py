@@ -0,0 +1,299 @@
+"""
+Rate limiting for LLM (Gemini) requests.
+
+Keeps request and token budgets (token buckets configured from GEMINI_RPM and
+GEMINI_TPM), honors Retry-After hints returned with HTTP 429 responses by
+tripping a short-lived "LLM unavailable" state during which no request is sent,
+and counts succeeded, failed, throttled and skipped calls.
+
+The quota belongs to the API key, not to a process: when a budget is
+configured, the buckets and the cooldown live in the llm_budget row of the
+database, so the bot, the web server and the CLIs share them. The counters
+stay per process.
+"""
+import os
+import re
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+
+from shared.database import connect_autocommit, get_db_path, immediate_transaction
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_COOLDOWN_SECONDS = 60
+DEFAULT_MAX_WAIT_SECONDS = 5.0
+
+
+class LLMUnavailableError(Exception):
+    """Raised when an LLM request is skipped because of rate limits or a cooldown."""
+
+
+class TokenBucket:
+    """
+    Classic token bucket refilled continuously at `rate_per_minute`.
+
+    Args:
+        rate_per_minute (float): Refill rate; the bucket capacity defaults to one minute of budget.
+        capacity (float, optional): Maximum burst size.
+        clock (callable, optional): Monotonic clock, injectable for tests.
+    """
+
+    def __init__(self, rate_per_minute, capacity=None, clock=time.monotonic):
+        self.rate_per_second = float(rate_per_minute) / 60.0
+        self.capacity = float(capacity if capacity is not None else rate_per_minute)
+        self._clock = clock
+        self._tokens = self.capacity
+        self._updated_at = clock()
+
+    def _refill(self):
+        now = self._clock()
+        elapsed = max(0.0, now - self._updated_at)
+        self._tokens = min(self.capacity, self._tokens + elapsed * self.rate_per_second)
+        self._updated_at = now
+
+    def time_until_available(self, amount=1):
+        """Seconds to wait before `amount` tokens are available (0 if available now)."""
+        self._refill()
+        # Requests larger than the whole bucket are allowed once the bucket is full.
+        amount = min(float(amount), self.capacity)
+        missing = amount - self._tokens
+        if missing <= 0:
+            return 0.0
+        if self.rate_per_second <= 0:
+            return float('inf')
+        return missing / self.rate_per_second
+
+    def consume(self, amount=1):
+        """Removes `amount` tokens; the balance may go negative to account for overruns."""
+        self._refill()
+        self._tokens -= float(amount)
+
+    def refund(self, amount):
+        """Gives back tokens that were reserved but not used."""
+        self._refill()
+        self._tokens = min(self.capacity, self._tokens + float(amount))
+
+
+class LLMLimiter:
+    """
+    Guards outbound LLM calls.
+
+    Args:
+        rpm (int, optional): Requests per minute; None or 0 disables the request bucket.
+        tpm (int, optional): Tokens per minute; None or 0 disables the token bucket.
+        cooldown_seconds (float): Default "unavailable" period after a 429 without Retry-After.
+        max_wait_seconds (float): How long `acquire` may block waiting for budget.
+        clock (callable, optional): Monotonic clock, injectable for tests.
+        db_path (str, optional): Database whose llm_budget row holds the buckets and
+            the cooldown, shared with the other processes using it. The clock must
+            then be comparable across processes (time.time).
+    """
+
+    def __init__(self, rpm=None, tpm=None, cooldown_seconds=DEFAULT_COOLDOWN_SECONDS,
+                 max_wait_seconds=DEFAULT_MAX_WAIT_SECONDS, clock=time.monotonic, db_path=None):
+        self._clock = clock
+        self._lock = threading.Lock()
+        self.db_path = db_path
+        self._conn = None
+        self._request_bucket = TokenBucket(rpm, clock=clock) if rpm else None
+        self._token_bucket = TokenBucket(tpm, clock=clock) if tpm else None
+        self.cooldown_seconds = cooldown_seconds
+        self.max_wait_seconds = max_wait_seconds
+        self._unavailable_until = 0.0
+        self._counters = {'succeeded': 0, 'failed': 0, 'throttled': 0, 'skipped': 0}
+
+    @contextmanager
+    def _state(self):
+        """
+        Holds the lock while the buckets or the cooldown are read or changed.
+
+        With a database, the llm_budget row is loaded first and stored back in
+        the same BEGIN IMMEDIATE transaction, so two processes never spend the
+        same budget. An exception rolls the row back.
+        """
+        with self._lock:
+            if self.db_path is None:
+                yield
+                return
+            if self._conn is None:
+                self._conn = connect_autocommit(self.db_path, check_same_thread=False)
+            with immediate_transaction(self._conn):
+                row = self._conn.execute(
+                    "SELECT requests, requests_at, tokens, tokens_at, unavailable_until FROM llm_budget WHERE id = 1"
+                ).fetchone()
+                if row is not None:
+                    self._load_row(*row)
+                yield
+                self._conn.execute(
+                    "INSERT INTO llm_budget (id, requests, requests_at, tokens, tokens_at, unavailable_until) "
+                    "VALUES (1, ?, ?, ?, ?, ?) ON CONFLICT(id) DO UPDATE SET "
+                    "requests = excluded.requests, requests_at = excluded.requests_at, "
+                    "tokens = excluded.tokens, tokens_at = excluded.tokens_at, "
+                    "unavailable_until = excluded.unavailable_until",
+                    (*self._bucket_row(self._request_bucket), *self._bucket_row(self._token_bucket),
+                     self._unavailable_until),
+                )
+
+    def _load_row(self, requests, requests_at, tokens, tokens_at, unavailable_until):
+        for bucket, balance, updated_at in ((self._request_bucket, requests, requests_at),
+                                            (self._token_bucket, tokens, tokens_at)):
+            if bucket is not None and balance is not None:
+                bucket._tokens = min(bucket.capacity, balance)
+                bucket._updated_at = updated_at
+        self._unavailable_until = unavailable_until
+
+    @staticmethod
+    def _bucket_row(bucket):
+        return (bucket._tokens, bucket._updated_at) if bucket is not None else (None, None)
+
+    def is_available(self):
+        """False while the limiter is tripped after a 429."""
+        with self._state():
+            return self._clock() >= self._unavailable_until
+
+    def acquire(self, estimated_tokens=0, max_wait=None):
+        """
+        Reserves budget for one request, waiting up to `max_wait` seconds.
+
+        Raises:
+            LLMUnavailableError: if the limiter is tripped or no budget frees up in time.
+        """
+        if max_wait is None:
+            max_wait = self.max_wait_seconds
+        deadline = self._clock() + max_wait
+
+        while True:
+            with self._state():
+                now = self._clock()
+                if now < self._unavailable_until:
+                    self._counters['skipped'] += 1
+                    raise LLMUnavailableError(
+                        f"LLM unavailable for another {self._unavailable_until - now:.1f}s"
+                    )
+
+                wait = 0.0
+                if self._request_bucket is not None:
+                    wait = max(wait, self._request_bucket.time_until_available(1))
+                if self._token_bucket is not None and estimated_tokens:
+                    wait = max(wait, self._token_bucket.time_until_available(estimated_tokens))
+
+                if wait <= 0:
+                    if self._request_bucket is not None:
+                        self._request_bucket.consume(1)
+                    if self._token_bucket is not None and estimated_tokens:
+                        self._token_bucket.consume(estimated_tokens)
+                    return
+
+                if now + wait > deadline:
+                    self._counters['skipped'] += 1
+                    raise LLMUnavailableError(f"LLM rate limit reached (next slot in {wait:.1f}s)")
+
+            time.sleep(min(wait, 0.5))
+
+    def record_success(self, estimated_tokens=0, actual_tokens=None):
+        """Counts a successful call and reconciles the token bucket with the real usage."""
+        with self._state():
+            self._counters['succeeded'] += 1
+            if self._token_bucket is not None and actual_tokens is not None:
+                delta = actual_tokens - estimated_tokens
+                if delta > 0:
+                    self._token_bucket.consume(delta)
+                elif delta < 0:
+                    self._token_bucket.refund(-delta)
+
+    def record_failure(self):
+        """Counts a failed call (network error, bad answer, non-429 HTTP error)."""
+        with self._lock:
+            self._counters['failed'] += 1
+
+    def record_throttled(self, retry_after=None):
+        """Counts a 429 answer and trips the limiter for `retry_after` seconds."""
+        seconds = retry_after if retry_after is not None else self.cooldown_seconds
+        with self._state():
+            self._counters['throttled'] += 1
+            self._unavailable_until = max(self._unavailable_until, self._clock() + seconds)
+        logger.warning("LLM throttled (HTTP 429); skipping LLM calls for %.1fs", seconds)
+
+    def stats(self):
+        """Returns a snapshot of the counters and the current availability."""
+        with self._state():
+            now = self._clock()
+            snapshot = dict(self._counters)
+            snapshot['unavailable_for_seconds'] = round(max(0.0, self._unavailable_until - now), 1)
+        return snapshot
+
+
+def parse_retry_after(value, now=None):
+    """
+    Parses a Retry-After value (delta seconds, HTTP date, or a Google "37s" duration).
+
+    Returns:
+        float | None: Seconds to wait, or None if the value cannot be parsed.
+    """
+    if value is None:
+        return None
+    value = str(value).strip()
+    if not value:
+        return None
+
+    match = re.fullmatch(r"(\d+(?:\.\d+)?)s?", value)
+    if match:
+        return float(match.group(1))
+
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    now = now or datetime.now(timezone.utc)
+    return max(0.0, (retry_at - now).total_seconds())
+
+
+def _env_int(name):
+    raw_value = os.getenv(name, "").strip()
+    if not raw_value:
+        return None
+    try:
+        return max(0, int(raw_value))
+    except ValueError:
+        logger.warning("Invalid %s=%r; ignoring", name, raw_value)
+        return None
+
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+
+def get_llm_limiter():
+    """
+    Returns the process-wide limiter, created on first use from the environment:
+    GEMINI_RPM, GEMINI_TPM and GEMINI_COOLDOWN_SECONDS.
+
+    When GEMINI_RPM or GEMINI_TPM is set, the budget is shared through the
+    database with the other processes (see LLMLimiter, db_path).
+    """
+    global _limiter
+    with _limiter_lock:
+        if _limiter is None:
+            cooldown = _env_int("GEMINI_COOLDOWN_SECONDS")
+            rpm = _env_int("GEMINI_RPM")
+            tpm = _env_int("GEMINI_TPM")
+            shared = bool(rpm or tpm)
+            _limiter = LLMLimiter(
+                rpm=rpm,
+                tpm=tpm,
+                cooldown_seconds=cooldown if cooldown is not None else DEFAULT_COOLDOWN_SECONDS,
+                clock=time.time if shared else time.monotonic,
+                db_path=get_db_path() if shared else None,
+            )
+        return _limiter
+
+
+def get_llm_stats():
+    """Returns the counters of the process-wide limiter."""
+    return get_llm_limiter().stats()
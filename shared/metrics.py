@@ -0,0 +1,207 @@
+"""
+Per-stage timing of the ingestion pipeline.
+
+Each stage (URL extraction, HEAD, GET, parse, tagging, DB write, reply...)
+records its duration in a histogram labelled by domain and outcome, so slow
+domains, the LLM tail latency and lock contention show up in production:
+
+    with get_metrics().time('get', domain) as timer:
+        response = requests.get(url)
+        timer.outcome = str(response.status_code)
+
+The process-wide registry is exposed in the Prometheus text format by
+`MetricsServer` (started by the bot when BOT_METRICS_PORT is set) and can be
+dumped as JSON with `snapshot()`.
+"""
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+METRIC_NAME = 'bookmark_pipeline_stage_seconds'
+# Upper bounds in seconds: from an in-memory lookup to a stuck scrape or LLM call
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+# Domains are user-provided: past this many, new ones are counted as 'other'
+MAX_DOMAINS = 500
+OTHER_DOMAIN = 'other'
+
+
+class _Histogram:
+    __slots__ = ('counts', 'total', 'max')
+
+    def __init__(self, size):
+        self.counts = [0] * size
+        self.total = 0.0
+        self.max = 0.0
+
+
+class StageTimer:
+    """Handle yielded by PipelineMetrics.time(); set `outcome` to label the sample."""
+
+    def __init__(self, outcome):
+        self.outcome = outcome
+
+
+class PipelineMetrics:
+    """
+    Thread-safe histograms keyed by (stage, domain, outcome).
+
+    Args:
+        buckets (tuple): Bucket upper bounds in seconds (+Inf is implicit).
+        max_domains (int): Distinct domains tracked before falling back to 'other'.
+        clock (callable, optional): Monotonic clock, injectable for tests.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS, max_domains=MAX_DOMAINS, clock=time.perf_counter):
+        self.buckets = tuple(sorted(buckets))
+        self.max_domains = max_domains
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._domains = set()
+
+    def observe(self, stage, seconds, domain='', outcome='ok'):
+        """Records one sample of `stage`."""
+        seconds = max(0.0, float(seconds))
+        with self._lock:
+            if domain and domain not in self._domains:
+                if len(self._domains) >= self.max_domains:
+                    domain = OTHER_DOMAIN
+                else:
+                    self._domains.add(domain)
+            key = (stage, domain or '', outcome)
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = _Histogram(len(self.buckets) + 1)
+            index = next((i for i, bound in enumerate(self.buckets) if seconds <= bound), len(self.buckets))
+            histogram.counts[index] += 1
+            histogram.total += seconds
+            histogram.max = max(histogram.max, seconds)
+
+    @contextmanager
+    def time(self, stage, domain='', outcome='ok'):
+        """Times the enclosed block; the outcome is 'error' if it raises."""
+        timer = StageTimer(outcome)
+        started = self._clock()
+        try:
+            yield timer
+        except BaseException:
+            timer.outcome = 'error'
+            raise
+        finally:
+            self.observe(stage, self._clock() - started, domain, timer.outcome)
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._domains.clear()
+
+    def _items(self):
+        with self._lock:
+            return sorted(
+                (key, list(h.counts), h.total, h.max) for key, h in self._histograms.items()
+            )
+
+    def _quantile(self, counts, q):
+        """Upper bound of the bucket holding the q-quantile (None above the last bucket)."""
+        rank = q * sum(counts)
+        seen = 0
+        for bound, count in zip(self.buckets, counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return None
+
+    def snapshot(self):
+        """Returns the histograms as a JSON-serializable list, one entry per label set."""
+        stages = []
+        for (stage, domain, outcome), counts, total, maximum in self._items():
+            count = sum(counts)
+            stages.append({
+                'stage': stage,
+                'domain': domain,
+                'outcome': outcome,
+                'count': count,
+                'sum_seconds': round(total, 6),
+                'max_seconds': round(maximum, 6),
+                'p50_le_seconds': self._quantile(counts, 0.5),
+                'p99_le_seconds': self._quantile(counts, 0.99),
+                'buckets': {str(bound): n for bound, n in zip(self.buckets + ('+Inf',), counts)},
+            })
+        return {'generated_at': time.time(), 'stages': stages}
+
+    def render_prometheus(self):
+        """Returns the histograms in the Prometheus text exposition format."""
+        lines = [
+            f"# HELP {METRIC_NAME} Time spent in each stage of the ingestion pipeline.",
+            f"# TYPE {METRIC_NAME} histogram",
+        ]
+        for (stage, domain, outcome), counts, total, _ in self._items():
+            labels = f'stage="{_escape(stage)}",domain="{_escape(domain)}",outcome="{_escape(outcome)}"'
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += count
+                lines.append(f'{METRIC_NAME}_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f"{METRIC_NAME}_sum{{{labels}}} {total:.6f}")
+            lines.append(f"{METRIC_NAME}_count{{{labels}}} {cumulative}")
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+_metrics = PipelineMetrics()
+
+
+def get_metrics():
+    """Returns the process-wide registry."""
+    return _metrics
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?', 1)[0] not in ('/metrics', '/'):
+            self.send_error(404)
+            return
+        body = self.server.metrics.render_prometheus().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Scrapes every few seconds would flood the bot log
+        pass
+
+
+class MetricsServer(threading.Thread):
+    """
+    Small HTTP endpoint serving GET /metrics on a daemon thread.
+
+    Args:
+        port (int): Listening port (0 picks a free one, see `port` once started).
+        host (str): Listening address; local only by default.
+        metrics (PipelineMetrics, optional): Registry to expose; defaults to get_metrics().
+    """
+
+    def __init__(self, port, host='127.0.0.1', metrics=None):
+        super().__init__(name="metrics-server", daemon=True)
+        self.httpd = ThreadingHTTPServer((host, port), _MetricsHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.metrics = metrics or get_metrics()
+
+    @property
+    def port(self):
+        return self.httpd.server_address[1]
+
+    def run(self):
+        self.httpd.serve_forever()
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
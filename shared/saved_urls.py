@@ -0,0 +1,62 @@
+"""
+Per-user index of saved URLs, used to skip scraping and tagging for links
+that were already bookmarked.
+
+The in-memory index is warmed from the database at startup and answers
+"maybe saved" without a query; a hit is confirmed with one lookup on the
+UNIQUE(user_id, url) index, so bookmarks deleted from the web interface are
+saved again. URLs saved by another process are caught by the insert itself.
+"""
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class SavedUrlIndex:
+    """In-memory set of saved URLs per web user."""
+
+    def __init__(self):
+        self._urls = {}
+        self._lock = threading.Lock()
+
+    def load(self, cursor):
+        """Replaces the index with the URLs stored in the database."""
+        urls = {}
+        for user_id, url in cursor.execute("SELECT user_id, url FROM bookmarks").fetchall():
+            urls.setdefault(user_id, set()).add(url)
+        with self._lock:
+            self._urls = urls
+        logger.info("Saved URL index loaded: %s URLs", sum(len(user_urls) for user_urls in urls.values()))
+
+    def add(self, user_id, url):
+        with self._lock:
+            self._urls.setdefault(user_id, set()).add(url)
+
+    def discard(self, user_id, url):
+        with self._lock:
+            self._urls.get(user_id, set()).discard(url)
+
+    def might_contain(self, user_id, url):
+        """False means the URL is new for this process; True must be confirmed (see find_saved_bookmark)."""
+        with self._lock:
+            return url in self._urls.get(user_id, ())
+
+
+def find_saved_bookmark(cursor, user_id, url):
+    """Returns (id, title, domain) of the user's bookmark for `url`, or None."""
+    cursor.execute("SELECT id, title, domain FROM bookmarks WHERE user_id = ? AND url = ?", (user_id, url))
+    return cursor.fetchone()
+
+
+def touch_bookmark(cursor, bookmark_id, comments_url=None):
+    """
+    Records that an existing bookmark was shared again.
+
+    Bumps last_seen_at and fills in the HN comments URL if it was missing;
+    everything else (tags, is_read, user edits) is left untouched.
+    """
+    cursor.execute(
+        "UPDATE bookmarks SET last_seen_at = CURRENT_TIMESTAMP, comments_url = COALESCE(comments_url, ?) WHERE id = ?",
+        (comments_url, bookmark_id),
+    )
@@ -0,0 +1,121 @@
+"""
+Indexed bookmark search for the Telegram bot.
+
+Queries go through the FTS5 index `bookmarks_fts` (title, domain and tags,
+see init_database) and return the newest matches first. Pages are keyset
+based: the next page starts below the last id of the previous one, so every
+page is a single indexed query whatever its depth.
+"""
+import re
+import json
+import time
+import logging
+import threading
+from collections import OrderedDict, namedtuple
+
+logger = logging.getLogger(__name__)
+
+SearchResult = namedtuple('SearchResult', 'id url title domain tags is_read')
+
+_SEARCH_COLUMNS = "b.id, b.url, b.title, b.domain, b.tags, b.is_read"
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def build_match_query(query):
+    """
+    Turns free text into an FTS5 query: every word must match, as a prefix
+    (results update while the user is typing). Returns None for no words.
+    """
+    tokens = _TOKEN_RE.findall(query.lower())
+    if not tokens:
+        return None
+    return " ".join(f'"{token}"*' for token in tokens)
+
+
+def _result(row):
+    try:
+        tags = json.loads(row[4]) if row[4] else []
+    except (TypeError, ValueError):
+        tags = []
+    return SearchResult(row[0], row[1], row[2] or row[1], row[3] or '', tags, bool(row[5]))
+
+
+def search_bookmarks(cursor, user_id, query, limit=10, before_id=None, after_id=None, unread_only=False):
+    """
+    Returns up to `limit` SearchResults of a user, newest first.
+
+    An empty query lists the latest bookmarks. Pass the id of the last result
+    as `before_id` to get the next (older) page, or the id of the first result
+    as `after_id` to get the previous (newer) one.
+    """
+    match = build_match_query(query or '')
+    if match is None:
+        key = "b.id"
+        sql = f"SELECT {_SEARCH_COLUMNS} FROM bookmarks b WHERE b.user_id = ?"
+        params = [user_id]
+    else:
+        # CROSS JOIN keeps the full-text index as the outer loop; the cursor and
+        # the order apply to its rowid, so a page stops after `limit` matches.
+        key = "f.rowid"
+        sql = f"""
+            SELECT {_SEARCH_COLUMNS} FROM bookmarks_fts f CROSS JOIN bookmarks b ON b.id = f.rowid
+            WHERE bookmarks_fts MATCH ? AND b.user_id = ?
+        """
+        params = [match, user_id]
+    if unread_only:
+        sql += " AND b.is_read = 0"
+    if after_id is not None:
+        # Walk up from the cursor, then restore the newest-first order
+        sql += f" AND {key} > ? ORDER BY {key} ASC LIMIT ?"
+        params += [after_id, limit]
+        return [_result(row) for row in reversed(cursor.execute(sql, params).fetchall())]
+    if before_id is not None:
+        sql += f" AND {key} < ?"
+        params.append(before_id)
+    sql += f" ORDER BY {key} DESC LIMIT ?"
+    params.append(limit)
+    return [_result(row) for row in cursor.execute(sql, params).fetchall()]
+
+
+def mark_bookmark_read(cursor, user_id, bookmark_id):
+    """Marks a bookmark of the user as read. Returns True if it was unread."""
+    cursor.execute("UPDATE bookmarks SET is_read = 1 WHERE id = ? AND user_id = ? AND is_read = 0", (bookmark_id, user_id))
+    return cursor.rowcount > 0
+
+
+class SearchCache:
+    """
+    Small LRU cache of search pages with a time-to-live.
+
+    Telegram sends a new inline query on every keystroke and repeats it when
+    the user goes back, so recent pages are kept for `ttl` seconds.
+    """
+
+    def __init__(self, ttl=30.0, max_entries=256):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, results = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return results
+
+    def put(self, key, results):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, results)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
@@ -0,0 +1,298 @@
+"""
+Durable queue for asynchronous bookmark tagging.
+
+Bookmarks are saved right away with provisional local tags and
+tags_status='pending'; a row in `tag_jobs` asks a background worker to fetch
+the LLM tags later. The queue lives in SQLite, so it survives restarts, and
+can be drained from the command line:
+
+  python -m shared.tag_queue drain [--origin bot|web] [--limit N] [--recover]
+  python -m shared.tag_queue stats
+"""
+import os
+import sys
+import json
+import time
+import sqlite3
+import logging
+import argparse
+import threading
+from collections import namedtuple
+
+# Add the project root to the path when run as a script
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+if os.path.dirname(SCRIPT_DIR) not in sys.path:
+    sys.path.append(os.path.dirname(SCRIPT_DIR))
+
+from shared.database import connect_autocommit, immediate_transaction, init_database
+from shared.llm_limiter import LLMUnavailableError, get_llm_limiter
+from shared.metrics import get_metrics
+from shared.utils import generate_tags, get_tag_suggester, merge_tags, request_llm_tags, suggest_tags
+
+logger = logging.getLogger(__name__)
+
+MAX_ATTEMPTS = 5
+BASE_RETRY_DELAY_SECONDS = 5
+MAX_RETRY_DELAY_SECONDS = 300
+TAGS_PER_BOOKMARK = 3
+
+TagJob = namedtuple(
+    'TagJob',
+    'id bookmark_id origin attempts chat_id reply_message_id user_id url title description domain tags',
+)
+
+
+def enqueue_tag_job(cursor, bookmark_id, origin='web', chat_id=None, reply_message_id=None):
+    """Queues a bookmark for LLM tagging (no-op if a job already exists for it)."""
+    cursor.execute(
+        """
+        INSERT OR IGNORE INTO tag_jobs (bookmark_id, origin, chat_id, reply_message_id, next_attempt_at)
+        VALUES (?, ?, ?, ?, ?)
+        """,
+        (bookmark_id, origin, chat_id, reply_message_id, time.time()),
+    )
+
+
+def claim_tag_jobs(conn, origin=None, limit=10, now=None):
+    """
+    Atomically marks up to `limit` due jobs as running and returns them.
+    `conn` must be in autocommit mode (see connect_autocommit).
+
+    Jobs whose bookmark no longer waits for tags (edited or tagged meanwhile)
+    are discarded. `origin=None` claims jobs of every origin.
+    """
+    now = time.time() if now is None else now
+    origin_clause = "AND j.origin = ?" if origin else ""
+    params = [now] + ([origin] if origin else []) + [limit]
+
+    with immediate_transaction(conn):
+        rows = conn.execute(
+            f"""
+            SELECT j.id, j.bookmark_id, j.origin, j.attempts, j.chat_id, j.reply_message_id,
+                   b.user_id, b.url, b.title, b.description, b.domain, b.tags, b.tags_status
+            FROM tag_jobs j LEFT JOIN bookmarks b ON b.id = j.bookmark_id
+            WHERE j.status = 'pending' AND j.next_attempt_at <= ? {origin_clause}
+            ORDER BY j.id
+            LIMIT ?
+            """,
+            params,
+        ).fetchall()
+        stale = [(row[0],) for row in rows if row[-1] != 'pending']
+        rows = [row[:-1] for row in rows if row[-1] == 'pending']
+        conn.executemany("DELETE FROM tag_jobs WHERE id = ?", stale)
+        conn.executemany("UPDATE tag_jobs SET status = 'running' WHERE id = ?", [(row[0],) for row in rows])
+    return [TagJob(*row) for row in rows]
+
+
+def complete_tag_job(conn, job, tags):
+    """Stores the final tags (unless the bookmark was edited meanwhile) and removes the job."""
+    with immediate_transaction(conn):
+        cursor = conn.execute(
+            "UPDATE bookmarks SET tags = ?, tags_status = 'done' WHERE id = ? AND tags_status = 'pending'",
+            (json.dumps(tags, ensure_ascii=False), job.bookmark_id),
+        )
+        conn.execute("DELETE FROM tag_jobs WHERE id = ?", (job.id,))
+    return cursor.rowcount > 0
+
+
+def retry_tag_job(conn, job, error, delay, count_attempt=True):
+    """Puts a job back in the queue, due after `delay` seconds."""
+    with immediate_transaction(conn):
+        conn.execute(
+            """
+            UPDATE tag_jobs
+            SET status = 'pending', attempts = attempts + ?, next_attempt_at = ?, last_error = ?
+            WHERE id = ?
+            """,
+            (1 if count_attempt else 0, time.time() + delay, str(error)[:500], job.id),
+        )
+
+
+def recover_tag_jobs(conn, origin=None):
+    """
+    Crash recovery, run at startup: jobs left running go back to pending and
+    pending bookmarks without a job (crash between save and enqueue) get one.
+    Returns the number of recovered jobs.
+    """
+    origin_clause = "AND origin = ?" if origin else ""
+    with immediate_transaction(conn):
+        reset = conn.execute(
+            f"UPDATE tag_jobs SET status = 'pending' WHERE status = 'running' {origin_clause}",
+            [origin] if origin else [],
+        ).rowcount
+        orphaned = conn.execute(
+            """
+            INSERT OR IGNORE INTO tag_jobs (bookmark_id, origin, next_attempt_at)
+            SELECT id, ?, ? FROM bookmarks
+            WHERE tags_status = 'pending' AND id NOT IN (SELECT bookmark_id FROM tag_jobs)
+            """,
+            (origin or 'web', time.time()),
+        ).rowcount
+    if reset or orphaned:
+        logger.info("Recovered tag jobs: %s interrupted, %s orphaned", reset, orphaned)
+    return reset + orphaned
+
+
+def tag_queue_stats(conn):
+    """Returns the number of jobs per status."""
+    return dict(conn.execute("SELECT status, COUNT(*) FROM tag_jobs GROUP BY status").fetchall())
+
+
+def process_tag_job(conn, job):
+    """
+    Fetches LLM tags for one claimed job and settles it. When similar bookmarks
+    confidently suggest a full set of tags the LLM is not called; fewer confident
+    suggestions are kept and completed with the LLM tags.
+
+    Returns the final tags, or None if the job was rescheduled. While the LLM is
+    throttled the job waits without consuming an attempt; after MAX_ATTEMPTS
+    failures the provisional local tags are kept. The 'tag' stage is timed per
+    domain, with the source of the tags as outcome.
+    """
+    try:
+        with get_metrics().time('tag', job.domain or '', outcome='neighbours') as timer:
+            # A full set of confident suggestions from similar bookmarks makes the LLM call unnecessary.
+            suggested = suggest_tags(job.title or '', job.domain or '', n=TAGS_PER_BOOKMARK)
+            tags = suggested if len(suggested) >= TAGS_PER_BOOKMARK else None
+            if tags is None:
+                timer.outcome = 'llm'
+                tags = request_llm_tags(job.title or '', job.description or '', job.domain or '', n=TAGS_PER_BOOKMARK)
+            if tags is None:
+                # Gemini is not configured: the local tags are final.
+                timer.outcome = 'local'
+                tags = generate_tags(
+                    f"{job.title or ''}\n{job.description or ''}".strip(), n=TAGS_PER_BOOKMARK, user_id=job.user_id
+                )
+            tags = merge_tags(suggested, tags, n=TAGS_PER_BOOKMARK)
+    except LLMUnavailableError as e:
+        delay = max(get_llm_limiter().stats()['unavailable_for_seconds'], BASE_RETRY_DELAY_SECONDS)
+        retry_tag_job(conn, job, e, delay, count_attempt=False)
+        return None
+    except Exception as e:
+        if job.attempts + 1 < MAX_ATTEMPTS:
+            delay = min(MAX_RETRY_DELAY_SECONDS, BASE_RETRY_DELAY_SECONDS * 2 ** job.attempts)
+            logger.warning("Tag job %s failed (attempt %s), retrying in %ss: %s", job.id, job.attempts + 1, delay, e)
+            retry_tag_job(conn, job, e, delay)
+            return None
+        logger.error("Tag job %s failed %s times, keeping local tags: %s", job.id, MAX_ATTEMPTS, e)
+        tags = json.loads(job.tags) if job.tags else []
+
+    if complete_tag_job(conn, job, tags):
+        get_tag_suggester().add(job.bookmark_id, job.title, job.domain, tags)
+    return tags
+
+
+class TagWorker(threading.Thread):
+    """
+    Background thread that drains the tag queue.
+
+    Args:
+        origin (str, optional): Only process jobs enqueued by this origin ('bot' or 'web').
+        on_tagged (callable, optional): Called as on_tagged(job, tags) after a job completes.
+        db_path (str, optional): Database path; defaults to get_db_path().
+        poll_interval (float): Seconds between polls when idle; `wake()` skips the wait.
+    """
+
+    def __init__(self, origin=None, on_tagged=None, db_path=None, poll_interval=2.0, batch_size=5):
+        super().__init__(name=f"tag-worker-{origin or 'all'}", daemon=True)
+        self.origin = origin
+        self.on_tagged = on_tagged
+        self.db_path = db_path
+        self.poll_interval = poll_interval
+        self.batch_size = batch_size
+        self._stop_event = threading.Event()
+        self._wake_event = threading.Event()
+
+    def wake(self):
+        """Asks the worker to poll immediately (e.g. right after an enqueue)."""
+        self._wake_event.set()
+
+    def stop(self, timeout=5):
+        """Stops the worker after the job in progress."""
+        self._stop_event.set()
+        self._wake_event.set()
+        if self.is_alive():
+            self.join(timeout)
+
+    def run_once(self, conn):
+        """Claims and processes one batch. Returns the number of claimed jobs."""
+        jobs = claim_tag_jobs(conn, origin=self.origin, limit=self.batch_size)
+        for job in jobs:
+            tags = process_tag_job(conn, job)
+            if tags is not None and self.on_tagged is not None:
+                try:
+                    self.on_tagged(job, tags)
+                except Exception as e:
+                    logger.error("on_tagged callback failed for job %s: %s", job.id, e)
+        return len(jobs)
+
+    def run(self):
+        conn = connect_autocommit(self.db_path)
+        try:
+            recover_tag_jobs(conn, origin=self.origin)
+            while not self._stop_event.is_set():
+                try:
+                    claimed = self.run_once(conn)
+                except sqlite3.Error as e:
+                    logger.error("Tag worker database error: %s", e)
+                    claimed = 0
+                if not claimed:
+                    self._wake_event.wait(self.poll_interval)
+                    self._wake_event.clear()
+        finally:
+            conn.close()
+
+
+def drain(db_path=None, origin=None, limit=0, recover=False):
+    """
+    Processes due jobs until the queue is empty (or `limit` jobs were handled).
+    Returns a dict with the number of tagged and rescheduled jobs.
+
+    Running jobs belong to the bot and web workers: they are reset only with
+    `recover`, when no worker is running (workers recover at startup).
+    """
+    conn = connect_autocommit(db_path)
+    counts = {'tagged': 0, 'rescheduled': 0}
+    try:
+        if recover:
+            recover_tag_jobs(conn, origin=origin)
+        while not limit or counts['tagged'] + counts['rescheduled'] < limit:
+            jobs = claim_tag_jobs(conn, origin=origin, limit=1)
+            if not jobs:
+                break
+            tags = process_tag_job(conn, jobs[0])
+            counts['tagged' if tags is not None else 'rescheduled'] += 1
+            if tags is not None:
+                logger.info("Tagged bookmark %s: %s", jobs[0].bookmark_id, tags)
+    finally:
+        conn.close()
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect or drain the bookmark tagging queue")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    drain_parser = subparsers.add_parser('drain', help='Process all due tag jobs now')
+    drain_parser.add_argument('--origin', choices=['bot', 'web'], help='Only jobs enqueued by this origin')
+    drain_parser.add_argument('--limit', type=int, default=0, help='Maximum number of jobs (0 = all)')
+    drain_parser.add_argument('--recover', action='store_true',
+                              help='First reset jobs left running by a crash (only when the bot and web server are stopped)')
+    subparsers.add_parser('stats', help='Show the number of jobs per status')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    init_database().close()
+
+    if args.command == 'drain':
+        counts = drain(origin=args.origin, limit=args.limit, recover=args.recover)
+        print(f"Tagged {counts['tagged']} bookmarks, rescheduled {counts['rescheduled']} jobs.")
+    else:
+        conn = connect_autocommit()
+        try:
+            print(json.dumps(tag_queue_stats(conn)))
+        finally:
+            conn.close()
+
+
+if __name__ == '__main__':
+    main()
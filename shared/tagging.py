@@ -0,0 +1,174 @@
+"""
+Corpus-aware local tag engine.
+
+Ranks candidate tags by TF-IDF against document-frequency statistics collected
+incrementally over each user's saved bookmarks, so that a term is distinctive
+with respect to that user's own library. The statistics live in two compact
+tables (tag_term_stats, tag_corpus_stats), keyed by user, and are mirrored in
+memory, so scoring a new bookmark never touches the database.
+"""
+import math
+import re
+import logging
+import threading
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+# Precompiled once; the tokenizer runs on every save.
+TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+# Small bilingual stopword list (English + Italian common words)
+STOPWORDS = frozenset({
+    'the', 'and', 'for', 'with', 'that', 'this', 'from', 'are', 'was', 'will', 'have', 'has', 'not', 'but', 'you', 'your',
+    'per', 'una', 'un', 'il', 'la', 'le', 'di', 'e', 'che', 'da', 'in', 'su', 'con', 'del', 'della',
+})
+
+# Below this many documents the IDF values are too noisy to be useful.
+MIN_CORPUS_DOCS = 20
+
+
+def tokenize(text):
+    """Lowercased word tokens longer than 2 chars, without stopwords and numbers."""
+    if not text:
+        return []
+    return [
+        token for token in (t.lower() for t in TOKEN_RE.findall(text) if len(t) > 2)
+        if token not in STOPWORDS and not token.isdigit()
+    ]
+
+
+class TagEngine:
+    """
+    TF-IDF tag scorer with incremental document-frequency statistics per user.
+    """
+
+    def __init__(self):
+        self._df = {}  # user_id -> {term: document frequency}
+        self._doc_counts = {}  # user_id -> number of documents
+        self._lock = threading.Lock()
+
+    def doc_count(self, user_id):
+        """Number of documents of `user_id` observed so far."""
+        return self._doc_counts.get(user_id, 0)
+
+    def is_ready(self, user_id):
+        """True once the corpus of `user_id` is large enough for TF-IDF ranking."""
+        return self.doc_count(user_id) >= MIN_CORPUS_DOCS
+
+    def load(self, cursor):
+        """Replaces the in-memory statistics with the ones stored in the database."""
+        df = {}
+        cursor.execute("SELECT user_id, term, df FROM tag_term_stats")
+        for user_id, term, count in cursor.fetchall():
+            df.setdefault(user_id, {})[term] = count
+        cursor.execute("SELECT user_id, doc_count FROM tag_corpus_stats")
+        doc_counts = dict(cursor.fetchall())
+        with self._lock:
+            self._df = df
+            self._doc_counts = doc_counts
+        logger.info("Tag engine loaded: %s users, %s documents", len(doc_counts), sum(doc_counts.values()))
+
+    def observe(self, user_id, text):
+        """Adds one document of `user_id` to the in-memory statistics only."""
+        self.apply(user_id, set(tokenize(text)))
+
+    def persist(self, user_id, text, cursor):
+        """
+        Stores the increments of one document of `user_id` in the caller's
+        transaction (one upsert per distinct term) and returns its terms.
+
+        The in-memory statistics are left alone: pass the terms to apply()
+        once the transaction is committed, so that a rollback cannot leave
+        them ahead of the tables.
+        """
+        terms = set(tokenize(text))
+        if terms:
+            cursor.executemany(
+                "INSERT INTO tag_term_stats (user_id, term, df) VALUES (?, ?, 1) "
+                "ON CONFLICT(user_id, term) DO UPDATE SET df = df + 1",
+                [(user_id, term) for term in terms],
+            )
+        cursor.execute(
+            "INSERT INTO tag_corpus_stats (user_id, doc_count) VALUES (?, 1) "
+            "ON CONFLICT(user_id) DO UPDATE SET doc_count = doc_count + 1",
+            (user_id,),
+        )
+        return terms
+
+    def apply(self, user_id, terms):
+        """Adds a committed document (the terms returned by persist) to the in-memory statistics."""
+        with self._lock:
+            self._doc_counts[user_id] = self._doc_counts.get(user_id, 0) + 1
+            df = self._df.setdefault(user_id, {})
+            for term in terms:
+                df[term] = df.get(term, 0) + 1
+
+    def _rank(self, tokens, df, doc_count, n):
+        counts = Counter(tokens)
+        first_seen = {}
+        for position, token in enumerate(tokens):
+            first_seen.setdefault(token, position)
+
+        def tfidf(term):
+            idf = math.log((1 + doc_count) / (1 + df.get(term, 0))) + 1.0
+            return counts[term] * idf
+
+        ranked = sorted(counts, key=lambda term: (-tfidf(term), first_seen[term]))
+        return ranked[:n]
+
+    def score(self, user_id, text, n=3):
+        """Returns the top `n` terms of `text` by TF-IDF over the corpus of `user_id`."""
+        tokens = tokenize(text)
+        if not tokens:
+            return []
+        with self._lock:
+            return self._rank(tokens, self._df.get(user_id, {}), self.doc_count(user_id), n)
+
+    def score_batch(self, user_id, texts, n=3):
+        """Scores many texts of `user_id` against a single snapshot of the statistics (for backfills)."""
+        with self._lock:
+            df = dict(self._df.get(user_id, {}))
+            doc_count = self.doc_count(user_id)
+        results = []
+        for text in texts:
+            tokens = tokenize(text)
+            results.append(self._rank(tokens, df, doc_count, n) if tokens else [])
+        return results
+
+
+def rebuild_term_stats(cursor, engine=None):
+    """
+    Recomputes the statistics of every user from their bookmarks (title + description).
+
+    Used by backfills and to repair drift (deleted bookmarks are not
+    subtracted incrementally). Returns the number of documents counted.
+    """
+    engine = engine or get_tag_engine()
+    df = {}
+    doc_counts = Counter()
+    for user_id, title, description in cursor.execute(
+        "SELECT user_id, title, description FROM bookmarks"
+    ).fetchall():
+        doc_counts[user_id] += 1
+        df.setdefault(user_id, Counter()).update(set(tokenize(f"{title or ''}\n{description or ''}")))
+
+    cursor.execute("DELETE FROM tag_term_stats")
+    cursor.executemany(
+        "INSERT INTO tag_term_stats (user_id, term, df) VALUES (?, ?, ?)",
+        [(user_id, term, count) for user_id, terms in df.items() for term, count in terms.items()],
+    )
+    cursor.execute("DELETE FROM tag_corpus_stats")
+    cursor.executemany("INSERT INTO tag_corpus_stats (user_id, doc_count) VALUES (?, ?)", doc_counts.items())
+    with engine._lock:
+        engine._df = {user_id: dict(terms) for user_id, terms in df.items()}
+        engine._doc_counts = dict(doc_counts)
+    return sum(doc_counts.values())
+
+
+_engine = TagEngine()
+
+
+def get_tag_engine():
+    """Returns the process-wide tag engine (empty until `load` is called)."""
+    return _engine
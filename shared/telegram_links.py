@@ -0,0 +1,97 @@
+"""
+Routing of Telegram senders to web accounts.
+
+Each Telegram user can be linked to one web user (table telegram_links). The
+bot resolves senders through an in-memory cache: `PRAGMA data_version` tells
+whether anything was committed since the last lookup and, only then, the
+routing version maintained by triggers tells whether the cache is stale.
+"""
+import sqlite3
+import logging
+import threading
+
+from shared.database import get_db_path
+
+logger = logging.getLogger(__name__)
+
+
+def link_telegram_user(cursor, telegram_user_id, user_id):
+    """Routes the bookmarks of a Telegram user to a web user (replacing any previous link)."""
+    cursor.execute(
+        """
+        INSERT INTO telegram_links (telegram_user_id, user_id) VALUES (?, ?)
+        ON CONFLICT(telegram_user_id) DO UPDATE SET user_id = excluded.user_id, linked_at = CURRENT_TIMESTAMP
+        """,
+        (telegram_user_id, user_id),
+    )
+
+
+def unlink_telegram_user(cursor, telegram_user_id):
+    """Removes the link of a Telegram user. Returns True if a link existed."""
+    cursor.execute("DELETE FROM telegram_links WHERE telegram_user_id = ?", (telegram_user_id,))
+    return cursor.rowcount > 0
+
+
+class TelegramUserRouter:
+    """
+    Cached telegram_user_id -> web user_id lookup.
+
+    While no link is configured, every sender is routed to the first web user,
+    which keeps single-user deployments working without setup.
+
+    Args:
+        db_path (str, optional): Database path; defaults to get_db_path().
+    """
+
+    def __init__(self, db_path=None):
+        self.db_path = db_path
+        self._conn = None
+        self._lock = threading.Lock()
+        self._data_version = None
+        self._routing_version = None
+        self._links = {}
+        self._default_user_id = None
+
+    def _connection(self):
+        if self._conn is None:
+            db_path = self.db_path or get_db_path()
+            # Lookups also come from the ingest worker threads (serialized by _lock).
+            self._conn = sqlite3.connect(db_path, uri=db_path.startswith('file:'), check_same_thread=False)
+        return self._conn
+
+    def _refresh(self):
+        conn = self._connection()
+        data_version = conn.execute("PRAGMA data_version").fetchone()[0]
+        if data_version == self._data_version:
+            return
+        self._data_version = data_version
+
+        row = conn.execute("SELECT version FROM telegram_routing_version WHERE id = 1").fetchone()
+        routing_version = row[0] if row else 0
+        if routing_version == self._routing_version:
+            return
+
+        self._links = dict(conn.execute("SELECT telegram_user_id, user_id FROM telegram_links").fetchall())
+        row = conn.execute("SELECT id FROM users ORDER BY id LIMIT 1").fetchone()
+        self._default_user_id = row[0] if row else None
+        self._routing_version = routing_version
+        logger.info("Telegram routing loaded: %s links, default user %s", len(self._links), self._default_user_id)
+
+    def load(self):
+        """Warms the cache (called at startup)."""
+        with self._lock:
+            self._refresh()
+
+    def resolve(self, telegram_user_id):
+        """Returns the web user id for a Telegram sender, or None if the sender is not linked."""
+        with self._lock:
+            self._refresh()
+            if self._links:
+                return self._links.get(telegram_user_id)
+            return self._default_user_id
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
@@ -6,11 +6,15 @@ import requests
 from bs4 import BeautifulSoup
 from urllib.parse import urlparse
 import logging
-import re
 import json
 import time
+import threading
 from collections import Counter
 
+from shared.llm_limiter import LLMUnavailableError, get_llm_limiter, parse_retry_after
+from shared.metrics import get_metrics
+from shared.tagging import get_tag_engine, tokenize
+
 logger = logging.getLogger(__name__)
 
 def extract_domain(url):
@@ -44,7 +48,12 @@ def extract_domain(url):
         return ''
 
 def get_article_metadata(url):
-    """Extracts metadata (title, description, image) from a URL."""
+    """
+    Extracts metadata (title, description, image) from a URL.
+
+    The HEAD, GET and parse stages are timed per domain (see shared/metrics.py).
+    """
+    metrics = get_metrics()
     try:
         # Adds 'https://' if a protocol is missing to avoid errors.
         if not url.startswith(('http://', 'https://')):
@@ -55,52 +64,58 @@ def get_article_metadata(url):
             "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
         }
 
+        domain = extract_domain(url)
         # Skip HEAD request for Hacker News links, as they return 405 (Method Not Allowed)
         if "news.ycombinator.com" not in url:
             # Perform a HEAD request to check the content type for other sites
-            try:
-                head_response = requests.head(url, headers=headers, timeout=10, allow_redirects=True)
-                head_response.raise_for_status()
-                
-                content_type = head_response.headers.get("Content-Type", "")
-                if "text/html" not in content_type:
-                    logger.info(f"URL {url} is not an HTML page (Content-Type: {content_type}).")
-                    return {
-                        "title": f"Link to file ({content_type})",
-                        "description": f"The URL points to a file of type {content_type}.",
-                        "image_url": "",
-                        "domain": extract_domain(url),
-                    }
-            except requests.exceptions.RequestException as e:
-                logger.warning(f"HEAD request failed for {url}: {e}. Proceeding with GET.")
-
-        response = requests.get(url, headers=headers, timeout=10, allow_redirects=True)
-        response.raise_for_status()
-
-        soup = BeautifulSoup(response.content, "html.parser")
-
-        # Extract title
-        title = (soup.select_one('meta[property="og:title"]') or \
-                 soup.select_one('meta[name="twitter:title"]') or \
-                 soup.select_one("title"))
-        title = title.get("content") if title and title.has_attr('content') else (title.get_text() if title else None)
-
-        # Extract description
-        description = (soup.select_one('meta[property="og:description"]') or \
-                       soup.select_one('meta[name="twitter:description"]') or \
-                       soup.select_one('meta[name="description"]'))
-        description = description.get("content") if description else None
-
-        # Extract image
-        image_url = (soup.select_one('meta[property="og:image"]') or \
-                     soup.select_one('meta[name="twitter:image"]'))
-        image_url = image_url.get("content") if image_url else None
+            with metrics.time('head', domain) as timer:
+                try:
+                    head_response = requests.head(url, headers=headers, timeout=10, allow_redirects=True)
+                    head_response.raise_for_status()
+
+                    content_type = head_response.headers.get("Content-Type", "")
+                    if "text/html" not in content_type:
+                        timer.outcome = 'not_html'
+                        logger.info(f"URL {url} is not an HTML page (Content-Type: {content_type}).")
+                        return {
+                            "title": f"Link to file ({content_type})",
+                            "description": f"The URL points to a file of type {content_type}.",
+                            "image_url": "",
+                            "domain": domain,
+                        }
+                except requests.exceptions.RequestException as e:
+                    timer.outcome = 'error'
+                    logger.warning(f"HEAD request failed for {url}: {e}. Proceeding with GET.")
+
+        with metrics.time('get', domain):
+            response = requests.get(url, headers=headers, timeout=10, allow_redirects=True)
+            response.raise_for_status()
+
+        with metrics.time('parse', domain):
+            soup = BeautifulSoup(response.content, "html.parser")
+
+            # Extract title
+            title = (soup.select_one('meta[property="og:title"]') or \
+                     soup.select_one('meta[name="twitter:title"]') or \
+                     soup.select_one("title"))
+            title = title.get("content") if title and title.has_attr('content') else (title.get_text() if title else None)
+
+            # Extract description
+            description = (soup.select_one('meta[property="og:description"]') or \
+                           soup.select_one('meta[name="twitter:description"]') or \
+                           soup.select_one('meta[name="description"]'))
+            description = description.get("content") if description else None
+
+            # Extract image
+            image_url = (soup.select_one('meta[property="og:image"]') or \
+                         soup.select_one('meta[name="twitter:image"]'))
+            image_url = image_url.get("content") if image_url else None
 
         return {
             "title": title.strip() if title else "Title not found",
             "description": description.strip() if description else "",
             "image_url": image_url or "",
-            "domain": extract_domain(url),
+            "domain": domain,
         }
 
     except Exception as e:
@@ -181,21 +196,24 @@ def _sanitize_gemini_error_payload(error):
     return safe_payload or None
 
 
-def generate_tags_llm(title, description, domain='', n=3):
-    """Generate tags with Gemini when configured, otherwise fall back locally."""
-    text = f"{title or ''}\n{description or ''}".strip()
+def _gemini_settings():
+    """Return the Gemini configuration from the environment, or None when disabled."""
     gemini_enabled = os.getenv("GEMINI_ENABLED", "").strip().lower() in {"1", "true", "yes", "on"}
     gemini_api_key = os.getenv("GEMINI_API_KEY", "").strip()
-    gemini_model = os.getenv("GEMINI_MODEL", "gemini-2.5-flash").strip()
-    content_preview = (title or description or domain or '').strip()[:80]
-
     if not gemini_enabled or not gemini_api_key:
-        logger.info(
-            "Gemini tags disabled or not configured; using local fallback for domain=%s preview=%r",
-            domain or '-',
-            content_preview,
-        )
-        return generate_tags(text, n=n)
+        return None
+    return {
+        "api_key": gemini_api_key,
+        "model": os.getenv("GEMINI_MODEL", "gemini-2.5-flash").strip(),
+        # Overridable for local stand-ins (see scripts/bench_bot_pipeline.py)
+        "api_base": os.getenv("GEMINI_API_BASE", "https://generativelanguage.googleapis.com").strip().rstrip('/'),
+    }
+
+
+def _fetch_gemini_tags(settings, title, description, domain='', n=3):
+    """Request tags from Gemini. Raises on any failure or empty answer."""
+    gemini_model = settings["model"]
+    content_preview = (title or description or domain or '').strip()[:80]
 
     prompt = (
         "Generate exactly 3 concise lowercase tags for this bookmark. "
@@ -206,7 +224,7 @@ def generate_tags_llm(title, description, domain='', n=3):
     )
 
     url = (
-        f"https://generativelanguage.googleapis.com/v1beta/models/"
+        f"{settings.get('api_base', 'https://generativelanguage.googleapis.com')}/v1beta/models/"
         f"{gemini_model}:generateContent"
     )
     payload = {
@@ -225,15 +243,21 @@ def generate_tags_llm(title, description, domain='', n=3):
         },
     }
 
+    # Shared with the other callers in this process; raises LLMUnavailableError
+    # without touching the network while throttled or out of budget.
+    limiter = get_llm_limiter()
+    estimated_tokens = _estimate_gemini_tokens(prompt)
+    limiter.acquire(estimated_tokens)
+
+    logger.info(
+        "Requesting Gemini tags model=%s domain=%s preview=%r",
+        gemini_model,
+        domain or '-',
+        content_preview,
+    )
+    start_time = time.perf_counter()
     try:
-        logger.info(
-            "Requesting Gemini tags model=%s domain=%s preview=%r",
-            gemini_model,
-            domain or '-',
-            content_preview,
-        )
-        start_time = time.perf_counter()
-        response = requests.post(url, params={"key": gemini_api_key}, json=payload, timeout=20)
+        response = requests.post(url, params={"key": settings["api_key"]}, json=payload, timeout=20)
         response.raise_for_status()
         data = response.json()
 
@@ -248,71 +272,299 @@ def generate_tags_llm(title, description, domain='', n=3):
         raw_text = parts[0].get("text", "")
         parsed = json.loads(raw_text)
         tags = _normalize_tags(parsed.get("tags", []), n=n)
-        if tags:
-            elapsed_ms = int((time.perf_counter() - start_time) * 1000)
-            logger.info(
-                "Gemini tags generated in %sms model=%s domain=%s tags=%s",
-                elapsed_ms,
-                gemini_model,
-                domain or '-',
-                tags,
-            )
-            return tags
-
-        raise ValueError("Gemini returned empty tags")
-    except Exception as e:
-        fallback_tags = generate_tags(text, n=n)
-        error_description = _describe_gemini_error(e)
-        error_payload = _sanitize_gemini_error_payload(e)
-        logger.warning(
-            "Gemini tag generation failed for domain=%s model=%s; using fallback tags=%s error=%s",
+        if not tags:
+            raise ValueError("Gemini returned empty tags")
+    except requests.exceptions.HTTPError as e:
+        if e.response is not None and e.response.status_code == 429:
+            limiter.record_throttled(_gemini_retry_after(e.response))
+        else:
+            limiter.record_failure()
+        raise
+    except Exception:
+        limiter.record_failure()
+        raise
+
+    usage = data.get("usageMetadata") or {}
+    limiter.record_success(estimated_tokens, usage.get("totalTokenCount"))
+
+    elapsed_ms = int((time.perf_counter() - start_time) * 1000)
+    logger.info(
+        "Gemini tags generated in %sms model=%s domain=%s tags=%s",
+        elapsed_ms,
+        gemini_model,
+        domain or '-',
+        tags,
+    )
+    return tags
+
+
+def _estimate_gemini_tokens(prompt):
+    """Rough token estimate (about 4 characters per token) plus room for the answer."""
+    return len(prompt) // 4 + 32
+
+
+def _gemini_retry_after(response):
+    """Extracts the retry delay from a 429 response (Retry-After header or google.rpc.RetryInfo)."""
+    retry_after = parse_retry_after(response.headers.get("Retry-After"))
+    if retry_after is not None:
+        return retry_after
+
+    try:
+        details = response.json().get("error", {}).get("details", [])
+    except (ValueError, AttributeError):
+        return None
+
+    for detail in details if isinstance(details, list) else []:
+        if isinstance(detail, dict) and str(detail.get("@type", "")).endswith("RetryInfo"):
+            return parse_retry_after(detail.get("retryDelay"))
+    return None
+
+
+def _log_gemini_failure(error, domain, model, fallback_tags):
+    """Log a Gemini failure together with the tags used instead."""
+    if isinstance(error, LLMUnavailableError):
+        logger.info(
+            "Gemini skipped for domain=%s model=%s (%s); using fallback tags=%s",
             domain or '-',
-            gemini_model,
+            model,
+            error,
             fallback_tags,
-            error_description,
         )
-        if error_payload is not None:
-            logger.warning(
-                "Gemini error payload domain=%s model=%s payload=%s",
-                domain or '-',
-                gemini_model,
-                json.dumps(error_payload, ensure_ascii=True, separators=(',', ':')),
-            )
+        return
+
+    error_description = _describe_gemini_error(error)
+    error_payload = _sanitize_gemini_error_payload(error)
+    logger.warning(
+        "Gemini tag generation failed for domain=%s model=%s; using fallback tags=%s error=%s",
+        domain or '-',
+        model,
+        fallback_tags,
+        error_description,
+    )
+    if error_payload is not None:
+        logger.warning(
+            "Gemini error payload domain=%s model=%s payload=%s",
+            domain or '-',
+            model,
+            json.dumps(error_payload, ensure_ascii=True, separators=(',', ':')),
+        )
+
+
+def generate_tags_llm(title, description, domain='', n=3):
+    """Generate tags with Gemini when configured, otherwise fall back locally."""
+    text = f"{title or ''}\n{description or ''}".strip()
+    settings = _gemini_settings()
+    content_preview = (title or description or domain or '').strip()[:80]
+
+    suggested = suggest_tags(title, domain, n=n)
+    if len(suggested) >= n:
+        logger.info("Using neighbour tags for domain=%s preview=%r: %s", domain or '-', content_preview, suggested)
+        return suggested
+
+    if settings is None:
+        logger.info(
+            "Gemini tags disabled or not configured; using local fallback for domain=%s preview=%r",
+            domain or '-',
+            content_preview,
+        )
+        return merge_tags(suggested, generate_tags(text, n=n), n=n)
+
+    try:
+        return merge_tags(suggested, _fetch_gemini_tags(settings, title, description, domain, n=n), n=n)
+    except Exception as e:
+        fallback_tags = merge_tags(suggested, generate_tags(text, n=n), n=n)
+        _log_gemini_failure(e, domain, settings["model"], fallback_tags)
         return fallback_tags
 
 
-def generate_tags(text, n=3):
-    """Generate up to `n` keyword-like tags from `text` using a simple frequency-based approach.
+def llm_tagging_enabled():
+    """True when Gemini tagging is configured for this process."""
+    return _gemini_settings() is not None
+
+
+def request_llm_tags(title, description, domain='', n=3):
+    """
+    Request tags from Gemini through the rate limiter, without local fallback.
 
-    This is a lightweight fallback extractor (no external models). It lowercases,
-    splits on non-word chars, removes short tokens and a small stopword list,
-    and returns the top `n` tokens.
+    Returns None when Gemini is not configured. Raises LLMUnavailableError while
+    throttled or out of budget, and the underlying exception on other failures,
+    so that queued callers can retry later instead of settling for local tags.
+    """
+    settings = _gemini_settings()
+    if settings is None:
+        return None
+    return _fetch_gemini_tags(settings, title, description, domain, n=n)
+
+
+def generate_tags(text, n=3, user_id=None):
+    """Generate up to `n` keyword-like tags from `text` without external models.
+
+    Once the corpus statistics of `user_id` are loaded (see shared.tagging),
+    candidates are ranked by TF-IDF so that words common to every bookmark of
+    that user lose to distinctive ones. Before that, or without a user, it
+    falls back to raw term frequency within `text`.
     """
     if not text:
         return []
 
-    # Small bilingual stopword list (English + Italian common words)
-    stopwords = {
-        'the','and','for','with','that','this','from','are','was','will','have','has','not','but','you','your',
-        'per','una','un','il','la','le','di','e','che','da','in','su','con','del','della'
-    }
+    engine = get_tag_engine()
+    if user_id is not None and engine.is_ready(user_id):
+        return engine.score(user_id, text, n=n)
 
-    tokens = [t.lower() for t in re.findall(r"\w+", text, flags=re.UNICODE) if len(t) > 2]
-    tokens = [t for t in tokens if t not in stopwords and not t.isdigit()]
+    tokens = tokenize(text)
     if not tokens:
         return []
 
-    counts = Counter(tokens)
-    most_common = [t for t, _ in counts.most_common(n*3)]  # take a few more to dedupe
+    return [t for t, _ in Counter(tokens).most_common(n)]
+
+
+# --- Nearest-neighbour tag suggestions ---
+# Bookmarks from the same site with overlapping titles usually share tags. The
+# suggester keeps an inverted index (title token / domain -> bookmark ids) over
+# bookmarks with final tags and proposes the tags of the most similar ones;
+# confident suggestions make the LLM call unnecessary.
+
+DEFAULT_SUGGEST_THRESHOLD = 0.6
+SUGGEST_NEIGHBOURS = 5
+# A single look-alike bookmark is not enough evidence for a confident suggestion.
+SUGGEST_MIN_SUPPORT = 2
+
+
+class TagSuggester:
+    """
+    Proposes tags from the top-k most similar existing bookmarks.
+
+    Similarity is the cosine between the binary feature sets of two bookmarks
+    (title tokens plus the domain). Only bookmarks sharing at least one title
+    token are considered neighbours; the domain strengthens the match.
+    """
+
+    def __init__(self):
+        self._postings = {}
+        self._docs = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _features(title, domain):
+        tokens = set(tokenize(title))
+        domain_feature = f"domain:{domain.lower()}" if domain else None
+        return tokens, domain_feature
+
+    def load(self, cursor):
+        """Indexes all bookmarks whose tags are final."""
+        cursor.execute(
+            "SELECT id, title, domain, tags FROM bookmarks "
+            "WHERE COALESCE(tags_status, 'done') = 'done' AND tags IS NOT NULL AND tags != '[]'"
+        )
+        rows = cursor.fetchall()
+        with self._lock:
+            self._postings = {}
+            self._docs = {}
+        for bookmark_id, title, domain, tags in rows:
+            try:
+                self.add(bookmark_id, title, domain, json.loads(tags))
+            except (TypeError, ValueError):
+                continue
+        logger.info("Tag suggester loaded: %s bookmarks, %s features", len(self._docs), len(self._postings))
+
+    def add(self, bookmark_id, title, domain, tags):
+        """Indexes (or re-indexes) one bookmark with its final tags."""
+        tokens, domain_feature = self._features(title, domain)
+        tags = tuple(str(tag) for tag in tags or () if str(tag).strip())
+        with self._lock:
+            self._discard(bookmark_id)
+            if not tokens or not tags:
+                return
+            features = frozenset(tokens | {domain_feature} if domain_feature else tokens)
+            self._docs[bookmark_id] = (features, tags)
+            for feature in features:
+                self._postings.setdefault(feature, set()).add(bookmark_id)
+
+    def remove(self, bookmark_id):
+        """Drops a bookmark from the index (e.g. after deletion)."""
+        with self._lock:
+            self._discard(bookmark_id)
+
+    def _discard(self, bookmark_id):
+        doc = self._docs.pop(bookmark_id, None)
+        if doc is None:
+            return
+        for feature in doc[0]:
+            ids = self._postings[feature]
+            ids.discard(bookmark_id)
+            if not ids:
+                del self._postings[feature]
+
+    def suggest(self, title, domain='', n=3, k=SUGGEST_NEIGHBOURS):
+        """
+        Returns up to `n` (tag, confidence) pairs, best first.
+
+        The confidence of a tag is the summed similarity of the neighbours that
+        carry it, divided by the number of neighbours (at least SUGGEST_MIN_SUPPORT).
+        """
+        tokens, domain_feature = self._features(title, domain)
+        if not tokens:
+            return []
+        query_size = len(tokens) + (1 if domain_feature else 0)
+
+        with self._lock:
+            overlap = Counter()
+            for token in tokens:
+                overlap.update(self._postings.get(token, ()))
+            same_domain = self._postings.get(domain_feature, set()) if domain_feature else set()
+            scored = []
+            for bookmark_id, shared in overlap.items():
+                if bookmark_id in same_domain:
+                    shared += 1
+                features, tags = self._docs[bookmark_id]
+                scored.append((shared / (query_size * len(features)) ** 0.5, bookmark_id, tags))
+
+        neighbours = sorted(scored, key=lambda item: (-item[0], item[1]))[:k]
+        if not neighbours:
+            return []
+
+        votes = Counter()
+        for similarity, _, tags in neighbours:
+            for tag in set(tags):
+                votes[tag] += similarity
+        support = max(len(neighbours), SUGGEST_MIN_SUPPORT)
+        ranked = sorted(votes.items(), key=lambda item: (-item[1], item[0]))[:n]
+        return [(tag, round(vote / support, 3)) for tag, vote in ranked]
+
+
+_suggester = TagSuggester()
+
+
+def get_tag_suggester():
+    """Returns the process-wide tag suggester (empty until `load` is called)."""
+    return _suggester
+
+
+def get_suggest_threshold():
+    """Returns the minimum confidence for skipping the LLM (env TAG_SUGGEST_THRESHOLD)."""
+    raw_value = os.getenv("TAG_SUGGEST_THRESHOLD", "").strip()
+    if not raw_value:
+        return DEFAULT_SUGGEST_THRESHOLD
+    try:
+        return float(raw_value)
+    except ValueError:
+        logger.warning("Invalid TAG_SUGGEST_THRESHOLD=%r; using %s", raw_value, DEFAULT_SUGGEST_THRESHOLD)
+        return DEFAULT_SUGGEST_THRESHOLD
+
+
+def suggest_tags(title, domain='', n=3, threshold=None):
+    """
+    Tags of similar existing bookmarks whose confidence reaches `threshold`.
+
+    Only a full list of `n` tags is enough evidence to skip the LLM; a shorter one
+    should be completed with merge_tags().
+    """
+    threshold = get_suggest_threshold() if threshold is None else threshold
+    return [tag for tag, confidence in get_tag_suggester().suggest(title, domain, n=n) if confidence >= threshold]
 
-    # Normalize tags: remove duplicates preserving order
-    seen = set()
-    tags = []
-    for t in most_common:
-        if t in seen: continue
-        seen.add(t)
-        tags.append(t)
-        if len(tags) >= n:
-            break
 
-    return tags
\ No newline at end of file
+def merge_tags(suggested, tags, n=3):
+    """The confident `suggested` tags first, completed with `tags` up to `n`."""
+    merged = list(suggested)
+    merged.extend(tag for tag in tags if tag not in suggested)
+    return merged[:n]
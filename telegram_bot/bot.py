@@ -5,9 +5,14 @@ import os
 import sys
 import re
 import json
+import signal
 import sqlite3
-from pyrogram import Client, filters
-from datetime import datetime
+import asyncio
+import tempfile
+from collections import OrderedDict
+from pyrogram import Client, filters, idle
+from pyrogram.errors import FloodWait, MessageNotModified
+from types import SimpleNamespace
 from urllib.parse import urlparse
 
 # Ensure project root is importable when launched as a script (e.g. under systemd)
@@ -16,8 +21,20 @@ PROJECT_ROOT = os.path.dirname(SCRIPT_DIR)
 if PROJECT_ROOT not in sys.path:
     sys.path.insert(0, PROJECT_ROOT)
 
-from shared.database import init_database, get_db_path
-from shared.utils import get_article_metadata, generate_tags_llm
+from shared.database import init_database, get_db_path, immediate_transaction
+from shared.async_db import AsyncDatabase
+from shared.utils import get_article_metadata, generate_tags, get_tag_suggester, llm_tagging_enabled
+from shared.tagging import get_tag_engine
+from shared.tag_queue import TagWorker, enqueue_tag_job
+from shared.telegram_links import TelegramUserRouter
+from shared.saved_urls import SavedUrlIndex, find_saved_bookmark, touch_bookmark
+from shared.search import SearchCache, mark_bookmark_read, search_bookmarks
+from shared.export import EXPORT_FORMATS, export_to_file
+from shared.metrics import MetricsServer, get_metrics
+from shared.ingest_queue import (
+    claim_ingest_job, complete_ingest_job, enqueue_ingest_job, fail_ingest_job, recover_ingest_jobs,
+    get_chat_checkpoints, update_chat_checkpoint,
+)
 import logging
 
 # Setup logging
@@ -25,9 +42,186 @@ __version__ = "1.0"
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Ingest workers: concurrent coroutines draining the ingest queue (env BOT_INGEST_WORKERS)
+DEFAULT_INGEST_WORKERS = 4
+INGEST_POLL_INTERVAL = 5.0
+
+# Reply aggregation: minimum seconds between two edits of a summary, entries per summary,
+# seconds a summary accepts new entries, Telegram's text limit, entries remembered for updates
+REPLY_EDIT_WINDOW = 1.5
+REPLY_MAX_ENTRIES = 20
+REPLY_REUSE_SECONDS = 60
+REPLY_MAX_CHARS = 4096
+REPLY_TRACKED_ENTRIES = 1000
+
+# Inline search (@bot query): results per page, seconds Telegram may cache an answer
+INLINE_PAGE_SIZE = 20
+INLINE_CACHE_TIME = 10
+
+# /search, /recent and /unread: bookmarks per page; callback_data is limited to 64 bytes by Telegram
+LIST_PAGE_SIZE = 5
+CALLBACK_DATA_MAX_BYTES = 64
+LIST_COMMANDS = {'search': 's', 'recent': 'r', 'unread': 'u'}
+LIST_TITLES = {'s': "🔎 Results for “{query}”", 'r': "🕒 Recent bookmarks", 'u': "📬 Unread bookmarks"}
+
+
+class _Summary:
+    """One summary message of a chat and the entries it shows."""
+
+    def __init__(self, chat_id, reply_to, created_at):
+        self.chat_id = chat_id
+        self.reply_to = reply_to
+        self.created_at = created_at
+        self.message_id = None
+        self.entries = {}
+        self.dirty = False
+        self.task = None
+
+    def render(self):
+        text = "\n\n".join(self.entries.values())
+        return text if len(text) <= REPLY_MAX_CHARS else text[:REPLY_MAX_CHARS - 1] + "…"
+
+
+class ReplyAggregator:
+    """
+    Coalesces the bot's replies per chat.
+
+    Every source message gets an entry (keyed by its id) in a summary message
+    of its chat. The first entry is sent at once; further entries and updates
+    are applied with at most one edit per REPLY_EDIT_WINDOW, so forwarding 20
+    messages costs one send and a few edits instead of 20 replies and 20 edits.
+
+    Pyrogram already sleeps through short FloodWaits; longer ones are raised
+    and handled here by pausing the chat for the requested time, during which
+    updates keep accumulating into the next edit.
+
+    Args:
+        client (Client): The Pyrogram client used to send and edit the summaries.
+    """
+
+    def __init__(self, client, edit_window=REPLY_EDIT_WINDOW):
+        self.client = client
+        self.edit_window = edit_window
+        self._open = {}  # chat_id -> summary accepting new entries
+        self._entries = OrderedDict()  # (chat_id, key) -> summary showing that entry
+        self._flood_until = {}  # chat_id -> loop time before which nothing is sent
+
+    def post(self, chat_id, key, text, reply_to=None):
+        """Sets the text of an entry and schedules the send or edit of its summary."""
+        loop = asyncio.get_running_loop()
+        summary = self._entries.get((chat_id, key))
+        if summary is None:
+            summary = self._open.get(chat_id)
+            if summary is None or not self._accepts(summary, text, loop.time()):
+                summary = _Summary(chat_id, reply_to, loop.time())
+                self._open[chat_id] = summary
+            self._entries[(chat_id, key)] = summary
+            while len(self._entries) > REPLY_TRACKED_ENTRIES:
+                self._entries.popitem(last=False)
+        else:
+            self._entries.move_to_end((chat_id, key))
+        summary.entries[key] = text
+        summary.dirty = True
+        if summary.task is None:
+            summary.task = asyncio.create_task(self._flush(summary))
+
+    @staticmethod
+    def _accepts(summary, text, now):
+        return (
+            len(summary.entries) < REPLY_MAX_ENTRIES
+            and now - summary.created_at < REPLY_REUSE_SECONDS
+            and len(summary.render()) + len(text) + 2 <= REPLY_MAX_CHARS
+        )
+
+    async def drain(self):
+        """Waits until every scheduled send or edit is done (tests, shutdown)."""
+        while True:
+            tasks = {summary.task for summary in self._entries.values() if summary.task is not None}
+            if not tasks:
+                return
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _flush(self, summary):
+        try:
+            if summary.message_id is not None:
+                # Already on screen: wait for more updates to share the edit
+                await asyncio.sleep(self.edit_window)
+            while summary.dirty:
+                summary.dirty = False
+                await self._send(summary)
+                if summary.dirty:
+                    await asyncio.sleep(self.edit_window)
+        finally:
+            summary.task = None
+
+    async def _send(self, summary):
+        loop = asyncio.get_running_loop()
+        while True:
+            delay = self._flood_until.get(summary.chat_id, 0) - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+                summary.dirty = False  # the text rendered below includes what arrived meanwhile
+            text = summary.render()
+            with get_metrics().time('reply') as timer:
+                try:
+                    if summary.message_id is None:
+                        timer.outcome = 'sent'
+                        reply = await self.client.send_message(summary.chat_id, text, reply_to_message_id=summary.reply_to)
+                        summary.message_id = reply.id
+                    else:
+                        timer.outcome = 'edited'
+                        await self.client.edit_message_text(summary.chat_id, summary.message_id, text)
+                    return
+                except FloodWait as e:
+                    timer.outcome = 'flood_wait'
+                    wait = getattr(e, "value", None) or 1
+                    logger.warning("FloodWait in chat %s: pausing replies for %ss", summary.chat_id, wait)
+                    self._flood_until[summary.chat_id] = loop.time() + wait
+                except MessageNotModified:
+                    timer.outcome = 'not_modified'
+                    return
+                except Exception as e:
+                    timer.outcome = 'error'
+                    logger.warning(f"Could not update the reply summary in chat {summary.chat_id}: {e}")
+                    return
+
+
+def _store_bookmark(cursor, values, comments_url, text):
+    """
+    Inserts a bookmark row (write batch of the database thread).
+
+    Never replaces an existing bookmark: that would assign a new id and drop
+    the user's edits and read state. Returns (bookmark_id, already_saved,
+    tag engine terms to apply once the batch is committed).
+    """
+    cursor.execute(
+        """
+        INSERT INTO bookmarks
+        (user_id, url, title, description, image_url, domain, tags, tags_status, telegram_user_id, telegram_message_id, comments_url)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(user_id, url) DO NOTHING
+    """,
+        values,
+    )
+    if cursor.rowcount == 0:
+        # Saved meanwhile (e.g. from the web interface)
+        existing = find_saved_bookmark(cursor, values[0], values[1])
+        touch_bookmark(cursor, existing[0], comments_url)
+        return existing[0], True, None
+    bookmark_id = cursor.lastrowid
+    return bookmark_id, False, get_tag_engine().persist(values[0], text, cursor)
+
+
+def _count_bookmarks(conn, user_id):
+    return conn.execute("SELECT COUNT(*) FROM bookmarks WHERE user_id = ?", (user_id,)).fetchone()[0]
+
+
 # --- Dynamic import for compatibility ---
 from dotenv import load_dotenv
 from pyrogram.enums import ChatType, MessageEntityType
+from pyrogram.types import (
+    InlineKeyboardButton, InlineKeyboardMarkup, InlineQueryResultArticle, InputTextMessageContent,
+)
 
 # Search for StringSession in common paths to support different Pyrogram versions
 StringSession = None
@@ -105,12 +299,41 @@ class BookmarkBot:
             )
 
         # Initialize database
-        init_database() # Ensure the DB and tables exist on startup
+        conn = init_database() # Ensure the DB and tables exist on startup
+        try:
+            # Warm the local tag engine, the neighbour index and the saved URLs with the saved bookmarks
+            get_tag_engine().load(conn.cursor())
+            get_tag_suggester().load(conn.cursor())
+            self.saved_urls = SavedUrlIndex()
+            self.saved_urls.load(conn.cursor())
+        finally:
+            conn.close()
+
+        # Telegram sender -> web user routing, cached in memory
+        self.user_router = TelegramUserRouter()
+        self.user_router.load()
+
+        # Background ingestion and LLM tagging (started in run); replies waiting for their final tags
+        self.tag_worker = None
+        self._loop = None
+        # Database thread: the event loop never runs SQLite calls itself
+        self.db = None
+        self._ingest_wakeup = None
+        self._pending_replies = {}
+        self._pending_tags = {}  # bookmark_id -> reply entry (chat_id, key) waiting for its tags
+        # Replies are coalesced per chat to stay clear of FloodWait during bulk forwarding
+        self.replies = ReplyAggregator(self.app)
+        # Inline search pages per (user, query, cursor): Telegram repeats queries on every keystroke
+        self.search_cache = SearchCache()
+        # chat_id -> ids of the messages handled live, for the chats whose checkpoint is
+        # held until the offline catch-up has queued what they missed
+        self._catching_up = {}
 
         # Register handlers
         self.setup_handlers()
 
-    def extract_urls(self, text):
+    @staticmethod
+    def extract_urls(text):
         """
         Extracts and normalizes URLs from text content.
 
@@ -156,7 +379,8 @@ class BookmarkBot:
                 
         return urls
 
-    def get_hn_comments_url(self, url):
+    @staticmethod
+    def get_hn_comments_url(url):
         """
         Extracts the Hacker News comments URL from an article URL if possible.
 
@@ -182,8 +406,8 @@ class BookmarkBot:
         Saves a URL as a bookmark in the database with metadata.
 
         Stores the URL, metadata (title, description etc.), message info and optional
-        comments URL in the bookmarks database. Associates the bookmark with the first
-        web user found in the database.
+        comments URL in the bookmarks database. Associates the bookmark with the web
+        user linked to the sender (see shared/telegram_links.py).
 
         Args:
             url (str): The URL to bookmark.
@@ -194,57 +418,62 @@ class BookmarkBot:
         Returns:
             bool: True if bookmark was saved successfully, False otherwise.
         """
-        db_path = get_db_path()
-        conn = None
         try:
-            conn = sqlite3.connect(db_path, uri=db_path.startswith('file:'))
-            cursor = conn.cursor()
             from_user_id = getattr(message.from_user, "id", None)
             comments_url = comments_url_override if comments_url_override is not None else self.get_hn_comments_url(url)
-            tags = generate_tags_llm(
-                metadata.get("title", ""),
-                metadata.get("description", ""),
-                metadata.get("domain", ""),
-            )
-            metadata["tags"] = tags
 
-            # Retrieve the ID of the first webserver user to associate the bookmark
-            cursor.execute("SELECT id FROM users ORDER BY id LIMIT 1")
-            web_user = cursor.fetchone()
-            web_user_id = web_user[0] if web_user else None
+            # Route the sender to their web account (cached, no query per save)
+            web_user_id = self.user_router.resolve(from_user_id)
 
             if not web_user_id:
-                logger.error("No web user found in the database. Cannot associate bookmark.")
+                logger.error("No web user linked to Telegram user %s. Cannot associate bookmark.", from_user_id)
                 return False
 
-            cursor.execute(
-                """
-                INSERT OR REPLACE INTO bookmarks 
-                (user_id, url, title, description, image_url, domain, tags, telegram_user_id, telegram_message_id, comments_url)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """,
-                (
-                    web_user_id,
-                    url,
-                    metadata["title"],
-                    metadata["description"],
-                    metadata["image_url"],
-                    metadata["domain"],
-                    json.dumps(tags, ensure_ascii=False),
-                    from_user_id,
-                    message.id,
-                    comments_url,
-                ),
+            # Local tags right away; the LLM tags arrive later through the tag queue.
+            with get_metrics().time('tag', metadata.get("domain", ""), outcome='provisional'):
+                tags = generate_tags(
+                    f"{metadata.get('title', '')}\n{metadata.get('description', '')}".strip(), user_id=web_user_id
+                )
+            tags_status = 'pending' if llm_tagging_enabled() else 'done'
+            metadata["tags"] = tags
+            metadata["tags_status"] = tags_status
+
+            values = (
+                web_user_id,
+                url,
+                metadata["title"],
+                metadata["description"],
+                metadata["image_url"],
+                metadata["domain"],
+                json.dumps(tags, ensure_ascii=False),
+                tags_status,
+                from_user_id,
+                message.id,
+                comments_url,
             )
-            conn.commit()
+            # Runs in an ingest thread: concurrent saves share one transaction on the database thread.
+            # The timing includes the wait in the queue and for the write lock.
+            with get_metrics().time('db_write', metadata["domain"]) as timer:
+                bookmark_id, already_saved, observed_terms = self.db.submit(
+                    _store_bookmark, values, comments_url, f"{metadata['title']}\n{metadata['description']}", write=True
+                ).result()
+                timer.outcome = 'already_saved' if already_saved else 'saved'
+            # The batch is committed: the tag engine can count the new bookmark
+            if observed_terms is not None:
+                get_tag_engine().apply(web_user_id, observed_terms)
+            self.saved_urls.add(web_user_id, url)
+            self.search_cache.clear()
+            if already_saved:
+                metadata.update(bookmark_id=bookmark_id, already_saved=True, tags=[], tags_status='done')
+                logger.info(f"Bookmark already saved: {url}")
+                return True
+
+            metadata["bookmark_id"] = bookmark_id
             logger.info(f"Bookmark saved: {metadata['title']}")
             return True
         except Exception as e:
             logger.error(f"Error saving bookmark: {e}")
             return False
-        finally:
-            if conn:
-                conn.close()
 
     def setup_handlers(self):
         """
@@ -257,7 +486,7 @@ class BookmarkBot:
         The handlers extract URLs from messages and save them as bookmarks.
         """
 
-        @self.app.on_message(filters.private & ~filters.command(["count", "help"]))
+        @self.app.on_message(filters.private & ~filters.command(["count", "help", "export", *LIST_COMMANDS]))
         async def handle_private_message(client, message):
             """Handler for messages in saved messages
             
@@ -307,28 +536,17 @@ class BookmarkBot:
         @self.app.on_message(filters.command("count") & filters.private)
         async def handle_count_command(client, message):
             """Handles the /count command to return the total number of bookmarks."""
-            db_path = get_db_path()
-            conn = None
             try:
-                conn = sqlite3.connect(db_path)
-                cursor = conn.cursor()
-
                 # Find the web user to count bookmarks for.
                 # This logic matches how bookmarks are saved.
-                cursor.execute("SELECT id FROM users ORDER BY id LIMIT 1")
-                web_user = cursor.fetchone()
-
-                if not web_user:
-                    await message.reply("No web user configured. Cannot count bookmarks.")
+                web_user_id = await asyncio.to_thread(self.user_router.resolve, getattr(message.from_user, "id", None))
+                if not web_user_id:
+                    await self.reply_not_linked(message)
                     return
 
-                web_user_id = web_user[0]
-
-                cursor.execute("SELECT COUNT(*) FROM bookmarks WHERE user_id = ?", (web_user_id,))
-                count = cursor.fetchone()[0]
-                
+                count = await self.db.execute(_count_bookmarks, web_user_id)
                 await message.reply(f"You have saved a total of **{count}** bookmarks.")
-                
+
             except Exception as e:
                 logger.error(f"Error handling /count command: {e}")
                 await message.reply("Si è verificato un errore nel contare i bookmark.")
@@ -347,7 +565,14 @@ class BookmarkBot:
                 "in the same message, I will link them into a single bookmark.\n\n"
                 "🤖 **Available commands**\n"
                 "- `/count`: Shows the total number of bookmarks you have saved.\n"
+                "- `/search <words>`: Searches your bookmarks by title, domain and tags.\n"
+                "- `/recent`: Lists your latest bookmarks.\n"
+                "- `/unread`: Lists your unread bookmarks, with buttons to mark them read.\n"
+                "- `/export [html|json|csv] [gz]`: Sends all your bookmarks as a file (HTML by default).\n"
                 "- `/help`: Shows this help message.\n\n"
+                "🔎 **Searching**\n"
+                "Type `@<bot username> <words>` in any chat to search your bookmarks "
+                "by title, domain and tags.\n\n"
                 "Your bookmarks are visible in the web interface."
             )
             try:
@@ -355,13 +580,183 @@ class BookmarkBot:
             except Exception as e:
                 logger.error(f"Error handling /help command: {e}")
 
+        @self.app.on_message(filters.command("export") & filters.private)
+        async def handle_export_command(client, message):
+            """Handles /export [html|json|csv] [gz] by sending the bookmarks as a file."""
+            try:
+                await self.send_export(message)
+            except Exception as e:
+                logger.error(f"Error handling /export command: {e}")
+                await message.reply("An error occurred while exporting your bookmarks.")
+
+        @self.app.on_message(filters.command(list(LIST_COMMANDS)) & filters.private)
+        async def handle_list_command(client, message):
+            """Handles /search <q>, /recent and /unread with a paged, button-driven list."""
+            try:
+                await self.send_bookmark_list(message)
+            except Exception as e:
+                logger.error(f"Error handling /{message.command[0]} command: {e}")
+                await message.reply("An error occurred while listing your bookmarks.")
+
+        @self.app.on_callback_query(filters.regex(r"^(?:[sru]:[ab]:|read:)"))
+        async def handle_list_callback(client, callback_query):
+            """Handles the next/prev and mark-as-read buttons of the bookmark lists."""
+            try:
+                await self.answer_list_callback(callback_query)
+            except Exception as e:
+                logger.error(f"Error handling list button {callback_query.data!r}: {e}")
+                await callback_query.answer("Something went wrong, please try again.")
+
+        @self.app.on_inline_query()
+        async def handle_inline_query(client, inline_query):
+            """Handles `@bot query` (bot accounts with inline mode enabled in @BotFather)."""
+            try:
+                await self.answer_inline_search(inline_query)
+            except Exception as e:
+                logger.error(f"Error handling inline query: {e}")
+
+    @staticmethod
+    def fit_callback_query(kind, query):
+        """Shortens a search query so that its page buttons fit in callback_data."""
+        room = CALLBACK_DATA_MAX_BYTES - len(f"{kind}:b:{2 ** 63}:")
+        return query.encode("utf-8")[:room].decode("utf-8", "ignore").strip()
+
+    async def send_bookmark_list(self, message):
+        """Replies to /search, /recent or /unread with the first page of the list."""
+        web_user_id = await asyncio.to_thread(self.user_router.resolve, getattr(message.from_user, "id", None))
+        if not web_user_id:
+            await self.reply_not_linked(message)
+            return
+        kind = LIST_COMMANDS[message.command[0].lower()]
+        query = self.fit_callback_query(kind, " ".join(message.command[1:]).lower()) if kind == 's' else ""
+        if kind == 's' and not query:
+            await message.reply("Usage: `/search <words>`")
+            return
+        text, markup = await self.render_bookmark_page(web_user_id, kind, query)
+        await message.reply(text, reply_markup=markup, disable_web_page_preview=True)
+
+    async def answer_list_callback(self, callback_query):
+        """Turns a page or marks a bookmark read, then edits the list in place."""
+        web_user_id = await asyncio.to_thread(self.user_router.resolve, getattr(callback_query.from_user, "id", None))
+        if not web_user_id:
+            await callback_query.answer("Your Telegram account is not linked to a web user.", show_alert=True)
+            return
+
+        parts = callback_query.data.split(":", 3)
+        notice = None
+        if parts[0] == "read":
+            # read:<bookmark id>:<cursor of the page being shown>
+            _, bookmark_id, page_cursor = parts
+            await self.db.write(mark_bookmark_read, web_user_id, int(bookmark_id))
+            self.search_cache.clear()
+            kind, query, before_id, after_id = 'u', "", int(page_cursor) if page_cursor else None, None
+            notice = "Marked as read ✅"
+        else:
+            # <kind>:<a|b>:<cursor>:<query>, a = newer than the cursor, b = older
+            kind, direction, cursor_id, query = parts
+            before_id = int(cursor_id) if direction == 'b' else None
+            after_id = int(cursor_id) if direction == 'a' else None
+
+        text, markup = await self.render_bookmark_page(web_user_id, kind, query, before_id, after_id)
+        try:
+            await callback_query.message.edit_text(text, reply_markup=markup, disable_web_page_preview=True)
+        except MessageNotModified:
+            pass
+        await callback_query.answer(notice)
+
+    async def render_bookmark_page(self, web_user_id, kind, query, before_id=None, after_id=None):
+        """
+        Builds the text and the buttons of one list page.
+
+        One extra row is fetched in the direction of travel to know whether a
+        further page exists; the page buttons carry the ids of the first and
+        last bookmark shown (keyset cursors), so every page is one indexed query.
+        """
+        rows = await self.db.execute(
+            search_bookmarks, web_user_id, query, LIST_PAGE_SIZE + 1, before_id, after_id, kind == 'u'
+        )
+        if after_id is not None:
+            has_newer, has_older = len(rows) > LIST_PAGE_SIZE, True
+            rows = rows[-LIST_PAGE_SIZE:]
+        else:
+            has_newer, has_older = before_id is not None, len(rows) > LIST_PAGE_SIZE
+            rows = rows[:LIST_PAGE_SIZE]
+
+        title = LIST_TITLES[kind].format(query=query)
+        if not rows:
+            empty = {'s': "No bookmark matches.", 'r': "No bookmarks yet.", 'u': "Nothing left to read 🎉"}[kind]
+            return f"**{title}**\n\n{empty}", None
+
+        lines = [f"**{title}**", ""]
+        for number, row in enumerate(rows, 1):
+            read_mark = "" if kind == 'u' or not row.is_read else " ✓"
+            lines.append(f"{number}. {row.title}{read_mark}\n   {row.url}")
+
+        keyboard = []
+        if kind == 'u':
+            # Re-rendering from the cursor just above this page keeps the user on it
+            page_cursor = rows[0].id + 1 if before_id is not None or after_id is not None else ""
+            keyboard.append([
+                InlineKeyboardButton(f"✓ {number}", callback_data=f"read:{row.id}:{page_cursor}")
+                for number, row in enumerate(rows, 1)
+            ])
+        navigation = []
+        if has_newer:
+            navigation.append(InlineKeyboardButton("⬅️ Newer", callback_data=f"{kind}:a:{rows[0].id}:{query}"))
+        if has_older:
+            navigation.append(InlineKeyboardButton("Older ➡️", callback_data=f"{kind}:b:{rows[-1].id}:{query}"))
+        if navigation:
+            keyboard.append(navigation)
+        return "\n".join(lines), InlineKeyboardMarkup(keyboard) if keyboard else None
+
+    async def answer_inline_search(self, inline_query):
+        """
+        Answers an inline query with the user's matching bookmarks.
+
+        Pages come from the full-text index, newest first; `next_offset` carries
+        the id of the last result (a keyset cursor), so scrolling never
+        re-reads earlier pages. Answers are cached per (user, query, cursor).
+        """
+        web_user_id = await asyncio.to_thread(self.user_router.resolve, getattr(inline_query.from_user, "id", None))
+        if not web_user_id:
+            await inline_query.answer(
+                [], cache_time=INLINE_CACHE_TIME, is_personal=True,
+                switch_pm_text="Link your Telegram account to search", switch_pm_parameter="link",
+            )
+            return
+
+        query = " ".join((inline_query.query or "").lower().split())
+        offset = inline_query.offset or ""
+        before_id = int(offset) if offset.isdigit() else None
+        key = (web_user_id, query, before_id)
+        results = self.search_cache.get(key)
+        if results is None:
+            results = await self.db.execute(search_bookmarks, web_user_id, query, INLINE_PAGE_SIZE, before_id)
+            self.search_cache.put(key, results)
+
+        articles = [
+            InlineQueryResultArticle(
+                title=result.title,
+                input_message_content=InputTextMessageContent(f"📰 {result.title}\n🔗 {result.url}"),
+                id=str(result.id),
+                url=result.url,
+                description=" · ".join(filter(None, [result.domain, ", ".join(result.tags)])),
+            )
+            for result in results
+        ]
+        next_offset = str(results[-1].id) if len(results) == INLINE_PAGE_SIZE else ""
+        await inline_query.answer(articles, cache_time=INLINE_CACHE_TIME, is_personal=True, next_offset=next_offset)
+
     async def process_message_for_urls(self, message):
         """
-        Processes a message to extract and save URLs as bookmarks.
+        Queues the URLs of a message for ingestion and acknowledges it at once.
 
-        Extracts URLs from message text/caption/entities, gets metadata for each URL,
-        and saves them as bookmarks. Also attempts to find HN comments URLs when 
-        relevant.
+        The job (chat_id, message_id, urls) is stored in the ingest queue
+        before replying, so no link is lost if the bot restarts; the ingest
+        workers scrape, tag and save the links and update the message's entry
+        in the chat's reply summary (see ReplyAggregator). The chat checkpoint
+        moves past the message only once it is handled (queued in the same
+        transaction), so a crash before that leaves it to the catch-up.
 
         Args:
             message (Message): The Telegram message to process.
@@ -370,8 +765,128 @@ class BookmarkBot:
             None
         """
         logger.info("--> Entered process_message_for_urls")
+        chat_id = getattr(message.chat, "id", None)
+
+        with get_metrics().time('extract') as timer:
+            urls = self.extract_message_urls(message)
+            timer.outcome = 'urls' if urls else 'no_urls'
+        if not urls:
+            logger.info("--> No URL found in the message. End of processing.")
+            await self._message_handled(chat_id, message.id)
+            return
+
+        from_user_id = getattr(message.from_user, "id", None)
+        web_user_id = await asyncio.to_thread(self.user_router.resolve, from_user_id)
+        if not web_user_id:
+            logger.warning("Ignoring links from unlinked Telegram user %s", from_user_id)
+            if self.notifies_unlinked(message):
+                self.replies.post(chat_id, message.id, self.not_linked_text(message), reply_to=message.id)
+            await self._message_handled(chat_id, message.id)
+            return
+
+        # Re-shared links cost one indexed lookup instead of a scrape and an LLM call
+        urls, already_saved = await self.db.execute(self.skip_already_saved, web_user_id, urls)
+        if not urls:
+            self.replies.post(chat_id, message.id, self.format_already_saved_reply(already_saved), reply_to=message.id)
+            await self._message_handled(chat_id, message.id)
+            return
+
+        live_ids = self._catching_up.get(chat_id)
+        job_id = await self.db.write(self.queue_message, chat_id, message.id, urls, from_user_id, live_ids is None)
+        if live_ids is not None:
+            live_ids.add(message.id)
+        if job_id is None:
+            logger.info("Message %s in chat %s is already queued", message.id, chat_id)
+            return
+
+        count = len(urls)
+        self.replies.post(chat_id, message.id, f"⏳ Queued {count} link{'s' if count > 1 else ''}, saving...", reply_to=message.id)
+        self._ingest_wakeup.set()
+
+    async def _message_handled(self, chat_id, message_id):
+        """Moves the chat checkpoint past a handled message, unless the chat is still being caught up."""
+        live_ids = self._catching_up.get(chat_id)
+        if live_ids is None:
+            await self.db.write(update_chat_checkpoint, chat_id, message_id)
+        else:
+            live_ids.add(message_id)
 
-        # Search for URLs in the message (supports text, captions, and web_page)
+    def not_linked_text(self, message):
+        """Reply for senders without a web account."""
+        return (
+            f"Your Telegram account (id `{getattr(message.from_user, 'id', None)}`) is not linked to a web user. "
+            "Ask the administrator to run `python scripts/link_telegram_user.py`."
+        )
+
+    def notifies_unlinked(self, message):
+        """
+        Whether an unlinked sender is told how to get linked. A user session
+        answers only in the owner's Saved Messages: its other private chats are
+        the owner's contacts, who are ignored silently.
+        """
+        return bool(self.bot_token) or getattr(message.chat, "id", None) == self._my_user_id
+
+    async def reply_not_linked(self, message):
+        """Replies with the not-linked notice, where notifies_unlinked() allows it."""
+        if self.notifies_unlinked(message):
+            await message.reply(self.not_linked_text(message))
+
+    @staticmethod
+    def queue_message(cursor, chat_id, message_id, urls, telegram_user_id, checkpoint=True):
+        """
+        Queues the URLs of a message and, with `checkpoint`, records it in the
+        chat checkpoint in the same transaction (database thread: see
+        AsyncDatabase.write).
+
+        Returns:
+            int: The job id, or None if the message was already queued.
+        """
+        job_id = enqueue_ingest_job(cursor, chat_id, message_id, urls, telegram_user_id)
+        if checkpoint:
+            update_chat_checkpoint(cursor, chat_id, message_id)
+        return job_id
+
+    def skip_already_saved(self, conn, web_user_id, urls):
+        """
+        Drops the URLs the user already saved, bumping their last_seen_at
+        (database thread: see AsyncDatabase.execute).
+
+        Returns:
+            tuple: (URLs still to ingest, list of (id, title, domain) of the known bookmarks)
+        """
+        hn_pair = self.split_hn_pair(urls)
+        candidates = [hn_pair[0]] if hn_pair else urls
+        already_saved = self.find_already_saved(conn.cursor(), web_user_id, candidates)
+        if not already_saved:
+            return urls, []
+        with immediate_transaction(conn):
+            for bookmark_id, _, _ in already_saved.values():
+                touch_bookmark(conn.cursor(), bookmark_id, hn_pair[1] if hn_pair else None)
+        if len(already_saved) == len(candidates):
+            return [], list(already_saved.values())
+        return [url for url in urls if url not in already_saved], list(already_saved.values())
+
+    def find_already_saved(self, cursor, web_user_id, urls):
+        """Returns {url: (id, title, domain)} for the URLs the user already saved."""
+        found = {}
+        for url in urls:
+            if not self.saved_urls.might_contain(web_user_id, url):
+                continue
+            row = find_saved_bookmark(cursor, web_user_id, url)
+            if row:
+                found[url] = row
+            else:
+                # Deleted from the web interface since the index was loaded
+                self.saved_urls.discard(web_user_id, url)
+        return found
+
+    def extract_message_urls(self, message):
+        """
+        Extracts the URLs of a message (entities of text or caption, or the link preview).
+
+        Returns:
+            list[str]: Unique URLs, sorted.
+        """
         urls = []
 
         # Search for URLs in the message entities (text or caption)
@@ -404,132 +919,416 @@ class BookmarkBot:
             logger.info("--> No URL in entities, using the one from web_page (link preview)")
             urls.append(message.web_page.url)
 
-        # Process each found URL (removing duplicates)
-        if urls:
-            unique_urls = sorted(list(set(urls)))
-            logger.info("Found %d unique URLs: %s", len(unique_urls), unique_urls)
-            
-            # Logic to pair article links and HN comments
-            hn_url = None
-            article_url = None
-            other_urls = []
-            
-            for url in unique_urls:
-                if "news.ycombinator.com" in urlparse(url).netloc:
-                    hn_url = url
-                else:
-                    other_urls.append(url)
-            
-            # If we find exactly one HN link and one other link, we treat them as a pair.
-            if hn_url and len(other_urls) == 1:
-                article_url = other_urls[0]
-
-            if article_url and hn_url:
-                # Special case: a single bookmark for the article + HN comments pair
-                logger.info(f"---> Hacker News pattern detected: Article={article_url}, Comments={hn_url}")
-                # Extract metadata from the article and the HN page using the shared function
-                article_metadata = get_article_metadata(article_url)
-                hn_metadata = get_article_metadata(hn_url)
-
-                # Merge the information: description from HN, the rest from the article
-                metadata = article_metadata
-                if hn_metadata.get("description"):
-                    metadata["description"] = hn_metadata["description"]
-
-                logger.info(f"---> Saving single bookmark to DB...")
-                success = self.save_bookmark(article_url, metadata, message, comments_url_override=hn_url)
-                # If saving is successful, send the reply and exit
-                # to avoid processing the links individually.
-                if success:
-                    tags_line = f"\n🏷️ {', '.join(metadata.get('tags', []))}" if metadata.get('tags') else ""
-                    await message.reply(
-                        f"📖 **HN Bookmark saved!**\n📰 {metadata['title']}\n🔗 {metadata['domain']}{tags_line}"
-                    )
-                    return # We are done, exit the function
-
-            # Previous logic for all other cases (single or multiple non-HN links)
-            saved_count = 0
-            saved_metadata = []
-            for url in unique_urls:
-                logger.info(f"---> Processing URL: {url}")
-                metadata = get_article_metadata(url)
-                logger.info(f"---> Saving bookmark to DB...")
-                success = self.save_bookmark(url, metadata, message)
-                if success:
-                    saved_count += 1
-                    saved_metadata.append(metadata)
-            
-            if saved_count > 0:
-                logger.info(f"---> Successfully saved {saved_count} bookmarks. Sending reply.")
-                if saved_count == 1:
-                    meta = saved_metadata[0]
-                    tags_line = f"\n🏷️ {', '.join(meta.get('tags', []))}" if meta.get('tags') else ""
-                    reply_text = f"📖 **Bookmark saved!**\n📰 {meta['title']}\n🔗 {meta['domain']}{tags_line}"
-                else:
-                    tags_summary = []
-                    for meta in saved_metadata:
-                        if meta.get('tags'):
-                            tags_summary.append(f"- {meta.get('domain', 'link')}: {', '.join(meta['tags'])}")
-                    tags_block = "\n🏷️ Tags:\n" + "\n".join(tags_summary) if tags_summary else ""
-                    reply_text = f"📖 **Saved {saved_count} bookmarks!**{tags_block}"
-                await message.reply(reply_text)
-        else:
-            logger.info("--> No URL found in the message. End of processing.")
+        return sorted(set(urls))
 
-    def export_bookmarks_html(self, filename="bookmarks.html"):
-        """Exports bookmarks to HTML format"""
-        cursor = self.conn.cursor()
-        cursor.execute("SELECT * FROM bookmarks ORDER BY saved_at DESC")
-        bookmarks = cursor.fetchall()
-
-        html_content = """
-<!DOCTYPE html>
-<html>
-<head>
-    <meta charset="utf-8">
-    <title>My Telegram Bookmarks</title>
-    <style>
-        body { font-family: Arial, sans-serif; margin: 20px; }
-        .bookmark { margin-bottom: 20px; padding: 15px; border: 1px solid #ddd; border-radius: 8px; }
-        .title { font-weight: bold; font-size: 18px; margin-bottom: 5px; }
-        .description { color: #666; margin-bottom: 10px; }
-        .meta { font-size: 12px; color: #999; }
-        .url { word-break: break-all; }
-    </style>
-</head>
-<body>
-    <h1>📖 My Telegram Bookmarks</h1>
-"""
+    @staticmethod
+    def split_hn_pair(urls):
+        """
+        Returns (article_url, hn_url) if the URLs are exactly one article link and
+        one Hacker News link, to be saved as a single bookmark; None otherwise.
+        """
+        hn_url = None
+        other_urls = []
+        for url in urls:
+            if "news.ycombinator.com" in urlparse(url).netloc:
+                hn_url = url
+            else:
+                other_urls.append(url)
+        if hn_url and len(other_urls) == 1:
+            return other_urls[0], hn_url
+        return None
 
-        for bookmark in bookmarks:
-            html_content += f"""
-    <div class="bookmark">
-        <div class="title"><a href="{bookmark[1]}" target="_blank">{bookmark[2]}</a></div>
-        <div class="description">{bookmark[3]}</div>
-        <div class="meta">
-            <strong>Dominio:</strong> {bookmark[5]} | 
-            <strong>Salvato:</strong> {bookmark[6]} |
-            <strong>URL:</strong> <span class="url">{bookmark[1]}</span>
-        </div>
-    </div>
-"""
+    def ingest_urls(self, urls, message):
+        """
+        Scrapes and saves the URLs of one message (blocking; runs in a worker thread).
 
-        html_content += """
-</body>
-</html>
-"""
+        Pairs an article link with its Hacker News comments link when the message
+        contains exactly those two.
+
+        Args:
+            urls (list[str]): Unique URLs of the message.
+            message: Object with the `id` and `from_user.id` of the source message.
+
+        Returns:
+            tuple: (list of saved metadata dicts, True if saved as an HN pair)
+        """
+        logger.info("Found %d unique URLs: %s", len(urls), urls)
+
+        hn_pair = self.split_hn_pair(urls)
+        if hn_pair:
+            article_url, hn_url = hn_pair
+            # Special case: a single bookmark for the article + HN comments pair
+            logger.info(f"---> Hacker News pattern detected: Article={article_url}, Comments={hn_url}")
+            # Extract metadata from the article and the HN page using the shared function
+            article_metadata = get_article_metadata(article_url)
+            hn_metadata = get_article_metadata(hn_url)
+
+            # Merge the information: description from HN, the rest from the article
+            metadata = article_metadata
+            if hn_metadata.get("description"):
+                metadata["description"] = hn_metadata["description"]
+
+            logger.info(f"---> Saving single bookmark to DB...")
+            # If saving fails, fall back to processing the links individually.
+            if self.save_bookmark(article_url, metadata, message, comments_url_override=hn_url):
+                return [metadata], True
+
+        # Previous logic for all other cases (single or multiple non-HN links)
+        saved_metadata = []
+        for url in urls:
+            logger.info(f"---> Processing URL: {url}")
+            metadata = get_article_metadata(url)
+            logger.info(f"---> Saving bookmark to DB...")
+            if self.save_bookmark(url, metadata, message):
+                saved_metadata.append(metadata)
+        return saved_metadata, False
+
+    async def _ingest_worker(self, worker_id):
+        """Worker coroutine: drains the ingest queue until the bot stops."""
+        while True:
+            try:
+                job = await self.db.execute(claim_ingest_job)
+            except sqlite3.Error as e:
+                logger.error("Ingest worker %s database error: %s", worker_id, e)
+                job = None
+            if job is None:
+                self._ingest_wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._ingest_wakeup.wait(), INGEST_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await self._run_ingest_job(job)
+
+    async def _run_ingest_job(self, job):
+        """Runs the pipeline for one job, then replaces the acknowledgment with the result."""
+        # save_bookmark only needs the ids of the source message
+        source = SimpleNamespace(id=job.message_id, from_user=SimpleNamespace(id=job.telegram_user_id))
+        try:
+            # Whole message, from the claim to the saved bookmarks
+            with get_metrics().time('ingest', outcome='saved'):
+                saved_metadata, hn_pair = await asyncio.to_thread(self.ingest_urls, job.urls, source)
+                if not saved_metadata:
+                    raise RuntimeError("no bookmark could be saved")
+        except Exception as e:
+            delay = await self.db.execute(fail_ingest_job, job, e)
+            if delay is not None:
+                logger.warning("Ingest job %s failed (attempt %s), retrying in %ss: %s", job.id, job.attempts + 1, delay, e)
+                return
+            logger.error("Ingest job %s failed %s times: %s", job.id, job.attempts + 1, e)
+            self.replies.post(job.chat_id, job.message_id, "❌ Could not save the links of this message.", reply_to=job.message_id)
+            return
+
+        logger.info(f"---> Successfully saved {len(saved_metadata)} bookmarks. Updating reply.")
+        await self.db.execute(complete_ingest_job, job)
+        # After a restart the entry is unknown and the result starts a new summary
+        self.replies.post(job.chat_id, job.message_id, self.format_saved_reply(saved_metadata, hn_pair), reply_to=job.message_id)
+        await self._queue_tag_jobs(job.chat_id, job.message_id, saved_metadata, hn_pair)
+
+    def format_saved_reply(self, saved_metadata, hn_pair=False):
+        """
+        Builds the confirmation text for saved bookmarks.
+
+        Tags still waiting for the LLM are marked with ⏳; the message is edited
+        once the tag queue delivers the final tags.
+        """
+        if len(saved_metadata) == 1 and saved_metadata[0].get('already_saved'):
+            meta = saved_metadata[0]
+            return self.format_already_saved_reply([(meta.get('bookmark_id'), meta['title'], meta['domain'])])
+
+        def tags_text(meta):
+            text = ', '.join(meta.get('tags', []))
+            return f"{text} ⏳" if meta.get('tags_status') == 'pending' else text
+
+        if len(saved_metadata) == 1:
+            meta = saved_metadata[0]
+            header = "HN Bookmark saved!" if hn_pair else "Bookmark saved!"
+            tags_line = f"\n🏷️ {tags_text(meta)}" if meta.get('tags') else ""
+            return f"📖 **{header}**\n📰 {meta['title']}\n🔗 {meta['domain']}{tags_line}"
+
+        tags_summary = [
+            f"- {meta.get('domain', 'link')}: {tags_text(meta)}"
+            for meta in saved_metadata if meta.get('tags')
+        ]
+        tags_summary += [
+            f"- {meta.get('domain', 'link')}: already saved"
+            for meta in saved_metadata if meta.get('already_saved')
+        ]
+        tags_block = "\n🏷️ Tags:\n" + "\n".join(tags_summary) if tags_summary else ""
+        return f"📖 **Saved {len(saved_metadata)} bookmarks!**{tags_block}"
+
+    def format_already_saved_reply(self, bookmarks):
+        """Reply for links that were already bookmarked; `bookmarks` are (id, title, domain)."""
+        if len(bookmarks) == 1:
+            _, title, domain = bookmarks[0]
+            return f"✅ **Already saved!**\n📰 {title}\n🔗 {domain}"
+        return f"✅ **All {len(bookmarks)} links were already saved.**"
+
+    async def _queue_tag_jobs(self, chat_id, entry_key, saved_metadata, hn_pair=False):
+        """
+        Queues the bookmarks still waiting for LLM tags.
+
+        The reply entry is remembered so that it can be updated when the tags arrive.
+        """
+        pending = [meta for meta in saved_metadata if meta.get('tags_status') == 'pending']
+        if not pending:
+            return
 
-        with open(filename, "w", encoding="utf-8") as f:
-            f.write(html_content)
+        self._pending_replies[(chat_id, entry_key)] = {'saved_metadata': saved_metadata, 'hn_pair': hn_pair}
+        for meta in pending:
+            self._pending_tags[meta['bookmark_id']] = (chat_id, entry_key)
+        try:
+            # One write per bookmark: the database thread commits them together
+            await asyncio.gather(*(self.db.write(enqueue_tag_job, meta['bookmark_id'], 'bot', chat_id) for meta in pending))
+        except Exception as e:
+            # The bookmarks stay pending and are re-queued when the worker restarts.
+            logger.error(f"Error queueing tag jobs: {e}")
+
+        if self.tag_worker is not None:
+            self.tag_worker.wake()
+
+    def _on_tags_ready(self, job, tags):
+        """TagWorker callback (worker thread): hands the reply update to the event loop."""
+        if self._loop is None:
+            return
+        asyncio.run_coroutine_threadsafe(self._update_reply_tags(job, tags), self._loop)
+
+    async def _update_reply_tags(self, job, tags):
+        """Updates the reply entry of a bookmark with its final tags."""
+        key = self._pending_tags.pop(job.bookmark_id, None)
+        entry = self._pending_replies.get(key)
+        if entry is None:
+            # Reply sent before a restart: the tags are in the database, nothing to edit.
+            return
+
+        for meta in entry['saved_metadata']:
+            if meta.get('bookmark_id') == job.bookmark_id:
+                meta['tags'] = tags
+                meta['tags_status'] = 'done'
+        if all(meta.get('tags_status') != 'pending' for meta in entry['saved_metadata']):
+            del self._pending_replies[key]
+
+        chat_id, entry_key = key
+        self.replies.post(chat_id, entry_key, self.format_saved_reply(entry['saved_metadata'], entry['hn_pair']))
+
+    async def send_export(self, message):
+        """
+        Replies to /export [html|json|csv] [gz] with the user's bookmarks as a document.
+
+        The export is streamed to a temporary file on a worker thread, through
+        its own connection: the database thread stays free for the ingest
+        pipeline while a large library is written out.
+        """
+        args = [arg.lower() for arg in message.command[1:]]
+        export_format = next((arg for arg in args if arg in EXPORT_FORMATS), 'html')
+        compress = any(arg in ('gz', 'gzip') for arg in args)
+        unknown = [arg for arg in args if arg not in EXPORT_FORMATS and arg not in ('gz', 'gzip')]
+        if unknown:
+            await message.reply("Usage: `/export [html|json|csv] [gz]`")
+            return
+
+        web_user_id = await asyncio.to_thread(self.user_router.resolve, getattr(message.from_user, "id", None))
+        if not web_user_id:
+            await self.reply_not_linked(message)
+            return
+
+        path, count = await asyncio.to_thread(export_to_file, self.db.db_path, web_user_id, export_format, compress)
+        try:
+            file_name = EXPORT_FORMATS[export_format][1] + ('.gz' if compress else '')
+            await message.reply_document(path, file_name=file_name, caption=f"📦 {count} bookmarks")
+        finally:
+            os.remove(path)
+
+    async def catch_up_missed_messages(self):
+        """
+        Queues the messages received while the bot was down.
+
+        For every chat with a checkpoint, the whole history newer than the
+        last processed message is read back (get_chat_history pages through
+        it in batches of 100) and each missed message goes through the ingest
+        queue like a live one, oldest first; the ingest workers save the
+        links and report in the chat's reply summary.
+
+        The chat checkpoint follows the queued messages. Live messages do not
+        move it until the chat is caught up (see hold_checkpoints), and if a
+        missed message cannot be queued it stays there until the next start.
+
+        Returns:
+            int: Number of missed messages found.
+        """
+        total = 0
+        if getattr(self, "_my_user_id", None) is None:
+            self._my_user_id = (await self.app.get_me()).id
+        checkpoints = await self.db.execute(get_chat_checkpoints)
+        for chat_id, last_message_id in checkpoints.items():
+            self._catching_up.setdefault(chat_id, set())
+            try:
+                missed, newest_id = await self._fetch_missed_messages(chat_id, last_message_id)
+            except Exception as e:
+                # Bot accounts may not read chat history; only user sessions can catch up.
+                logger.warning("Cannot read the history of chat %s for the catch-up: %s", chat_id, e)
+                self._catching_up.pop(chat_id, None)
+                continue
+            total += len(missed)
+            if await self._catch_up_chat(chat_id, missed):
+                live_ids = self._catching_up[chat_id]
+                await self.db.write(update_chat_checkpoint, chat_id, max(newest_id, *live_ids, last_message_id))
+                del self._catching_up[chat_id]
+        if total:
+            logger.info("Offline catch-up done: %s missed messages", total)
+        return total
+
+    async def hold_checkpoints(self):
+        """Keeps live messages from moving the checkpoints until the catch-up has read the history."""
+        for chat_id in await self.db.execute(get_chat_checkpoints):
+            self._catching_up.setdefault(chat_id, set())
+
+    async def _fetch_missed_messages(self, chat_id, last_message_id):
+        """
+        Returns (messages newer than `last_message_id`, oldest first and without
+        our own replies or the ones handled live, newest message id seen).
+        """
+        missed = []
+        newest_id = last_message_id
+        # No limit: pages go back until the checkpoint, however long the bot was down
+        async for message in self.app.get_chat_history(chat_id):
+            if message.id <= last_message_id:
+                break
+            newest_id = max(newest_id, message.id)
+            if message.id in self._catching_up[chat_id]:
+                continue
+            if self._is_own_reply(message):
+                continue
+            missed.append(message)
+        missed.reverse()
+        return missed, newest_id
 
-        logger.info(f"Bookmarks exported to {filename}")
-        return filename
+    def _is_own_reply(self, message):
+        """True for the replies this client sent (in user mode, our own links are not replies)."""
+        from_me = getattr(message.from_user, "id", None) == getattr(self, "_my_user_id", None)
+        if self.bot_token:
+            return from_me or bool(getattr(message.from_user, "is_bot", False))
+        return from_me and getattr(message, "reply_to_message_id", None) is not None
+
+    async def _catch_up_chat(self, chat_id, messages):
+        """
+        Queues the missed messages of one chat, oldest first, each in the same
+        transaction as its checkpoint. Returns False if one could not be
+        queued: the checkpoint stays before it.
+        """
+        queued = 0
+        handled_id = None  # newest message handled without a job (no links, unlinked sender, saved already)
+        for message in messages:
+            try:
+                urls = self.extract_message_urls(message)
+                from_user_id = getattr(message.from_user, "id", None)
+                web_user_id = await asyncio.to_thread(self.user_router.resolve, from_user_id) if urls else None
+                if web_user_id:
+                    urls, _ = await self.db.execute(self.skip_already_saved, web_user_id, urls)
+                if not web_user_id or not urls:
+                    handled_id = message.id
+                    continue
+                handled_id = None
+                if await self.db.write(self.queue_message, chat_id, message.id, urls, from_user_id) is None:
+                    continue  # already queued before the restart
+            except Exception as e:
+                logger.error("Catch-up stopped at message %s in chat %s, retried at the next start: %s",
+                             message.id, chat_id, e)
+                if handled_id is not None:
+                    await self.db.write(update_chat_checkpoint, chat_id, handled_id)
+                return False
+            queued += 1
+            # The header opens the summary that the ingest workers fill with the results
+            self.replies.post(
+                chat_id, 'catch-up',
+                f"🔄 **Catching up on {queued} message{'s' if queued > 1 else ''} sent while I was offline.**",
+            )
+            self._ingest_wakeup.set()
+        return True
+
+    def get_ingest_workers(self):
+        """Returns the number of ingest worker coroutines (env BOT_INGEST_WORKERS)."""
+        try:
+            return max(1, int(os.getenv("BOT_INGEST_WORKERS", DEFAULT_INGEST_WORKERS)))
+        except ValueError:
+            return DEFAULT_INGEST_WORKERS
+
+    async def _main(self):
+        """Runs the client together with the ingest workers and the background tag worker."""
+        self._loop = asyncio.get_running_loop()
+        self.db = AsyncDatabase(get_db_path())
+        self.db.start()
+        self._ingest_wakeup = asyncio.Event()
+        # Messages received before a crash or restart are picked up again
+        await self.db.execute(recover_ingest_jobs)
+        await self.hold_checkpoints()
+
+        self.tag_worker = TagWorker(origin='bot', on_tagged=self._on_tags_ready)
+        self.tag_worker.start()
+        metrics_server = self.start_metrics_server()
+        if hasattr(signal, "SIGUSR1"):
+            # Not available on Windows
+            self._loop.add_signal_handler(signal.SIGUSR1, self.dump_metrics)
+        workers = []
+        try:
+            async with self.app:
+                workers = [asyncio.create_task(self._ingest_worker(i)) for i in range(self.get_ingest_workers())]
+                workers.append(asyncio.create_task(self.catch_up_missed_messages()))
+                await idle()
+                await self.replies.drain()
+        finally:
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            self.tag_worker.stop()
+            if metrics_server is not None:
+                metrics_server.stop()
+            self.db.close()
+            self.user_router.close()
+
+    @staticmethod
+    def start_metrics_server():
+        """
+        Serves the pipeline metrics in the Prometheus text format on
+        BOT_METRICS_HOST:BOT_METRICS_PORT (default host 127.0.0.1). Returns the
+        server, or None when BOT_METRICS_PORT is not set.
+        """
+        raw_port = os.getenv("BOT_METRICS_PORT", "").strip()
+        if not raw_port:
+            return None
+        host = os.getenv("BOT_METRICS_HOST", "127.0.0.1")
+        try:
+            server = MetricsServer(int(raw_port), host=host)
+        except (ValueError, OSError) as e:
+            logger.error("Could not start the metrics endpoint on %s:%s: %s", host, raw_port, e)
+            return None
+        server.start()
+        logger.info("Pipeline metrics served on http://%s:%s/metrics", host, server.port)
+        return server
+
+    @staticmethod
+    def dump_metrics():
+        """
+        Writes the pipeline metrics as JSON (SIGUSR1 handler) to BOT_METRICS_DUMP,
+        by default bookmark-bot-metrics-<pid>.json in the temporary directory.
+        """
+        path = os.getenv("BOT_METRICS_DUMP") or os.path.join(
+            tempfile.gettempdir(), f"bookmark-bot-metrics-{os.getpid()}.json"
+        )
+        try:
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(get_metrics().snapshot(), f, indent=2)
+        except OSError as e:
+            logger.error("Could not write the metrics dump to %s: %s", path, e)
+            return None
+        logger.info("Pipeline metrics written to %s", path)
+        return path
 
     def run(self):
         """Start the bot with error handling for time sync issues."""
         try:
             logger.info("Starting the bot...")
-            self.app.run()
+            self.app.run(self._main())
         except Exception as e:
             if "BadMsgNotification" in str(e):
                 logger.error("Time synchronization error detected. Please run as admin:")
@@ -544,9 +1343,6 @@ if __name__ == "__main__":
     try:
         bot = BookmarkBot()
 
-        # Export existing bookmarks (optional)
-        # bot.export_bookmarks_html()
-
         # Start the bot
         bot.run()
     except Exception:
@@ -0,0 +1,362 @@
+"""
+Imports the links of a Telegram Desktop chat export (result.json), e.g. the
+Saved Messages from before the bot existed.
+
+The export is streamed message by message, links already saved are skipped,
+metadata is scraped with bounded concurrency and bookmarks are inserted in
+batches, each in its own short transaction so the live bot and web server keep
+working. Progress is checkpointed next to the export: re-running the same
+command resumes where the previous run stopped.
+
+Usage:
+  python telegram_bot/scripts/import_telegram_export.py path/to/result.json [--username alice]
+      [--workers 8] [--batch-size 500] [--skip-metadata] [--llm-tags] [--restart]
+"""
+import os
+import re
+import sys
+import json
+import time
+import sqlite3
+import logging
+import argparse
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+# Add the project root to the path to import shared modules
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.dirname(os.path.dirname(SCRIPT_DIR))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from shared.database import get_db_path, init_database
+from shared.tagging import rebuild_term_stats
+from shared.utils import extract_domain, get_article_metadata, generate_tags, llm_tagging_enabled
+from telegram_bot.bot import BookmarkBot
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1 << 16
+SEPARATOR_RE = re.compile(r"[\s,]*")
+
+
+def iter_export_messages(path, chunk_size=CHUNK_SIZE):
+    """
+    Yields the objects of the top-level "messages" array of a chat export
+    without loading the whole file.
+    """
+    decoder = json.JSONDecoder()
+    with open(path, encoding='utf-8') as f:
+        buffer = ''
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                return
+            buffer += chunk
+            start = buffer.find('"messages"')
+            bracket = buffer.find('[', start) if start != -1 else -1
+            if bracket != -1:
+                pos = bracket + 1
+                break
+            # Keep a tail in case the key is split across two chunks
+            buffer = buffer[-16:] if start == -1 else buffer
+
+        while True:
+            pos = SEPARATOR_RE.match(buffer, pos).end()
+            if pos < len(buffer) and buffer[pos] == ']':
+                return
+            try:
+                message, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    raise ValueError(f"Truncated export: {path}")
+                buffer = buffer[pos:] + chunk
+                pos = 0
+                continue
+            yield message
+            pos = end
+
+
+def message_text(message):
+    """Plain text of an export message ("text" is a string or a list of parts)."""
+    text = message.get('text', '')
+    if isinstance(text, list):
+        return ''.join(part if isinstance(part, str) else part.get('text', '') for part in text)
+    return text or ''
+
+
+def message_urls(message):
+    """
+    URLs of an export message, following the bot: link entities first (URLs
+    and text links), then BookmarkBot.extract_urls on the plain text.
+    """
+    entities = message.get('text_entities')
+    if entities is None and isinstance(message.get('text'), list):
+        # Older exports keep the entities inline in "text"
+        entities = [part for part in message['text'] if isinstance(part, dict)]
+
+    urls = []
+    for entity in entities or ():
+        if entity.get('type') == 'link':
+            urls.append(entity.get('text', ''))
+        elif entity.get('type') == 'text_link' and entity.get('href'):
+            urls.append(entity['href'])
+    if not urls:
+        urls = BookmarkBot.extract_urls(message_text(message))
+    return sorted(set(url for url in urls if url))
+
+
+def message_links(message):
+    """Returns (url, comments_url) pairs to save, pairing an article with its HN discussion."""
+    urls = message_urls(message)
+    hn_pair = BookmarkBot.split_hn_pair(urls)
+    if hn_pair:
+        return [hn_pair]
+    return [(url, BookmarkBot.get_hn_comments_url(url)) for url in urls]
+
+
+def _sender_id(message):
+    from_id = str(message.get('from_id') or '')
+    digits = from_id[4:] if from_id.startswith('user') else from_id
+    return int(digits) if digits.isdigit() else None
+
+
+def _message_date(message):
+    """UTC timestamp in the format used by saved_at (CURRENT_TIMESTAMP)."""
+    if message.get('date_unixtime'):
+        return datetime.fromtimestamp(int(message['date_unixtime']), timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+    if message.get('date'):
+        return message['date'].replace('T', ' ')
+    return None
+
+
+def _enrich(url, comments_url, skip_metadata):
+    """Scrapes the metadata of one link (runs in the worker pool)."""
+    if skip_metadata:
+        return {"title": url, "description": "", "image_url": "", "domain": extract_domain(url)}
+    metadata = get_article_metadata(url)
+    if comments_url and "news.ycombinator.com" not in url:
+        hn_metadata = get_article_metadata(comments_url)
+        if hn_metadata.get("description"):
+            metadata["description"] = hn_metadata["description"]
+    return metadata
+
+
+class ImportProgress:
+    """Counters plus a periodic throughput report."""
+
+    def __init__(self, report_every=5.0):
+        self.messages = 0
+        self.links = 0
+        self.duplicates = 0
+        self.imported = 0
+        self.started_at = time.monotonic()
+        self.report_every = report_every
+        self._last_report = self.started_at
+
+    def as_dict(self):
+        elapsed = max(time.monotonic() - self.started_at, 1e-9)
+        return {
+            'messages': self.messages,
+            'links': self.links,
+            'duplicates': self.duplicates,
+            'imported': self.imported,
+            'seconds': round(elapsed, 1),
+            'messages_per_second': round(self.messages / elapsed, 1),
+            'imported_per_second': round(self.imported / elapsed, 1),
+        }
+
+    def maybe_report(self, force=False):
+        now = time.monotonic()
+        if force or now - self._last_report >= self.report_every:
+            self._last_report = now
+            stats = self.as_dict()
+            logger.info(
+                "%(messages)s messages, %(links)s links, %(imported)s imported, %(duplicates)s duplicates "
+                "in %(seconds)ss (%(messages_per_second)s msg/s, %(imported_per_second)s bookmarks/s)",
+                stats,
+            )
+
+
+def _checkpoint_path(export_path):
+    return f"{export_path}.import-checkpoint.json"
+
+
+def _load_checkpoint(export_path):
+    try:
+        with open(_checkpoint_path(export_path), encoding='utf-8') as f:
+            checkpoint = json.load(f)
+    except (OSError, ValueError):
+        return None
+    # A different file under the same name restarts from scratch
+    if checkpoint.get('size') != os.path.getsize(export_path):
+        return None
+    return checkpoint
+
+
+def _save_checkpoint(export_path, next_message, completed=False):
+    path = _checkpoint_path(export_path)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({'size': os.path.getsize(export_path), 'next_message': next_message, 'completed': completed}, f)
+    os.replace(tmp_path, path)
+
+
+def _insert_batch(conn, rows, queue_llm_tags):
+    """Inserts one batch in a single short transaction; returns the number of new bookmarks."""
+    with conn:
+        cursor = conn.cursor()
+        cursor.executemany(
+            """
+            INSERT INTO bookmarks
+            (user_id, url, title, description, image_url, domain, tags, tags_status,
+             telegram_user_id, telegram_message_id, comments_url, saved_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, COALESCE(?, CURRENT_TIMESTAMP))
+            ON CONFLICT(user_id, url) DO NOTHING
+            """,
+            rows,
+        )
+        # rowcount sums the rows inserted by each execution (changes made by triggers are not counted)
+        inserted = cursor.rowcount
+        if queue_llm_tags:
+            # Picked up by the web server's tag worker (shared/tag_queue.py)
+            cursor.execute(
+                """
+                INSERT OR IGNORE INTO tag_jobs (bookmark_id, origin, next_attempt_at)
+                SELECT id, 'web', ? FROM bookmarks
+                WHERE tags_status = 'pending' AND id NOT IN (SELECT bookmark_id FROM tag_jobs)
+                """,
+                (time.time(),),
+            )
+    return inserted
+
+
+def import_export(export_path, db_path=None, username=None, workers=8, batch_size=500,
+                  skip_metadata=False, llm_tags=False, restart=False, report_every=5.0):
+    """
+    Imports the links of a chat export. Returns the final progress counters.
+
+    Args:
+        export_path (str): Path of result.json.
+        db_path (str, optional): Database path; defaults to get_db_path().
+        username (str, optional): Web user owning the bookmarks; defaults to the first user.
+        workers (int): Concurrent metadata scrapes.
+        batch_size (int): Bookmarks per insert transaction (and checkpoint).
+        skip_metadata (bool): Do not scrape, use the URL as title.
+        llm_tags (bool): Queue the new bookmarks for LLM tagging.
+        restart (bool): Ignore the checkpoint of a previous run.
+    """
+    db_path = db_path or get_db_path()
+    conn = sqlite3.connect(db_path, uri=db_path.startswith('file:'), timeout=30)
+    try:
+        init_database(conn)
+        if username:
+            row = conn.execute("SELECT id FROM users WHERE username = ?", (username,)).fetchone()
+        else:
+            row = conn.execute("SELECT id FROM users ORDER BY id LIMIT 1").fetchone()
+        if not row:
+            raise ValueError(f"Web user not found: {username or '(no users)'}")
+        user_id = row[0]
+
+        checkpoint = None if restart else _load_checkpoint(export_path)
+        first_message = checkpoint['next_message'] if checkpoint else 0
+        if first_message:
+            logger.info("Resuming from message %s", first_message)
+
+        seen_urls = {url for (url,) in conn.execute("SELECT url FROM bookmarks WHERE user_id = ?", (user_id,))}
+        queue_llm_tags = llm_tags and llm_tagging_enabled()
+        tags_status = 'pending' if queue_llm_tags else 'done'
+        progress = ImportProgress(report_every)
+        rows = []
+        # Checkpoint = first message not fully committed yet
+        next_message = first_message
+
+        def flush(upto_message):
+            nonlocal rows, next_message
+            if rows:
+                progress.imported += _insert_batch(conn, rows, queue_llm_tags)
+                rows = []
+            next_message = upto_message
+            _save_checkpoint(export_path, next_message)
+
+        def consume(item, future):
+            msg_index, message, url, comments_url = item
+            metadata = future.result()
+            tags = generate_tags(
+                f"{metadata.get('title', '')}\n{metadata.get('description', '')}".strip(), user_id=user_id
+            )
+            rows.append((
+                user_id, url, metadata.get('title') or url, metadata.get('description', ''),
+                metadata.get('image_url', ''), metadata.get('domain') or extract_domain(url),
+                json.dumps(tags, ensure_ascii=False), tags_status,
+                _sender_id(message), message.get('id'), comments_url, _message_date(message),
+            ))
+            if len(rows) >= batch_size:
+                # Every message before msg_index is complete; msg_index itself may not be.
+                flush(msg_index)
+
+        window = deque()
+        with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="import-metadata") as executor:
+            for msg_index, message in enumerate(iter_export_messages(export_path)):
+                if msg_index < first_message:
+                    continue
+                progress.messages += 1
+                if message.get('type') != 'message':
+                    continue
+                for url, comments_url in message_links(message):
+                    progress.links += 1
+                    if url in seen_urls:
+                        progress.duplicates += 1
+                        continue
+                    seen_urls.add(url)
+                    future = executor.submit(_enrich, url, comments_url, skip_metadata)
+                    window.append(((msg_index, message, url, comments_url), future))
+                    # Bounded concurrency and memory: wait for the oldest scrape
+                    while len(window) >= workers * 2:
+                        consume(*window.popleft())
+                progress.maybe_report()
+
+            while window:
+                consume(*window.popleft())
+
+        flush(first_message + progress.messages)
+        _save_checkpoint(export_path, next_message, completed=True)
+
+        if progress.imported:
+            # Refresh the TF-IDF statistics once instead of per bookmark
+            with conn:
+                rebuild_term_stats(conn.cursor())
+        progress.maybe_report(force=True)
+        return progress.as_dict()
+    finally:
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import links from a Telegram Desktop chat export (result.json)")
+    parser.add_argument('export', help='Path of result.json')
+    parser.add_argument('--username', help='Web user owning the bookmarks (default: first user)')
+    parser.add_argument('--workers', type=int, default=8, help='Concurrent metadata scrapes')
+    parser.add_argument('--batch-size', type=int, default=500, help='Bookmarks per insert transaction')
+    parser.add_argument('--skip-metadata', action='store_true', help='Do not scrape pages, use the URL as title')
+    parser.add_argument('--llm-tags', action='store_true', help='Queue imported bookmarks for LLM tagging')
+    parser.add_argument('--restart', action='store_true', help='Ignore the checkpoint of a previous run')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    stats = import_export(
+        args.export,
+        username=args.username,
+        workers=args.workers,
+        batch_size=args.batch_size,
+        skip_metadata=args.skip_metadata,
+        llm_tags=args.llm_tags,
+        restart=args.restart,
+    )
+    print(json.dumps(stats))
+
+
+if __name__ == '__main__':
+    main()
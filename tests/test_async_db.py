@@ -0,0 +1,77 @@
+import asyncio
+import sqlite3
+import threading
+
+import pytest
+
+from shared.async_db import AsyncDatabase
+from shared.database import init_database
+from shared.ingest_queue import claim_ingest_job, enqueue_ingest_job, get_chat_checkpoints, update_chat_checkpoint
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    """File database, shared by the database thread and the test's own connections."""
+    path = str(tmp_path / "bookmarks.db")
+    conn = sqlite3.connect(path)
+    init_database(conn)
+    conn.close()
+    return path
+
+
+@pytest.fixture
+def db(db_path):
+    db = AsyncDatabase(db_path, busy_timeout=0.05, batch_window=0.05)
+    db.start()
+    yield db
+    db.close()
+
+
+def _fail(cursor):
+    cursor.execute("INSERT INTO telegram_chat_state (chat_id, last_message_id) VALUES (2, 99)")
+    raise ValueError("bad write")
+
+
+def test_close_writes_share_one_transaction(db, db_path):
+    """Concurrent writes are committed together; a failing one only undoes itself."""
+    transactions = []
+    db.submit(lambda conn: conn.set_trace_callback(transactions.append)).result()
+
+    async def run():
+        return await asyncio.gather(
+            db.write(update_chat_checkpoint, 1, 10),
+            db.write(_fail),
+            db.write(enqueue_ingest_job, 1, 10, ["https://example.com"]),
+            return_exceptions=True,
+        )
+
+    first, failed, job_id = asyncio.run(run())
+    assert first is None and isinstance(failed, ValueError) and job_id == 1
+    assert transactions.count("BEGIN IMMEDIATE") == 1
+
+    conn = sqlite3.connect(db_path)
+    assert get_chat_checkpoints(conn.cursor()) == {1: 10}
+    conn.close()
+
+
+def test_execute_runs_calls_with_their_own_transaction(db):
+    db.submit(enqueue_ingest_job, 1, 10, ["https://example.com"], write=True).result()
+
+    job = asyncio.run(db.execute(claim_ingest_job))
+
+    assert (job.chat_id, job.message_id, job.urls) == (1, 10, ["https://example.com"])
+
+
+def test_write_waits_for_the_lock_held_by_another_process(db, db_path):
+    """A busy database delays the batch (busy timeout, then backoff) instead of failing it."""
+    other = sqlite3.connect(db_path, isolation_level=None, check_same_thread=False)
+    other.execute("BEGIN IMMEDIATE")
+    release = threading.Timer(0.2, lambda: other.execute("COMMIT"))
+    release.start()
+    try:
+        db.submit(update_chat_checkpoint, 1, 10, write=True).result(timeout=5)
+    finally:
+        release.join()
+        other.close()
+
+    assert db.submit(get_chat_checkpoints).result() == {1: 10}
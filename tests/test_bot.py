@@ -1,9 +1,21 @@
+import os
+import gzip
+import json
 import pytest
+import asyncio
 import sqlite3
 from unittest.mock import Mock
 
-from telegram_bot.bot import BookmarkBot
+from pyrogram.enums import MessageEntityType
+from pyrogram.errors import FloodWait
+
+from telegram_bot.bot import BookmarkBot, ReplyAggregator
 from shared.database import init_database
+from shared.telegram_links import TelegramUserRouter
+from shared.saved_urls import SavedUrlIndex
+from shared.async_db import AsyncDatabase
+from shared.search import SearchCache
+from shared.ingest_queue import claim_ingest_job, get_chat_checkpoints, update_chat_checkpoint
 
 # --- Unit Tests for Helper Functions ---
 
@@ -76,8 +88,19 @@ def db_for_bot(mocker):
                    (1, 'webuser', 'somehash'))
     conn.commit()
 
+    router = TelegramUserRouter(db_uri)
+    mocker.patch.object(BookmarkBot, 'user_router', router, create=True)
+    mocker.patch.object(BookmarkBot, 'saved_urls', SavedUrlIndex(), create=True)
+    mocker.patch.object(BookmarkBot, 'search_cache', SearchCache(), create=True)
+    db = AsyncDatabase(db_uri)
+    db.start()
+    mocker.patch.object(BookmarkBot, 'db', db, create=True)
+
     yield conn
 
+    db.close()
+    router.close()
+
     conn.close()
 
 def test_save_bookmark_integration(bot_instance, db_for_bot):
@@ -115,3 +138,431 @@ def test_save_bookmark_integration(bot_instance, db_for_bot):
     assert saved_data[3] == "Integration Test Bookmark"
     assert saved_data[9] == 12345 # telegram_user_id
     assert saved_data[10] == 54321 # telegram_message_id
+
+
+def test_ingest_urls_pairs_article_with_hn_comments(bot_instance, db_for_bot, mocker):
+    """An article link and its HN comments link are saved as a single bookmark."""
+    mocker.patch('telegram_bot.bot.get_article_metadata', side_effect=lambda url: {
+        "title": f"Title of {url}",
+        "description": "HN discussion" if "ycombinator" in url else "",
+        "image_url": "",
+        "domain": "test.com",
+    })
+    source = Mock()
+    source.from_user.id = 12345
+    source.id = 54321
+    urls = ["https://news.ycombinator.com/item?id=1", "https://test.com/article"]
+
+    saved_metadata, hn_pair = bot_instance.ingest_urls(urls, source)
+
+    assert hn_pair is True
+    assert len(saved_metadata) == 1
+    row = db_for_bot.execute(
+        "SELECT url, description, comments_url FROM bookmarks WHERE url = ?", ("https://test.com/article",)
+    ).fetchone()
+    assert row == ("https://test.com/article", "HN discussion", "https://news.ycombinator.com/item?id=1")
+
+
+def test_save_bookmark_keeps_existing_bookmark(bot_instance, db_for_bot):
+    """Re-sharing a saved link keeps its id, read state and edits."""
+    mock_message = Mock()
+    mock_message.from_user.id = 12345
+    mock_message.id = 1
+    url = "https://test.com/again"
+    metadata = {"title": "First", "description": "", "image_url": "", "domain": "test.com"}
+    assert bot_instance.save_bookmark(url, dict(metadata), mock_message) is True
+    db_for_bot.execute("UPDATE bookmarks SET is_read = 1, title = 'Edited' WHERE url = ?", (url,))
+    db_for_bot.commit()
+    bookmark_id = db_for_bot.execute("SELECT id FROM bookmarks WHERE url = ?", (url,)).fetchone()[0]
+
+    second = dict(metadata, title="Second")
+    assert bot_instance.save_bookmark(url, second, mock_message) is True
+
+    assert second["already_saved"] is True
+    row = db_for_bot.execute("SELECT id, title, is_read, last_seen_at FROM bookmarks WHERE url = ?", (url,)).fetchone()
+    assert row[:3] == (bookmark_id, "Edited", 1)
+    assert row[3] is not None
+    assert bot_instance.saved_urls.might_contain(1, url)
+
+
+class FakeCatchUpClient:
+    """Minimal client: a chat history (newest first) and a recorder of sent messages."""
+
+    def __init__(self, history):
+        self.history = history
+        self.sent = []
+
+    async def get_me(self):
+        return Mock(id=999)
+
+    async def get_chat_history(self, chat_id, limit=0):
+        for message in self.history[:limit or None]:
+            yield message
+
+    async def send_message(self, chat_id, text, reply_to_message_id=None):
+        self.sent.append((chat_id, text))
+        return Mock(id=500 + len(self.sent))
+
+    async def edit_message_text(self, chat_id, message_id, text):
+        self.sent.append((chat_id, message_id, text))
+
+
+def _history_message(message_id, text, from_id=12345, reply_to=None):
+    message = Mock(id=message_id, text=text, caption=None, caption_entities=None, web_page=None,
+                   reply_to_message_id=reply_to)
+    message.from_user.id = from_id
+    message.entities = [Mock(type=MessageEntityType.URL, offset=0, length=len(text))]
+    return message
+
+
+def _catch_up_bot(bot_instance, client):
+    bot_instance.app = client
+    bot_instance.bot_token = None
+    bot_instance._my_user_id = 999
+    bot_instance._catching_up = {}
+    bot_instance._pending_replies = {}
+    bot_instance._pending_tags = {}
+    bot_instance.replies = ReplyAggregator(client, edit_window=0.01)
+    bot_instance.tag_worker = None
+
+
+def _run_catch_up(bot_instance):
+    async def run():
+        bot_instance._ingest_wakeup = asyncio.Event()
+        await bot_instance.hold_checkpoints()
+        missed = await bot_instance.catch_up_missed_messages()
+        await bot_instance.replies.drain()
+        return missed
+    return asyncio.run(run())
+
+
+def _ingest_jobs(conn):
+    return conn.execute("SELECT chat_id, message_id FROM ingest_jobs ORDER BY message_id").fetchall()
+
+
+def test_catch_up_queues_only_missed_messages(bot_instance, db_for_bot, mocker):
+    """Messages newer than the checkpoint go through the ingest queue, then the workers save them."""
+    mocker.patch('telegram_bot.bot.get_article_metadata', side_effect=lambda url: {
+        "title": f"Title of {url}", "description": "", "image_url": "", "domain": "test.com",
+    })
+    update_chat_checkpoint(db_for_bot.cursor(), 42, 10)
+    db_for_bot.commit()
+    client = FakeCatchUpClient([
+        _history_message(13, "https://test.com/reply", from_id=999, reply_to=12),
+        _history_message(12, "https://test.com/new"),
+        _history_message(11, "https://test.com/live"),
+        _history_message(10, "https://test.com/old"),
+    ])
+    _catch_up_bot(bot_instance, client)
+    mocker.patch.object(bot_instance, 'extract_message_urls', side_effect=lambda m: [m.text])
+
+    async def get_chat_history(chat_id, limit=0):
+        bot_instance._catching_up[42].add(11)  # handled by the live handler meanwhile
+        async for message in FakeCatchUpClient.get_chat_history(client, chat_id, limit):
+            yield message
+    client.get_chat_history = get_chat_history
+
+    assert _run_catch_up(bot_instance) == 1
+
+    assert _ingest_jobs(db_for_bot) == [(42, 12)]
+    assert get_chat_checkpoints(db_for_bot.cursor()) == {42: 13}
+    assert bot_instance._catching_up == {}
+    assert len(client.sent) == 1 and "Catching up on 1 message sent" in client.sent[0][1]
+
+    async def work():
+        await bot_instance._run_ingest_job(await bot_instance.db.execute(claim_ingest_job))
+        await bot_instance.replies.drain()
+    asyncio.run(work())
+    assert {row[0] for row in db_for_bot.execute("SELECT url FROM bookmarks")} == {"https://test.com/new"}
+
+
+def test_catch_up_skips_chats_without_readable_history(bot_instance, db_for_bot):
+    """Bot accounts cannot read chat history: the catch-up logs and moves on."""
+    update_chat_checkpoint(db_for_bot.cursor(), 42, 10)
+    db_for_bot.commit()
+
+    class NoHistoryClient(FakeCatchUpClient):
+        async def get_chat_history(self, chat_id, limit=0):
+            raise RuntimeError("BOT_METHOD_INVALID")
+            yield
+
+    _catch_up_bot(bot_instance, NoHistoryClient([]))
+    bot_instance.bot_token = "token"
+
+    assert _run_catch_up(bot_instance) == 0
+    assert bot_instance.app.sent == []
+    assert bot_instance._catching_up == {}  # live messages move the checkpoint again
+
+
+def test_catch_up_reads_the_whole_history_back_to_the_checkpoint(bot_instance, db_for_bot, mocker):
+    """A long outage is caught up entirely, not only its newest messages."""
+    update_chat_checkpoint(db_for_bot.cursor(), 42, 10)
+    db_for_bot.commit()
+    client = FakeCatchUpClient([_history_message(message_id, "chatter") for message_id in range(700, 11, -1)]
+                               + [_history_message(11, "https://test.com/oldest")])
+    _catch_up_bot(bot_instance, client)
+    mocker.patch.object(bot_instance, 'extract_message_urls',
+                        side_effect=lambda m: [m.text] if m.text.startswith('https') else [])
+
+    assert _run_catch_up(bot_instance) == 690
+    assert _ingest_jobs(db_for_bot) == [(42, 11)]
+    assert get_chat_checkpoints(db_for_bot.cursor()) == {42: 700}
+
+
+def test_catch_up_holds_the_checkpoint_before_a_message_it_could_not_queue(bot_instance, db_for_bot, mocker):
+    """Neither the catch-up nor live messages move the checkpoint past a missed message left unqueued."""
+    update_chat_checkpoint(db_for_bot.cursor(), 42, 10)
+    db_for_bot.commit()
+    client = FakeCatchUpClient([
+        _history_message(14, "https://test.com/after"),
+        _history_message(13, "https://test.com/broken"),
+        _history_message(12, "https://test.com/first"),
+        _history_message(11, "chatter"),
+    ])
+    _catch_up_bot(bot_instance, client)
+    mocker.patch.object(bot_instance, 'extract_message_urls',
+                        side_effect=lambda m: [m.text] if m.text.startswith('https') else [])
+
+    def skip_already_saved(conn, user_id, urls):
+        if urls == ["https://test.com/broken"]:
+            raise sqlite3.OperationalError("database is locked")
+        return urls, []
+    mocker.patch.object(bot_instance, 'skip_already_saved', side_effect=skip_already_saved)
+
+    assert _run_catch_up(bot_instance) == 4
+    assert _ingest_jobs(db_for_bot) == [(42, 12)]
+    assert get_chat_checkpoints(db_for_bot.cursor()) == {42: 12}
+
+    live = _history_message(20, "https://test.com/live")
+    live.chat.id = 42
+
+    async def receive():
+        await bot_instance.process_message_for_urls(live)
+        await bot_instance.replies.drain()
+    asyncio.run(receive())
+
+    assert _ingest_jobs(db_for_bot) == [(42, 12), (42, 20)]
+    assert get_chat_checkpoints(db_for_bot.cursor()) == {42: 12}
+
+
+def test_live_message_moves_the_checkpoint_only_once_queued(bot_instance, db_for_bot, mocker):
+    """A failure before the job is stored leaves the message to the catch-up."""
+    client = FakeCatchUpClient([])
+    bot_instance._catching_up = {}
+    bot_instance.replies = ReplyAggregator(client)
+    mocker.patch.object(bot_instance, 'extract_message_urls', side_effect=lambda m: [m.text])
+    message = _history_message(20, "https://test.com/queued")
+    message.chat.id = 42
+
+    async def run():
+        bot_instance._ingest_wakeup = asyncio.Event()
+        await bot_instance.process_message_for_urls(message)
+        await bot_instance.replies.drain()
+
+    mocker.patch.object(bot_instance, 'skip_already_saved', side_effect=RuntimeError("database is locked"))
+    with pytest.raises(RuntimeError):
+        asyncio.run(run())
+    assert get_chat_checkpoints(db_for_bot.cursor()) == {}
+
+    mocker.patch.object(bot_instance, 'skip_already_saved', side_effect=lambda conn, user_id, urls: (urls, []))
+    asyncio.run(run())
+    assert get_chat_checkpoints(db_for_bot.cursor()) == {42: 20}
+    assert _ingest_jobs(db_for_bot) == [(42, 20)]
+
+
+def test_unlinked_contacts_get_the_notice_only_from_a_bot(bot_instance, db_for_bot, mocker):
+    """A user session ignores unlinked contacts silently, but answers in the owner's Saved Messages."""
+    db_for_bot.execute("INSERT INTO telegram_links (telegram_user_id, user_id) VALUES (12345, 1)")
+    db_for_bot.commit()
+    client = FakeCatchUpClient([])
+    _catch_up_bot(bot_instance, client)
+    mocker.patch.object(bot_instance, 'extract_message_urls', side_effect=lambda m: [m.text])
+    contact = _history_message(20, "https://test.com/a", from_id=777)
+    contact.chat.id = 777
+    saved_messages = _history_message(21, "https://test.com/b", from_id=999)
+    saved_messages.chat.id = 999
+
+    async def run(message):
+        bot_instance._ingest_wakeup = asyncio.Event()
+        await bot_instance.process_message_for_urls(message)
+        await bot_instance.replies.drain()
+
+    asyncio.run(run(contact))
+    assert client.sent == []
+    assert get_chat_checkpoints(db_for_bot.cursor()) == {777: 20}
+
+    asyncio.run(run(saved_messages))
+    assert [text for chat_id, text in client.sent] == [bot_instance.not_linked_text(saved_messages)]
+
+    bot_instance.bot_token = "token"
+    asyncio.run(run(contact))
+    assert client.sent[-1] == (777, bot_instance.not_linked_text(contact))
+    assert _ingest_jobs(db_for_bot) == []
+
+
+def test_reply_aggregator_coalesces_a_burst_into_one_summary():
+    """Twenty acknowledgments and results cost one send and one edit."""
+    client = FakeCatchUpClient([])
+    replies = ReplyAggregator(client, edit_window=0.01)
+
+    async def run():
+        for message_id in range(1, 21):
+            replies.post(42, message_id, f"⏳ Queued link {message_id}", reply_to=message_id)
+        await asyncio.sleep(0)
+        for message_id in range(1, 21):
+            replies.post(42, message_id, f"📖 Saved link {message_id}")
+        await replies.drain()
+
+    asyncio.run(run())
+
+    assert [len(call) for call in client.sent] == [2, 3]
+    chat_id, message_id, text = client.sent[1]
+    assert (chat_id, message_id) == (42, 501)
+    assert "Saved link 20" in text and "Queued" not in text
+
+
+def test_reply_aggregator_waits_out_flood_wait():
+    """A FloodWait pauses the chat, then the latest text is sent."""
+    class FloodingClient(FakeCatchUpClient):
+        flooded = False
+
+        async def send_message(self, chat_id, text, reply_to_message_id=None):
+            if not self.flooded:
+                self.flooded = True
+                raise FloodWait(value=0)
+            return await super().send_message(chat_id, text, reply_to_message_id)
+
+    client = FloodingClient([])
+    replies = ReplyAggregator(client, edit_window=0.01)
+
+    async def run():
+        replies.post(42, 1, "first")
+        await asyncio.sleep(0)
+        replies.post(42, 2, "second")
+        await replies.drain()
+
+    asyncio.run(run())
+
+    assert client.sent == [(42, "first\n\nsecond")]
+
+
+def test_inline_search_pages_with_a_cursor_and_caches_answers(bot_instance, db_for_bot, mocker):
+    for n in range(3):
+        db_for_bot.execute(
+            "INSERT INTO bookmarks (user_id, url, title, domain, tags) VALUES (1, ?, ?, 'test.com', '[\"python\"]')",
+            (f"https://test.com/{n}", f"Python tip {n}"),
+        )
+    db_for_bot.commit()
+    mocker.patch('telegram_bot.bot.INLINE_PAGE_SIZE', 2)
+    search = mocker.spy(bot_instance.db, 'execute')
+
+    class FakeInlineQuery:
+        def __init__(self, query, offset=""):
+            self.query, self.offset = query, offset
+            self.from_user = Mock(id=12345)
+
+        async def answer(self, results, **kwargs):
+            self.results, self.kwargs = results, kwargs
+
+    async def run():
+        first = FakeInlineQuery("PYTHON  tip")
+        await bot_instance.answer_inline_search(first)
+        second = FakeInlineQuery("python tip", first.kwargs["next_offset"])
+        await bot_instance.answer_inline_search(second)
+        await bot_instance.answer_inline_search(FakeInlineQuery("python tip"))
+        return first, second
+
+    first, second = asyncio.run(run())
+
+    assert [r.title for r in first.results] == ["Python tip 2", "Python tip 1"]
+    assert [r.title for r in second.results] == ["Python tip 0"]
+    assert second.kwargs["next_offset"] == ""
+    assert search.call_count == 2  # the repeated first page came from the cache
+
+
+class FakeCallbackQuery:
+    """Button press on a list message: records the edit and the answer."""
+
+    def __init__(self, data):
+        self.data = data
+        self.from_user = Mock(id=12345)
+        self.message = self
+        self.edits = []
+        self.answers = []
+
+    async def edit_text(self, text, reply_markup=None, disable_web_page_preview=None):
+        self.edits.append((text, reply_markup))
+
+    async def answer(self, text=None, show_alert=None):
+        self.answers.append(text)
+
+
+def _buttons(markup):
+    return [button.callback_data for row in markup.inline_keyboard for button in row]
+
+
+def test_unread_list_pages_with_keyset_buttons_and_marks_read(bot_instance, db_for_bot, mocker):
+    db_for_bot.executemany(
+        "INSERT INTO bookmarks (id, user_id, url, title, domain, is_read) VALUES (?, 1, ?, ?, 'test.com', ?)",
+        [(n, f"https://test.com/{n}", f"Article {n}", int(n == 4)) for n in range(1, 8)],
+    )
+    db_for_bot.commit()
+    mocker.patch('telegram_bot.bot.LIST_PAGE_SIZE', 2)
+
+    async def run():
+        first_text, first_markup = await bot_instance.render_bookmark_page(1, 'u', "")
+        older = FakeCallbackQuery("u:b:6:")
+        await bot_instance.answer_list_callback(older)
+        read = FakeCallbackQuery(_buttons(older.edits[0][1])[0])
+        await bot_instance.answer_list_callback(read)
+        return first_text, first_markup, older, read
+
+    first_text, first_markup, older, read = asyncio.run(run())
+
+    assert "Article 7" in first_text and "Article 6" in first_text
+    assert _buttons(first_markup) == ["read:7:", "read:6:", "u:b:6:"]
+    older_text, older_markup = older.edits[0]
+    assert "Article 5" in older_text and "Article 3" in older_text  # 4 is already read
+    assert _buttons(older_markup) == ["read:5:6", "read:3:6", "u:a:5:", "u:b:3:"]
+
+    read_text, _ = read.edits[0]
+    assert "Article 5" not in read_text and "Article 3" in read_text and "Article 2" in read_text
+    assert read.answers == ["Marked as read ✅"]
+    assert db_for_bot.execute("SELECT is_read FROM bookmarks WHERE id = 5").fetchone() == (1,)
+
+
+def test_search_query_is_shortened_to_fit_the_buttons(bot_instance):
+    query = bot_instance.fit_callback_query('s', "è" * 40)
+    assert len(f"s:b:{2 ** 63}:{query}".encode("utf-8")) <= 64
+
+
+def test_export_command_sends_a_compressed_document(bot_instance, db_for_bot):
+    db_for_bot.executemany(
+        "INSERT INTO bookmarks (user_id, url, title, domain) VALUES (1, ?, ?, 'test.com')",
+        [(f"https://test.com/{n}", f"Article {n}") for n in range(3)],
+    )
+    db_for_bot.commit()
+    sent = {}
+
+    class FakeExportMessage:
+        command = ["export", "json", "gz"]
+        from_user = Mock(id=12345)
+
+        async def reply_document(self, document, file_name=None, caption=None):
+            with gzip.open(document, "rt", encoding="utf-8") as f:
+                sent.update(path=document, file_name=file_name, caption=caption, data=json.load(f))
+
+    asyncio.run(bot_instance.send_export(FakeExportMessage()))
+
+    assert sent["file_name"] == "bookmarks.json.gz"
+    assert sent["caption"] == "📦 3 bookmarks"
+    assert [b["title"] for b in sent["data"]] == ["Article 2", "Article 1", "Article 0"]
+    assert not os.path.exists(sent["path"])  # the temporary file is removed once sent
+
+
+def test_dump_metrics_writes_the_registry_as_json(tmp_path, monkeypatch):
+    path = tmp_path / "metrics.json"
+    monkeypatch.setenv("BOT_METRICS_DUMP", str(path))
+
+    assert BookmarkBot.dump_metrics() == str(path)
+    assert "stages" in json.loads(path.read_text(encoding="utf-8"))
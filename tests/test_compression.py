@@ -0,0 +1,61 @@
+import gzip
+import io
+import os
+
+from webserver import compression
+from webserver.compression import choose_encoding, compress, compressing_writer
+from webserver.static_assets import StaticAssets
+
+
+def test_choose_encoding_follows_preference_and_quality():
+    assert choose_encoding('gzip, deflate, br', available=('br', 'gzip')) == 'br'
+    assert choose_encoding('gzip, br;q=0', available=('br', 'gzip')) == 'gzip'
+    assert choose_encoding('br;q=0.5, gzip;q=0.8', available=('br', 'gzip')) == 'gzip'
+    assert choose_encoding('*', available=('gzip',)) == 'gzip'
+    assert choose_encoding('identity', available=('br', 'gzip')) is None
+    assert choose_encoding(None, available=('gzip',)) is None
+
+
+def test_brotli_is_only_offered_when_installed(mocker):
+    mocker.patch.object(compression, 'brotli', None)
+    assert choose_encoding('br, gzip') == 'gzip'
+    assert choose_encoding('br') is None
+
+
+def test_streamed_gzip_matches_the_input():
+    out = io.BytesIO()
+    with compressing_writer(out, 'gzip') as writer:
+        for n in range(1000):
+            writer.write(b"<article class='card'>%d</article>\n" % n)
+
+    assert gzip.decompress(out.getvalue()).count(b"<article") == 1000
+    assert compress(b"same body" * 200, 'gzip') == compress(b"same body" * 200, 'gzip')
+
+
+def test_static_assets_are_precompressed_once(tmp_path):
+    (tmp_path / "app.js").write_text("function noop() { return null; }\n" * 200)
+    (tmp_path / "tiny.css").write_text("body{}")
+    assets = StaticAssets(str(tmp_path))
+
+    assert assets.preload() == 2
+    script = assets.get('app.js')
+    assert script.content_type == 'application/javascript'
+    assert gzip.decompress(script.encodings['gzip']) == script.body
+    assert assets.get('tiny.css').encodings == {}  # under the threshold
+    assert assets.get('missing.js') is None
+    assert assets.resolve('../secrets.env') is None
+
+
+def test_static_assets_reload_on_change_with_a_new_url(tmp_path):
+    style = tmp_path / "style.css"
+    style.write_text("body { color: red; }")
+    assets = StaticAssets(str(tmp_path), reload_check_seconds=0)
+    first_url = assets.url('style.css')
+
+    style.write_text("body { color: blue; }")
+    os.utime(style, (1, 1))
+
+    assert assets.get('style.css').body == b"body { color: blue; }"
+    assert assets.url('style.css') != first_url
+    assert assets.url('style.css').startswith('/static/style.css?v=')
+    assert assets.url('missing.js') == '/static/missing.js'
@@ -79,4 +79,14 @@ def test_init_database_creates_all_columns(mock_db_path):
     cursor.execute("PRAGMA table_info(bookmarks)")
     bookmark_columns = {row[1] for row in cursor.fetchall()}
     expected_bookmark_columns = {'id', 'user_id', 'url', 'title', 'description', 'image_url', 'domain', 'saved_at', 'telegram_user_id', 'telegram_message_id', 'comments_url', 'is_read'}
-    assert expected_bookmark_columns.issubset(bookmark_columns)
\ No newline at end of file
+    assert expected_bookmark_columns.issubset(bookmark_columns)
+
+def test_row_version_follows_displayed_fields_only(mock_db_path):
+    conn = init_database(mock_db_path)
+    conn.execute("INSERT INTO users (id, username, password_hash) VALUES (1, 'alice', 'hash')")
+    conn.execute("INSERT INTO bookmarks (id, user_id, url, title) VALUES (1, 1, 'https://a.example', 'A')")
+
+    conn.execute("UPDATE bookmarks SET title = 'B', is_read = 1 WHERE id = 1")
+    conn.execute("UPDATE bookmarks SET last_seen_at = CURRENT_TIMESTAMP, tags_status = 'pending' WHERE id = 1")
+
+    assert conn.execute("SELECT row_version FROM bookmarks WHERE id = 1").fetchone()[0] == 1
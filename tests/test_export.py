@@ -0,0 +1,94 @@
+import csv
+import gzip
+import io
+import json
+import os
+import sqlite3
+from datetime import datetime
+
+import pytest
+
+from shared.database import init_database
+from shared.export import export_to_file, iter_export_rows, write_export
+
+
+@pytest.fixture
+def export_db(tmp_path):
+    path = str(tmp_path / "bookmarks.db")
+    conn = sqlite3.connect(path)
+    init_database(conn)
+    conn.executemany("INSERT INTO users (id, username, password_hash) VALUES (?, ?, 'hash')", [(1, 'alice'), (2, 'bob')])
+    conn.executemany(
+        "INSERT INTO bookmarks (id, user_id, url, title, description, domain, tags, is_read) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+        [
+            (1, 1, "https://a.example/1", "First", 'Says "hi"\nthere', "a.example", '["python"]', 0),
+            (2, 1, "https://b.example/2", "Second <b>", None, "b.example", "not json", 1),
+            (3, 2, "https://c.example/3", "Bob's", None, "c.example", None, 0),
+        ],
+    )
+    conn.commit()
+    yield path, conn
+    conn.close()
+
+
+def test_json_export_lists_the_user_bookmarks_newest_first(export_db):
+    _, conn = export_db
+    out = io.BytesIO()
+
+    count = write_export(conn.cursor(), 1, 'json', out)
+
+    data = json.loads(out.getvalue().decode('utf-8'))
+    assert count == 2
+    assert [b['id'] for b in data] == [2, 1]
+    assert data[0]['tags'] == ["not json"] and data[0]['is_read'] is True
+    assert data[1]['tags'] == ["python"]
+
+
+def test_csv_export_keeps_one_line_per_bookmark(export_db):
+    _, conn = export_db
+    out = io.BytesIO()
+
+    write_export(conn.cursor(), 1, 'csv', out)
+
+    lines = out.getvalue().decode('utf-8').splitlines()
+    rows = list(csv.reader(lines))
+    assert len(lines) == 3
+    assert rows[0][:3] == ['id', 'url', 'title']
+    assert rows[2][3] == 'Says ""hi"" there'
+
+
+def test_html_export_escapes_cards_and_counts_them(export_db):
+    _, conn = export_db
+    out = io.BytesIO()
+
+    write_export(conn.cursor(), 1, 'html', out, generated_at=datetime(2024, 1, 2, 3, 4, 5))
+
+    html = out.getvalue().decode('utf-8')
+    assert "Exported on 2024-01-02 03:04:05 | Total: 2 bookmarks" in html
+    assert "Second &lt;b&gt;" in html and "Bob&#x27;s" not in html and "Bob's" not in html
+    assert html.rstrip().endswith("</html>")
+
+
+def test_export_rows_are_fetched_in_batches(export_db, mocker):
+    _, conn = export_db
+    cursor = mocker.Mock(wraps=conn.cursor())
+
+    rows = list(iter_export_rows(cursor, 1, batch_size=1))
+
+    assert [row[0] for row in rows] == [2, 1]
+    assert cursor.fetchall.call_count == 0
+    assert cursor.fetchmany.call_count == 3
+
+
+def test_export_to_file_writes_a_gzip_file(export_db, tmp_path):
+    path, _ = export_db
+
+    export_path, count = export_to_file(path, 2, 'json', compress=True, directory=str(tmp_path))
+    try:
+        with gzip.open(export_path, 'rt', encoding='utf-8') as f:
+            data = json.load(f)
+    finally:
+        os.remove(export_path)
+
+    assert export_path.endswith('.json.gz') and count == 1
+    assert data[0]['title'] == "Bob's"
@@ -0,0 +1,25 @@
+from webserver.fragment_cache import FragmentCache
+
+
+def test_least_recently_used_fragments_are_evicted():
+    cache = FragmentCache(max_entries=2)
+    cache.get_or_render(1, 0, 'en', 'cards', lambda: "card 1")
+    cache.get_or_render(2, 0, 'en', 'cards', lambda: "card 2")
+    cache.get_or_render(1, 0, 'en', 'cards', lambda: "not rendered")  # hit, now most recent
+    cache.get_or_render(3, 0, 'en', 'cards', lambda: "card 3")
+
+    assert len(cache) == 2
+    assert (cache.hits, cache.misses) == (1, 3)
+    assert cache.get_or_render(1, 0, 'en', 'cards', lambda: "again") == "card 1"
+    assert cache.get_or_render(2, 0, 'en', 'cards', lambda: "card 2 again") == "card 2 again"
+
+
+def test_invalidate_drops_every_version_language_and_view():
+    cache = FragmentCache()
+    for key in ((7, 0, 'en', 'cards'), (7, 1, 'it', 'compact'), (8, 0, 'en', 'cards')):
+        cache.get_or_render(*key, lambda: "html")
+
+    cache.invalidate(7)
+
+    assert len(cache) == 1
+    assert cache.get_or_render(7, 1, 'it', 'compact', lambda: "fresh") == "fresh"
@@ -0,0 +1,68 @@
+import json
+import sqlite3
+
+import pytest
+
+from shared.database import init_database
+from telegram_bot.scripts.import_telegram_export import import_export, iter_export_messages, message_links
+
+
+def _export(tmp_path, messages):
+    path = tmp_path / "result.json"
+    path.write_text(json.dumps({"name": "Saved Messages", "type": "saved_messages", "id": 1, "messages": messages}, indent=1))
+    return str(path)
+
+
+MESSAGES = [
+    {"id": 1, "type": "service", "action": "create_group"},
+    {"id": 2, "type": "message", "from_id": "user42", "date_unixtime": "1600000000",
+     "text": [{"type": "link", "text": "https://example.com/a"}],
+     "text_entities": [{"type": "link", "text": "https://example.com/a"}]},
+    {"id": 3, "type": "message", "from_id": "user42",
+     "text": "see https://example.com/b and https://news.ycombinator.com/item?id=7",
+     "text_entities": [{"type": "plain", "text": "see "}, {"type": "link", "text": "https://example.com/b"},
+                       {"type": "plain", "text": " and "}, {"type": "link", "text": "https://news.ycombinator.com/item?id=7"}]},
+    {"id": 4, "type": "message", "text": [{"type": "text_link", "text": "label", "href": "https://example.com/c"}]},
+    {"id": 5, "type": "message", "text": "again https://example.com/a",
+     "text_entities": [{"type": "link", "text": "https://example.com/a"}]},
+]
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / "bookmarks.db")
+    conn = sqlite3.connect(path)
+    init_database(conn)
+    conn.execute("INSERT INTO users (id, username, password_hash) VALUES (1, 'alice', 'hash')")
+    conn.commit()
+    conn.close()
+    return path
+
+
+def test_export_is_streamed_across_small_chunks(tmp_path):
+    path = _export(tmp_path, MESSAGES)
+    assert [message["id"] for message in iter_export_messages(path, chunk_size=7)] == [1, 2, 3, 4, 5]
+
+
+def test_message_links_pair_article_with_hn_discussion():
+    assert message_links(MESSAGES[2]) == [("https://example.com/b", "https://news.ycombinator.com/item?id=7")]
+    assert message_links(MESSAGES[3]) == [("https://example.com/c", None)]
+
+
+def test_import_dedupes_batches_and_resumes(tmp_path, db_path):
+    path = _export(tmp_path, MESSAGES)
+    stats = import_export(path, db_path=db_path, batch_size=2, skip_metadata=True)
+    assert (stats["messages"], stats["imported"], stats["duplicates"]) == (5, 3, 1)
+
+    conn = sqlite3.connect(db_path)
+    rows = conn.execute("SELECT url, comments_url, telegram_user_id, saved_at FROM bookmarks ORDER BY url").fetchall()
+    conn.close()
+    assert rows == [
+        ("https://example.com/a", None, 42, "2020-09-13 12:26:40"),
+        ("https://example.com/b", "https://news.ycombinator.com/item?id=7", 42, rows[1][3]),
+        ("https://example.com/c", None, None, rows[2][3]),
+    ]
+
+    # The checkpoint marks the export as done: a second run has nothing left to do
+    assert import_export(path, db_path=db_path, skip_metadata=True)["messages"] == 0
+    assert import_export(path, db_path=db_path, skip_metadata=True, restart=True)["imported"] == 0
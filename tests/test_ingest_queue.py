@@ -0,0 +1,57 @@
+import sqlite3
+
+import pytest
+
+from shared.database import init_database
+from shared.ingest_queue import (
+    claim_ingest_job,
+    complete_ingest_job,
+    enqueue_ingest_job,
+    fail_ingest_job,
+    ingest_queue_stats,
+    recover_ingest_jobs,
+)
+
+
+@pytest.fixture
+def queue_db():
+    """In-memory database in autocommit mode, as used by the ingest workers."""
+    conn = sqlite3.connect(':memory:', isolation_level=None)
+    init_database(conn)
+    yield conn
+    conn.close()
+
+
+def test_job_is_claimed_once_and_completed(queue_db):
+    urls = ["https://example.com/a", "https://example.com/b"]
+    job_id = enqueue_ingest_job(queue_db.cursor(), 10, 20, urls, telegram_user_id=30)
+    assert enqueue_ingest_job(queue_db.cursor(), 10, 20, urls) is None  # duplicate delivery
+
+    job = claim_ingest_job(queue_db)
+    assert (job.id, job.chat_id, job.message_id, job.telegram_user_id, job.urls) == (job_id, 10, 20, 30, urls)
+    assert claim_ingest_job(queue_db) is None
+
+    complete_ingest_job(queue_db, job)
+    assert ingest_queue_stats(queue_db) == {}
+
+
+def test_failed_job_backs_off_then_parks(queue_db, mocker):
+    mocker.patch('shared.ingest_queue.MAX_ATTEMPTS', 2)
+    enqueue_ingest_job(queue_db.cursor(), 10, 20, ["https://example.com/a"])
+
+    job = claim_ingest_job(queue_db)
+    assert fail_ingest_job(queue_db, job, RuntimeError("db locked")) == 5
+    assert claim_ingest_job(queue_db) is None  # not due yet
+
+    job = claim_ingest_job(queue_db, now=float('inf'))
+    assert job.attempts == 1
+    assert fail_ingest_job(queue_db, job, RuntimeError("db locked")) is None
+    assert ingest_queue_stats(queue_db) == {'failed': 1}
+
+
+def test_recover_resumes_interrupted_jobs(queue_db):
+    enqueue_ingest_job(queue_db.cursor(), 10, 20, ["https://example.com/a"])
+    claim_ingest_job(queue_db)
+
+    assert recover_ingest_jobs(queue_db) == 1
+    assert claim_ingest_job(queue_db).message_id == 20
@@ -0,0 +1,118 @@
+import pytest
+import sqlite3
+import requests
+from datetime import datetime, timezone
+
+import shared.llm_limiter as llm_limiter
+from shared.database import init_database
+from shared.llm_limiter import LLMLimiter, LLMUnavailableError, TokenBucket, parse_retry_after
+from shared.utils import generate_tags_llm
+
+
+class FakeClock:
+    """A manually advanced monotonic clock."""
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_token_bucket_refills_over_time():
+    """A bucket of 60 rpm frees one slot per second."""
+    clock = FakeClock()
+    bucket = TokenBucket(60, clock=clock)
+    bucket.consume(60)
+
+    assert bucket.time_until_available(1) == pytest.approx(1.0)
+    clock.now += 1
+    assert bucket.time_until_available(1) == 0
+
+
+def test_limiter_skips_when_budget_is_exhausted():
+    """Without waiting, a request over budget is skipped and counted."""
+    clock = FakeClock()
+    limiter = LLMLimiter(rpm=2, clock=clock)
+
+    limiter.acquire(max_wait=0)
+    limiter.acquire(max_wait=0)
+    with pytest.raises(LLMUnavailableError):
+        limiter.acquire(max_wait=0)
+
+    assert limiter.stats()['skipped'] == 1
+
+
+def test_limiter_trips_after_throttle_and_recovers():
+    """A 429 makes the LLM unavailable for the Retry-After period."""
+    clock = FakeClock()
+    limiter = LLMLimiter(clock=clock)
+
+    limiter.record_throttled(retry_after=30)
+    assert not limiter.is_available()
+    with pytest.raises(LLMUnavailableError):
+        limiter.acquire(max_wait=0)
+
+    clock.now += 31
+    assert limiter.is_available()
+    limiter.acquire(max_wait=0)
+    assert limiter.stats()['throttled'] == 1
+
+
+def test_limiters_share_the_budget_and_cooldown_through_the_database(tmp_path):
+    """Two processes on the same database spend one budget and honor each other's 429."""
+    db_path = str(tmp_path / "bookmarks.db")
+    init_database(sqlite3.connect(db_path)).close()
+    clock = FakeClock()
+    bot = LLMLimiter(rpm=2, clock=clock, db_path=db_path)
+    web = LLMLimiter(rpm=2, clock=clock, db_path=db_path)
+
+    bot.acquire(max_wait=0)
+    web.acquire(max_wait=0)
+    with pytest.raises(LLMUnavailableError):
+        bot.acquire(max_wait=0)
+
+    clock.now += 30  # half a minute refills one request
+    web.acquire(max_wait=0)
+    with pytest.raises(LLMUnavailableError):
+        bot.acquire(max_wait=0)
+
+    clock.now += 30
+    web.record_throttled(retry_after=10)
+    assert not bot.is_available()
+    assert bot.stats()['unavailable_for_seconds'] == 10
+    clock.now += 11
+    bot.acquire(max_wait=0)
+
+
+def test_parse_retry_after_formats():
+    """Delta seconds, Google durations and HTTP dates are supported."""
+    now = datetime(2026, 1, 1, 12, 0, 0, tzinfo=timezone.utc)
+    assert parse_retry_after("120") == 120
+    assert parse_retry_after("37s") == 37
+    assert parse_retry_after("Thu, 01 Jan 2026 12:00:10 GMT", now=now) == 10
+    assert parse_retry_after("soon") is None
+
+
+def test_gemini_429_trips_limiter_and_skips_network(mocker, monkeypatch):
+    """After a 429, further calls use local tags without hitting the API."""
+    monkeypatch.setenv("GEMINI_ENABLED", "true")
+    monkeypatch.setenv("GEMINI_API_KEY", "test-key")
+    limiter = LLMLimiter()
+    monkeypatch.setattr(llm_limiter, '_limiter', limiter)
+
+    response = requests.models.Response()
+    response.status_code = 429
+    response.headers['Retry-After'] = '45'
+    response._content = b'{"error": {"message": "quota"}}'
+    mock_post = mocker.patch('requests.post', return_value=response)
+
+    first = generate_tags_llm("Kubernetes operators", "Writing kubernetes operators", "example.com")
+    second = generate_tags_llm("Kubernetes operators", "Writing kubernetes operators", "example.com")
+
+    assert 'kubernetes' in first
+    assert first == second
+    assert mock_post.call_count == 1
+    stats = limiter.stats()
+    assert stats['throttled'] == 1
+    assert stats['skipped'] == 1
+    assert stats['unavailable_for_seconds'] > 40
@@ -0,0 +1,71 @@
+import json
+import urllib.request
+
+import pytest
+import requests
+
+from shared.metrics import MetricsServer, PipelineMetrics
+from shared.utils import get_article_metadata
+
+
+def test_histograms_are_rendered_in_prometheus_text_format():
+    metrics = PipelineMetrics(buckets=(0.1, 1))
+    metrics.observe('get', 0.05, 'example.com')
+    metrics.observe('get', 0.5, 'example.com')
+    metrics.observe('get', 5, 'example.com')
+
+    text = metrics.render_prometheus()
+
+    labels = 'stage="get",domain="example.com",outcome="ok"'
+    assert "# TYPE bookmark_pipeline_stage_seconds histogram" in text
+    assert f'bookmark_pipeline_stage_seconds_bucket{{{labels},le="0.1"}} 1' in text
+    assert f'bookmark_pipeline_stage_seconds_bucket{{{labels},le="1"}} 2' in text
+    assert f'bookmark_pipeline_stage_seconds_bucket{{{labels},le="+Inf"}} 3' in text
+    assert f'bookmark_pipeline_stage_seconds_count{{{labels}}} 3' in text
+
+
+def test_timer_labels_errors_and_caps_domains():
+    ticks = iter([0.0, 0.2, 1.0, 1.5])
+    metrics = PipelineMetrics(max_domains=1, clock=lambda: next(ticks))
+
+    with metrics.time('parse', 'a.example'):
+        pass
+    with pytest.raises(ValueError):
+        with metrics.time('parse', 'b.example'):
+            raise ValueError("bad page")
+
+    stages = {(s['domain'], s['outcome']): s for s in metrics.snapshot()['stages']}
+    assert stages[('a.example', 'ok')]['sum_seconds'] == pytest.approx(0.2)
+    assert stages[('other', 'error')]['count'] == 1
+    json.dumps(metrics.snapshot())
+
+
+def test_metrics_server_serves_the_registry():
+    metrics = PipelineMetrics()
+    metrics.observe('reply', 0.01, outcome='sent')
+    server = MetricsServer(0, metrics=metrics)
+    server.start()
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{server.port}/metrics") as response:
+            body = response.read().decode('utf-8')
+            content_type = response.headers['Content-Type']
+    finally:
+        server.stop()
+
+    assert content_type.startswith('text/plain')
+    assert 'stage="reply",domain="",outcome="sent"' in body
+
+
+def test_scrape_stages_are_timed_per_domain(mocker):
+    metrics = PipelineMetrics()
+    mocker.patch('shared.utils.get_metrics', return_value=metrics)
+    mocker.patch('requests.head', side_effect=requests.exceptions.RequestException("405"))
+    mocker.patch('requests.get', return_value=mocker.Mock(content=b"<title>Hi</title>", raise_for_status=lambda: None))
+
+    get_article_metadata("https://www.example.com/post")
+
+    assert {(s['stage'], s['domain'], s['outcome']) for s in metrics.snapshot()['stages']} == {
+        ('head', 'example.com', 'error'),
+        ('get', 'example.com', 'ok'),
+        ('parse', 'example.com', 'ok'),
+    }
@@ -0,0 +1,43 @@
+import sqlite3
+
+import pytest
+
+from shared.database import init_database
+from shared.saved_urls import SavedUrlIndex, find_saved_bookmark, touch_bookmark
+
+
+@pytest.fixture
+def db():
+    conn = sqlite3.connect(':memory:')
+    init_database(conn)
+    conn.execute("INSERT INTO users (id, username, password_hash) VALUES (1, 'alice', 'hash'), (2, 'bob', 'hash')")
+    conn.execute(
+        "INSERT INTO bookmarks (user_id, url, title, domain, is_read) VALUES (1, 'https://example.com/a', 'A', 'example.com', 1)"
+    )
+    yield conn
+    conn.close()
+
+
+def test_index_is_warmed_per_user(db):
+    index = SavedUrlIndex()
+    index.load(db.cursor())
+    assert index.might_contain(1, 'https://example.com/a')
+    assert not index.might_contain(2, 'https://example.com/a')
+
+    index.add(2, 'https://example.com/b')
+    assert index.might_contain(2, 'https://example.com/b')
+    index.discard(2, 'https://example.com/b')
+    assert not index.might_contain(2, 'https://example.com/b')
+
+
+def test_touch_bumps_last_seen_and_keeps_user_state(db):
+    bookmark_id, title, domain = find_saved_bookmark(db.cursor(), 1, 'https://example.com/a')
+    assert (title, domain) == ('A', 'example.com')
+    assert find_saved_bookmark(db.cursor(), 2, 'https://example.com/a') is None
+
+    touch_bookmark(db.cursor(), bookmark_id, comments_url='https://news.ycombinator.com/item?id=1')
+    touch_bookmark(db.cursor(), bookmark_id, comments_url='https://news.ycombinator.com/item?id=2')
+
+    row = db.execute("SELECT is_read, comments_url, last_seen_at FROM bookmarks WHERE id = ?", (bookmark_id,)).fetchone()
+    assert row[:2] == (1, 'https://news.ycombinator.com/item?id=1')
+    assert row[2] is not None
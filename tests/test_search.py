@@ -0,0 +1,102 @@
+import json
+import sqlite3
+
+import pytest
+
+from shared.database import init_database
+from shared.search import SearchCache, build_match_query, search_bookmarks
+
+
+@pytest.fixture
+def search_db():
+    conn = sqlite3.connect(':memory:')
+    init_database(conn)
+    conn.executemany("INSERT INTO users (id, username, password_hash) VALUES (?, ?, 'hash')", [(1, 'alice'), (2, 'bob')])
+    conn.commit()
+    yield conn
+    conn.close()
+
+
+def _add(conn, title, domain="example.com", tags=(), user_id=1):
+    cursor = conn.execute(
+        "INSERT INTO bookmarks (user_id, url, title, domain, tags) VALUES (?, ?, ?, ?, ?)",
+        (user_id, f"https://{domain}/{title.replace(' ', '-')}", title, domain, json.dumps(list(tags))),
+    )
+    return cursor.lastrowid
+
+
+def test_match_query_uses_prefixes_and_ignores_punctuation():
+    assert build_match_query('Rust "async" OR') == '"rust"* "async"* "or"*'
+    assert build_match_query("  -- ") is None
+
+
+def test_search_matches_title_domain_and_tags_of_the_user(search_db):
+    by_title = _add(search_db, "Understanding SQLite internals")
+    by_tag = _add(search_db, "Fast storage engines", tags=["databases", "sqlite"])
+    by_domain = _add(search_db, "Release notes", domain="sqlite.org")
+    _add(search_db, "SQLite for bob", user_id=2)
+
+    results = search_bookmarks(search_db.cursor(), 1, "sqli")
+
+    assert [result.id for result in results] == [by_domain, by_tag, by_title]
+    assert results[1].tags == ["databases", "sqlite"]
+
+
+def test_index_follows_edits_and_deletions(search_db):
+    bookmark_id = _add(search_db, "Old title")
+    search_db.execute("UPDATE bookmarks SET title = 'Kernel scheduling' WHERE id = ?", (bookmark_id,))
+    assert search_bookmarks(search_db.cursor(), 1, "old") == []
+    assert [r.id for r in search_bookmarks(search_db.cursor(), 1, "kernel")] == [bookmark_id]
+
+    search_db.execute("DELETE FROM bookmarks WHERE id = ?", (bookmark_id,))
+    assert search_bookmarks(search_db.cursor(), 1, "kernel") == []
+
+
+def test_pages_follow_the_keyset_cursor(search_db):
+    ids = [_add(search_db, f"Python tip {n}") for n in range(5)]
+
+    first = search_bookmarks(search_db.cursor(), 1, "python", limit=2)
+    second = search_bookmarks(search_db.cursor(), 1, "python", limit=2, before_id=first[-1].id)
+    recent = search_bookmarks(search_db.cursor(), 1, "", limit=2, before_id=ids[2])
+
+    assert [r.id for r in first + second] == ids[::-1][:4]
+    assert [r.id for r in recent] == [ids[1], ids[0]]
+
+
+def test_existing_bookmarks_are_indexed_on_upgrade(tmp_path):
+    path = str(tmp_path / "bookmarks.db")
+    conn = sqlite3.connect(path)
+    init_database(conn)
+    conn.execute("INSERT INTO users (id, username, password_hash) VALUES (1, 'alice', 'hash')")
+    bookmark_id = _add(conn, "Legacy bookmark")
+    conn.execute("DROP TABLE bookmarks_fts")
+    conn.commit()
+
+    init_database(conn)
+
+    assert [r.id for r in search_bookmarks(conn.cursor(), 1, "legacy")] == [bookmark_id]
+    conn.close()
+
+
+def test_search_cache_expires_entries(mocker):
+    clock = mocker.patch('shared.search.time.monotonic', return_value=100.0)
+    cache = SearchCache(ttl=10, max_entries=2)
+    cache.put("a", [1])
+    cache.put("b", [2])
+    cache.put("c", [3])
+
+    assert cache.get("a") is None  # evicted
+    assert cache.get("b") == [2]
+    clock.return_value = 111.0
+    assert cache.get("c") is None  # expired
+
+
+def test_newer_page_and_unread_filter(search_db):
+    ids = [_add(search_db, f"Go note {n}") for n in range(5)]
+    search_db.execute("UPDATE bookmarks SET is_read = 1 WHERE id = ?", (ids[3],))
+
+    newer = search_bookmarks(search_db.cursor(), 1, "go", limit=2, after_id=ids[1])
+    unread = search_bookmarks(search_db.cursor(), 1, "", limit=10, unread_only=True)
+
+    assert [r.id for r in newer] == [ids[3], ids[2]]
+    assert [r.id for r in unread] == [ids[4], ids[2], ids[1], ids[0]]
@@ -1,25 +1,83 @@
 import pytest
+import gzip
+import re
 import json
+import time
+import socket
+import asyncio
 import sqlite3
+import threading
+import http.client
+import urllib.request
+from http.server import BaseHTTPRequestHandler
 from io import BytesIO
 from unittest.mock import Mock
 from contextlib import contextmanager # Import the correct decorator
 
-from webserver.server import BookmarkHandler
+from webserver import server as server_module
+from webserver.server import ROUTES, BookmarkHandler, PooledHTTPServer
+from webserver.async_engine import AsyncBookmarkServer
 from shared.database import init_database
 from werkzeug.security import generate_password_hash
 
 # --- Test Fixture Setup ---
 
+@contextmanager
+def _threaded_engine():
+    server = PooledHTTPServer(('127.0.0.1', 0), BookmarkHandler, workers=2)
+    thread = threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True)
+    thread.start()
+    try:
+        yield server.server_address[1]
+    finally:
+        server.shutdown()
+        server.close_gracefully(timeout=5)
+
+
+@contextmanager
+def _asyncio_engine():
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    server = AsyncBookmarkServer(BookmarkHandler, ROUTES, host='127.0.0.1', workers=2)
+    asyncio.run_coroutine_threadsafe(server.start(), loop).result(5)
+    try:
+        yield server.port
+    finally:
+        asyncio.run_coroutine_threadsafe(server.close(timeout=5), loop).result(10)
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(5)
+        loop.close()
+
+
+ENGINES = {'threads': _threaded_engine, 'asyncio': _asyncio_engine}
+
+
+def _send_over_socket(port, method, path, payload, headers):
+    """Sends the request as written by the test (headers verbatim) and returns (status, headers, body)."""
+    lines = [f"{method} {path} HTTP/1.1"]
+    if not any(name.lower() == 'host' for name in headers):
+        lines.append(f"Host: 127.0.0.1:{port}")
+    lines += [f"{name}: {value}" for name, value in headers.items()]
+    with socket.create_connection(('127.0.0.1', port), timeout=5) as sock:
+        sock.sendall(("\r\n".join(lines) + "\r\n\r\n").encode('latin-1') + payload)
+        sock.shutdown(socket.SHUT_WR)
+        response = http.client.HTTPResponse(sock, method=method)
+        response.begin()
+        body = response.read()
+        return response.status, dict(response.getheaders()), body
+
+
 @pytest.fixture
-def test_client(mocker):
+def server_db(mocker):
     """
-    A comprehensive fixture to set up an in-memory database,
-    create a test user and session, and provide a client to make simulated requests.
+    Sets up an in-memory database used by the server, with a test user and session.
+    Yields (connection, session ID, user ID).
     """
     # Use a shared in-memory database URI. The connection must be kept open.
+    # The engines run the handler on their worker threads.
     db_uri = 'file:memdb_test?mode=memory&cache=shared'
-    conn = sqlite3.connect(db_uri, uri=True, detect_types=sqlite3.PARSE_DECLTYPES)
+    conn = sqlite3.connect(db_uri, uri=True, detect_types=sqlite3.PARSE_DECLTYPES, check_same_thread=False)
     cursor = conn.cursor()
 
     # 1. Mock the db_connection context manager in the server module
@@ -46,8 +104,28 @@ def test_client(mocker):
     cursor.execute("INSERT OR IGNORE INTO sessions (session_id, user_id, expires_at) VALUES (?, ?, ?)",
                    (session_id, test_user['id'], expires_at))
     conn.commit()
+    # Bookmark ids start over in every test database
+    server_module.FRAGMENTS.clear()
+
+    yield conn, session_id, test_user['id']
+
+    # Teardown: close the main connection after all tests in the session are done.
+    conn.close()
+
+
+@pytest.fixture(params=['handler', 'threads', 'asyncio'])
+def test_client(server_db, request):
+    """
+    A comprehensive fixture to provide a client to make simulated requests
+    on the test database (see server_db).
+
+    Runs each test against the handler alone, then over a socket against
+    each serving engine (they share the routing table).
+    """
+    engine = request.param
+    conn, session_id, user_id = server_db
 
-    # 5. Define a helper function to simulate requests
+    # Define a helper function to simulate requests
     def make_request(method, path, body=None, headers=None, return_headers=False):
         if headers is None:
             headers = {}
@@ -63,6 +141,16 @@ def test_client(mocker):
         else:
             payload = json.dumps(body).encode('utf-8')
 
+        if engine != 'handler':
+            status_code, sent_headers, response_body = _send_over_socket(port, method, path, payload, headers)
+            try:
+                response_json = json.loads(response_body)
+            except (json.JSONDecodeError, UnicodeDecodeError):
+                response_json = None
+            if return_headers:
+                return status_code, response_json, response_body.decode('utf-8'), sent_headers
+            return status_code, response_json, response_body.decode('utf-8')
+
         rfile = BytesIO(payload)
         wfile = BytesIO()
 
@@ -106,10 +194,19 @@ def test_client(mocker):
         return status_code, response_json, response_body.decode('utf-8')
 
     # Yield the request function and the session ID to the tests
-    yield make_request, session_id, test_user['id'], conn
-    
-    # Teardown: close the main connection after all tests in the session are done.
-    conn.close()
+    if engine == 'handler':
+        yield make_request, session_id, user_id, conn
+    else:
+        with ENGINES[engine]() as port:
+            yield make_request, session_id, user_id, conn
+
+
+@pytest.fixture(params=sorted(ENGINES))
+def live_server(server_db, request):
+    """Runs each serving engine on the test database; yields (port, session ID)."""
+    _, session_id, _ = server_db
+    with ENGINES[request.param]() as port:
+        yield port, session_id
 
 
 # --- Authentication Tests ---
@@ -359,3 +456,331 @@ def test_mark_read_rejects_invalid_json_body(test_client):
     assert status == 400
     assert response_json is not None
     assert response_json.get('error') == 'Invalid JSON body'
+
+
+def test_llm_stats_endpoint_returns_counters(test_client):
+    """The LLM limiter counters are exposed as JSON to authenticated users."""
+    make_request, session_id, _, _ = test_client
+    headers = {'Cookie': f'session_id={session_id}'}
+
+    status, response_json, _ = make_request('GET', '/api/llm/stats', headers=headers)
+
+    assert status == 200
+    assert {'succeeded', 'failed', 'throttled', 'skipped'} <= set(response_json)
+
+
+# --- Fragment cache ---
+
+def test_fragments_are_cached_until_the_row_changes(test_client):
+    make_request, session_id, user_id, conn = test_client
+    headers = {'Cookie': f'session_id={session_id}'}
+    conn.execute("INSERT INTO bookmarks (id, user_id, url, title) VALUES (300, ?, 'https://cached.example', 'First title')", (user_id,))
+    conn.commit()
+    fragments = server_module.FRAGMENTS
+
+    make_request('GET', '/ui/bookmarks', headers=headers)
+    misses = fragments.misses
+    _, _, body = make_request('GET', '/ui/bookmarks', headers=headers)
+    assert fragments.misses == misses  # served from the cache
+    assert 'First title' in body
+
+    # A write from outside the web UI (bot, tag worker) bumps row_version
+    conn.execute("UPDATE bookmarks SET title = 'Edited by the bot' WHERE id = 300")
+    conn.commit()
+    _, _, body = make_request('GET', '/ui/bookmarks', headers=headers)
+    assert 'Edited by the bot' in body and 'First title' not in body
+
+    make_request('DELETE', '/api/bookmarks/300', headers=headers)
+    assert not any(key[0] == 300 for key in fragments._entries)
+
+
+# --- Active view ---
+
+def test_only_the_active_view_is_rendered(test_client):
+    make_request, session_id, user_id, conn = test_client
+    conn.executemany("INSERT INTO bookmarks (id, user_id, url, title) VALUES (?, ?, ?, ?)",
+                     [(400 + n, user_id, f'https://view{n}.example', f'View {n}') for n in range(3)])
+    conn.commit()
+    cookie = f'session_id={session_id}'
+
+    # Cards by default
+    _, _, body = make_request('GET', '/ui/bookmarks?limit=2', headers={'Cookie': cookie})
+    assert 'id="bookmark-card-' in body and 'id="bookmark-compact-' not in body
+    assert '&quot;view&quot;: &quot;cards&quot;' in body  # the next page keeps the view
+
+    # The view cookie, or the view sent with the htmx vals
+    for path, headers in (('/ui/bookmarks?limit=2', {'Cookie': f'{cookie}; view=compact'}),
+                          ('/ui/bookmarks/scroll?offset=0&limit=2&view=compact', {'Cookie': cookie})):
+        _, _, body = make_request('GET', path, headers=headers)
+        assert 'id="bookmark-compact-' in body and 'id="bookmark-card-' not in body, path
+        assert '&quot;view&quot;: &quot;compact&quot;' in body, path
+
+    _, _, body = make_request('GET', '/', headers={'Cookie': f'{cookie}; view=compact'})
+    assert "view: 'compact'" in body
+    assert 'id="bookmark-compact-' in body and 'id="bookmark-card-' not in body
+
+
+def test_view_switch_reloads_shown_items_and_keeps_the_page_size(test_client):
+    """Switching view asks for every item shown so far; scrolling then goes on page by page."""
+    make_request, session_id, user_id, conn = test_client
+    conn.executemany("INSERT INTO bookmarks (id, user_id, url) VALUES (?, ?, ?)",
+                     [(500 + n, user_id, f'https://switch{n}.example') for n in range(45)])
+    conn.commit()
+
+    _, _, body = make_request('GET', '/ui/bookmarks?limit=40&view=compact', headers={'Cookie': f'session_id={session_id}'})
+
+    assert body.count('id="bookmark-compact-') == 40
+    assert '&quot;offset&quot;: 40, &quot;limit&quot;: 20' in body
+
+
+# --- Persistent connections ---
+
+def test_requests_reuse_one_connection(live_server):
+    """Pages, fragments, API calls, redirects and HEAD all frame their body with Content-Length."""
+    port, session_id = live_server
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+    cookie = {'Cookie': f'session_id={session_id}'}
+    requests = [
+        ('GET', '/', None, cookie),
+        ('GET', '/ui/bookmarks/scroll?offset=0', None, cookie),
+        ('POST', '/api/bookmarks', json.dumps({'url': 'https://keepalive.example'}), {**cookie, 'Content-Type': 'application/json'}),
+        ('HEAD', '/api/bookmarks', None, cookie),
+        ('GET', '/static/style.css', None, {}),
+        ('GET', '/', None, {}),  # redirect to /login
+        ('GET', '/api/export/json', None, cookie),
+        ('OPTIONS', '/api/bookmarks', None, {}),
+    ]
+    sock = None
+    for method, path, body, headers in requests:
+        connection.request(method, path, body=body, headers=headers)
+        response = connection.getresponse()
+        body = response.read()
+        assert response.getheader('Connection') != 'close', path
+        if method != 'HEAD':
+            assert len(body) == int(response.getheader('Content-Length')), path
+        sock = sock or connection.sock
+        assert connection.sock is sock, path
+    connection.close()
+
+
+def test_unread_request_body_closes_the_connection(live_server):
+    port, session_id = live_server
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+
+    connection.request('PUT', '/api/bookmarks/not-a-number', body=b'{"title": "x"}',
+                       headers={'Cookie': f'session_id={session_id}'})
+    response = connection.getresponse()
+    response.read()
+
+    assert response.status == 400
+    assert response.getheader('Connection') == 'close'
+    connection.close()
+
+
+@pytest.mark.parametrize('engine', sorted(ENGINES))
+def test_body_without_length_closes_the_connection(server_db, engine):
+    """The body of a POST without Content-Length is not answered as a second request."""
+    with ENGINES[engine]() as port:
+        with socket.create_connection(('127.0.0.1', port), timeout=5) as sock:
+            sock.sendall(b"POST /login HTTP/1.1\r\nHost: 127.0.0.1\r\n"
+                         b"Content-Type: application/x-www-form-urlencoded\r\n\r\n"
+                         b"username=testuser&password=password123")
+            received = b''
+            while chunk := sock.recv(65536):
+                received += chunk
+
+    assert received.startswith(b'HTTP/1.1 400 ')
+    assert b'\r\nConnection: close\r\n' in received
+    assert received.count(b'HTTP/1.1 ') == 1
+
+
+@pytest.mark.parametrize('engine', sorted(ENGINES))
+def test_shutdown_closes_idle_connections(server_db, engine):
+    with ENGINES[engine]() as port:
+        connection = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+        connection.request('GET', '/login')
+        connection.getresponse().read()
+        started = time.monotonic()
+
+    # The idle connection does not hold the shutdown for the keep-alive timeout
+    assert time.monotonic() - started < 2
+    connection.close()
+
+
+
+@pytest.mark.parametrize('engine', sorted(ENGINES))
+def test_idle_connections_do_not_block_new_clients(server_db, engine):
+    """The engines run 2 workers: 2 idle keep-alive clients must not delay a third one."""
+    with ENGINES[engine]() as port:
+        idle = [http.client.HTTPConnection('127.0.0.1', port, timeout=5) for _ in range(2)]
+        for connection in idle:
+            connection.request('GET', '/login')
+            connection.getresponse().read()
+
+        started = time.monotonic()
+        client = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+        client.request('GET', '/login')
+        response = client.getresponse()
+        response.read()
+
+        assert response.status == 200
+        assert time.monotonic() - started < 2
+        for connection in idle + [client]:
+            connection.close()
+
+
+# --- Compression ---
+
+def test_fragments_and_exports_are_compressed_when_accepted(live_server, server_db):
+    port, session_id = live_server
+    conn, _, user_id = server_db
+    conn.executemany(
+        "INSERT INTO bookmarks (user_id, url, title, description, domain, tags) VALUES (?, ?, ?, ?, ?, ?)",
+        [(user_id, f"https://gzip.example/{n}", f"Compressed bookmark {n}", "Repetitive description " * 5,
+          'gzip.example', '["compression"]') for n in range(20)],
+    )
+    conn.commit()
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+    cookie = {'Cookie': f'session_id={session_id}'}
+
+    def fetch(path, **headers):
+        connection.request('GET', path, headers={**cookie, **headers})
+        response = connection.getresponse()
+        return response, response.read()
+
+    plain_response, plain = fetch('/ui/bookmarks')
+    response, body = fetch('/ui/bookmarks', **{'Accept-Encoding': 'gzip, deflate'})
+    export_response, export = fetch('/api/export/json', **{'Accept-Encoding': 'gzip'})
+    connection.close()
+
+    assert plain_response.getheader('Content-Encoding') is None
+    assert response.getheader('Content-Encoding') == 'gzip'
+    assert response.getheader('Vary') == 'Accept-Encoding'
+    assert gzip.decompress(body) == plain
+    assert len(plain) > 5 * len(body)
+    assert export_response.getheader('Content-Encoding') == 'gzip'
+    assert len(json.loads(gzip.decompress(export))) == 20
+
+
+def test_static_files_use_the_precompressed_variant(live_server):
+    port, _ = live_server
+    asset = server_module.STATIC_ASSETS.get('app.js')
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+
+    connection.request('GET', '/static/app.js', headers={'Accept-Encoding': 'gzip'})
+    response = connection.getresponse()
+    body = response.read()
+    connection.close()
+
+    assert response.getheader('Content-Encoding') == 'gzip'
+    assert body == asset.encodings['gzip']
+    assert gzip.decompress(body) == asset.body
+
+
+# --- Static files ---
+
+def test_repeat_page_loads_revalidate_static_files(live_server):
+    port, session_id = live_server
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+
+    connection.request('GET', '/', headers={'Cookie': f'session_id={session_id}'})
+    page = connection.getresponse().read().decode('utf-8')
+    script_url = re.search(r'src="(/static/app\.js\?v=[0-9a-f]+)"', page).group(1)
+
+    connection.request('GET', script_url)
+    response = connection.getresponse()
+    response.read()
+    etag = response.getheader('ETag')
+    assert response.getheader('Cache-Control') == 'public, max-age=31536000, immutable'
+
+    connection.request('GET', script_url, headers={'If-None-Match': etag})
+    revalidated = connection.getresponse()
+    assert revalidated.status == 304
+    assert revalidated.read() == b''
+
+    connection.request('GET', '/static/app.js', headers={'If-None-Match': 'W/"stale"'})
+    unversioned = connection.getresponse()
+    assert unversioned.status == 200
+    assert unversioned.getheader('Cache-Control') == 'no-cache'
+    assert len(unversioned.read()) == int(unversioned.getheader('Content-Length'))
+    connection.close()
+
+
+# --- Concurrent serving ---
+
+class _SlowHandler(BaseHTTPRequestHandler):
+    """/slow blocks until the test releases it; any other path answers right away."""
+
+    def do_GET(self):
+        if self.path == '/slow':
+            self.server.slow_started.set()
+            self.server.release.wait(5)
+        body = self.path.encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def pooled_server():
+    server = PooledHTTPServer(('127.0.0.1', 0), _SlowHandler, workers=2)
+    server.slow_started, server.release = threading.Event(), threading.Event()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.release.set()
+    server.shutdown()
+    server.server_close()
+
+
+def _get(server, path, timeout=5):
+    with urllib.request.urlopen(f"http://127.0.0.1:{server.server_address[1]}{path}", timeout=timeout) as response:
+        return response.read().decode('utf-8')
+
+
+def test_slow_request_does_not_block_the_others(pooled_server):
+    slow = threading.Thread(target=_get, args=(pooled_server, '/slow'))
+    slow.start()
+    assert pooled_server.slow_started.wait(5)
+
+    assert _get(pooled_server, '/fast', timeout=2) == '/fast'
+
+    pooled_server.release.set()
+    slow.join()
+
+
+def test_graceful_close_waits_for_requests_in_flight(pooled_server):
+    results = []
+    slow = threading.Thread(target=lambda: results.append(_get(pooled_server, '/slow')))
+    slow.start()
+    assert pooled_server.slow_started.wait(5)
+    pooled_server.shutdown()
+
+    threading.Timer(0.2, pooled_server.release.set).start()
+    assert pooled_server.close_gracefully(timeout=5)
+    slow.join()
+
+    assert results == ['/slow']
+
+
+def test_db_connection_is_reused_per_thread_and_not_shared_when_nested(tmp_path, mocker):
+    mocker.patch('webserver.server.DB_PATH', str(tmp_path / "bookmarks.db"))
+    mocker.patch.object(server_module, '_thread_state', threading.local())
+
+    with server_module.db_connection() as first:
+        first.execute("CREATE TABLE t (x)")
+    with server_module.db_connection() as outer:
+        assert outer.connection is first.connection
+        with server_module.db_connection() as inner:
+            assert inner.connection is not outer.connection
+
+    with pytest.raises(ValueError):
+        with server_module.db_connection() as cursor:
+            cursor.execute("INSERT INTO t VALUES (1)")
+            raise ValueError("handler failed")
+    with server_module.db_connection() as cursor:
+        assert cursor.execute("SELECT COUNT(*) FROM t").fetchone() == (0,)
@@ -0,0 +1,164 @@
+import json
+import sqlite3
+
+import pytest
+
+from shared.database import init_database
+from shared.llm_limiter import LLMUnavailableError
+from shared.utils import TagSuggester
+from shared.tag_queue import (
+    claim_tag_jobs,
+    drain,
+    enqueue_tag_job,
+    process_tag_job,
+    recover_tag_jobs,
+    tag_queue_stats,
+)
+
+
+@pytest.fixture
+def queue_db():
+    """In-memory database in autocommit mode, as used by the tag worker."""
+    conn = sqlite3.connect(':memory:', isolation_level=None)
+    init_database(conn)
+    conn.execute("INSERT INTO users (id, username, password_hash) VALUES (1, 'webuser', 'hash')")
+    yield conn
+    conn.close()
+
+
+@pytest.fixture(autouse=True)
+def empty_suggester(mocker):
+    """Completed jobs feed the process-wide suggester: isolate it per test."""
+    suggester = TagSuggester()
+    mocker.patch('shared.utils._suggester', suggester)
+    return suggester
+
+
+def _add_pending_bookmark(conn, url="https://example.com/a", tags=("local",)):
+    cursor = conn.execute(
+        "INSERT INTO bookmarks (user_id, url, title, description, tags, tags_status) VALUES (1, ?, ?, ?, ?, 'pending')",
+        (url, "SQLite internals", "How the btree works", json.dumps(list(tags))),
+    )
+    return cursor.lastrowid
+
+
+def _bookmark_tags(conn, bookmark_id):
+    tags, status = conn.execute("SELECT tags, tags_status FROM bookmarks WHERE id = ?", (bookmark_id,)).fetchone()
+    return json.loads(tags), status
+
+
+def test_job_is_claimed_and_completed(queue_db, mocker):
+    """A claimed job stores the LLM tags, marks the bookmark done and leaves the queue."""
+    mocker.patch('shared.tag_queue.request_llm_tags', return_value=["sqlite", "btree"])
+    bookmark_id = _add_pending_bookmark(queue_db)
+    enqueue_tag_job(queue_db.cursor(), bookmark_id, origin='bot', chat_id=10, reply_message_id=20)
+
+    jobs = claim_tag_jobs(queue_db, origin='bot')
+    assert [(job.bookmark_id, job.chat_id, job.reply_message_id) for job in jobs] == [(bookmark_id, 10, 20)]
+    assert claim_tag_jobs(queue_db, origin='bot') == []  # already running
+
+    assert process_tag_job(queue_db, jobs[0]) == ["sqlite", "btree"]
+    assert _bookmark_tags(queue_db, bookmark_id) == (["sqlite", "btree"], 'done')
+    assert tag_queue_stats(queue_db) == {}
+
+
+def test_job_for_edited_bookmark_is_discarded(queue_db):
+    """Tags edited by the user in the meantime win over the queued job."""
+    bookmark_id = _add_pending_bookmark(queue_db)
+    enqueue_tag_job(queue_db.cursor(), bookmark_id)
+    queue_db.execute("UPDATE bookmarks SET tags = '[\"mine\"]', tags_status = 'done' WHERE id = ?", (bookmark_id,))
+
+    assert claim_tag_jobs(queue_db) == []
+    assert tag_queue_stats(queue_db) == {}
+    assert _bookmark_tags(queue_db, bookmark_id) == (["mine"], 'done')
+
+
+def test_throttled_job_is_rescheduled_without_consuming_an_attempt(queue_db, mocker):
+    mocker.patch('shared.tag_queue.request_llm_tags', side_effect=LLMUnavailableError("cooldown"))
+    bookmark_id = _add_pending_bookmark(queue_db)
+    enqueue_tag_job(queue_db.cursor(), bookmark_id)
+
+    job = claim_tag_jobs(queue_db)[0]
+    assert process_tag_job(queue_db, job) is None
+
+    attempts, status, next_attempt_at = queue_db.execute(
+        "SELECT attempts, status, next_attempt_at FROM tag_jobs WHERE id = ?", (job.id,)
+    ).fetchone()
+    assert (attempts, status) == (0, 'pending')
+    assert claim_tag_jobs(queue_db, now=next_attempt_at - 1) == []
+    assert _bookmark_tags(queue_db, bookmark_id) == (["local"], 'pending')
+
+
+def test_failing_job_keeps_local_tags_after_max_attempts(queue_db, mocker):
+    mocker.patch('shared.tag_queue.request_llm_tags', side_effect=RuntimeError("bad answer"))
+    mocker.patch('shared.tag_queue.MAX_ATTEMPTS', 2)
+    bookmark_id = _add_pending_bookmark(queue_db)
+    enqueue_tag_job(queue_db.cursor(), bookmark_id)
+
+    assert process_tag_job(queue_db, claim_tag_jobs(queue_db)[0]) is None
+    job = claim_tag_jobs(queue_db, now=float('inf'))[0]
+    assert job.attempts == 1
+    assert process_tag_job(queue_db, job) == ["local"]
+    assert _bookmark_tags(queue_db, bookmark_id) == (["local"], 'done')
+
+
+def test_recover_resets_running_and_orphaned_jobs(queue_db):
+    interrupted = _add_pending_bookmark(queue_db, "https://example.com/running")
+    orphaned = _add_pending_bookmark(queue_db, "https://example.com/orphan")
+    enqueue_tag_job(queue_db.cursor(), interrupted)
+    claim_tag_jobs(queue_db)
+
+    assert recover_tag_jobs(queue_db) == 2
+    assert sorted(job.bookmark_id for job in claim_tag_jobs(queue_db)) == sorted([interrupted, orphaned])
+
+
+
+def test_drain_leaves_the_jobs_of_live_workers_alone(tmp_path, mocker):
+    """Running jobs belong to a bot or web worker: only --recover resets them."""
+    mocker.patch('shared.tag_queue.request_llm_tags', return_value=["sqlite"])
+    db_path = str(tmp_path / "bookmarks.db")
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    init_database(conn)
+    conn.execute("INSERT INTO users (id, username, password_hash) VALUES (1, 'webuser', 'hash')")
+    running = _add_pending_bookmark(conn, "https://example.com/running")
+    enqueue_tag_job(conn.cursor(), running)
+    claim_tag_jobs(conn)  # claimed by a live worker
+    due = _add_pending_bookmark(conn, "https://example.com/due")
+    enqueue_tag_job(conn.cursor(), due)
+
+    assert drain(db_path) == {'tagged': 1, 'rescheduled': 0}
+    assert _bookmark_tags(conn, running) == (["local"], 'pending')
+    assert tag_queue_stats(conn) == {'running': 1}
+
+    assert drain(db_path, recover=True) == {'tagged': 1, 'rescheduled': 0}
+    assert _bookmark_tags(conn, running) == (["sqlite"], 'done')
+    conn.close()
+
+def test_confident_suggestion_skips_the_llm(queue_db, mocker, empty_suggester):
+    suggester = empty_suggester
+    suggester.add(100, "SQLite internals explained", "", ["sqlite", "databases", "btree"])
+    suggester.add(101, "SQLite internals, part two", "", ["sqlite", "databases", "btree"])
+    llm = mocker.patch('shared.tag_queue.request_llm_tags')
+    bookmark_id = _add_pending_bookmark(queue_db)
+    enqueue_tag_job(queue_db.cursor(), bookmark_id)
+
+    assert process_tag_job(queue_db, claim_tag_jobs(queue_db)[0]) == ["btree", "databases", "sqlite"]
+    llm.assert_not_called()
+
+    # The tagged bookmark is indexed for the next suggestions
+    suggester.remove(100)
+    suggester.remove(101)
+    assert [tag for tag, _ in suggester.suggest("SQLite internals")] == ["btree", "databases", "sqlite"]
+
+
+def test_partial_confident_suggestion_is_completed_by_the_llm(queue_db, mocker, empty_suggester):
+    """A single confident neighbour tag is kept, but the LLM still completes the set."""
+    empty_suggester.add(100, "SQLite internals explained", "", ["sqlite", "databases"])
+    empty_suggester.add(101, "SQLite internals, part two", "", ["sqlite", "storage"])
+    llm = mocker.patch('shared.tag_queue.request_llm_tags', return_value=["btree", "sqlite", "pages"])
+    bookmark_id = _add_pending_bookmark(queue_db)
+    enqueue_tag_job(queue_db.cursor(), bookmark_id)
+
+    assert process_tag_job(queue_db, claim_tag_jobs(queue_db)[0]) == ["sqlite", "btree", "pages"]
+    llm.assert_called_once()
+    assert _bookmark_tags(queue_db, bookmark_id) == (["sqlite", "btree", "pages"], 'done')
@@ -0,0 +1,114 @@
+import pytest
+import sqlite3
+
+import shared.tagging as tagging
+from shared.database import init_database
+from shared.tagging import TagEngine, tokenize, rebuild_term_stats
+from shared.utils import generate_tags
+
+
+@pytest.fixture
+def db_conn():
+    """An in-memory database with the full schema."""
+    conn = sqlite3.connect(':memory:')
+    init_database(conn)
+    yield conn
+    conn.close()
+
+
+def test_tokenize_drops_stopwords_short_tokens_and_numbers():
+    """The tokenizer keeps only meaningful lowercase words."""
+    assert tokenize("The 2024 SQLite guide for you: WAL and me") == ['sqlite', 'guide', 'wal']
+
+
+def test_score_prefers_distinctive_terms():
+    """Terms present in every document rank below rarer ones."""
+    engine = TagEngine()
+    for topic in ['rust', 'python', 'sqlite', 'kernel']:
+        engine.observe(1, f"guide introduction {topic}")
+
+    assert engine.score(1, "guide introduction rust", n=1) == ['rust']
+
+
+def test_statistics_are_kept_per_user():
+    """A term common in one user's library stays distinctive for another user."""
+    engine = TagEngine()
+    for topic in ['rust', 'python', 'sqlite']:
+        engine.observe(1, f"guide {topic}")
+    engine.observe(2, "guide")
+    for topic in ['kernel', 'networking']:
+        engine.observe(2, f"rust {topic}")
+
+    assert engine.score(1, "rust guide", n=1) == ['rust']
+    assert engine.score(2, "rust guide", n=1) == ['guide']
+    assert engine.doc_count(1) == 3 and engine.doc_count(2) == 3
+
+
+def test_observe_persists_incremental_statistics(db_conn):
+    """Observed documents are reflected in the stats tables and survive a reload."""
+    engine = TagEngine()
+    cursor = db_conn.cursor()
+    for text in ("SQLite tips", "SQLite internals"):
+        engine.apply(1, engine.persist(1, text, cursor))
+    engine.apply(2, engine.persist(2, "Rust tips", cursor))
+    db_conn.commit()
+
+    reloaded = TagEngine()
+    reloaded.load(cursor)
+
+    assert reloaded.doc_count(1) == 2 and reloaded.doc_count(2) == 1
+    assert reloaded._df == {1: {'sqlite': 2, 'tips': 1, 'internals': 1}, 2: {'rust': 1, 'tips': 1}} == engine._df
+
+
+def test_persist_leaves_memory_alone_until_applied(db_conn):
+    """A rolled back save changes neither the tables nor the in-memory statistics."""
+    engine = TagEngine()
+    cursor = db_conn.cursor()
+    engine.persist(1, "SQLite tips", cursor)
+    db_conn.rollback()
+
+    assert engine.doc_count(1) == 0 and engine._df == {}
+    assert cursor.execute("SELECT COUNT(*) FROM tag_term_stats").fetchone() == (0,)
+
+
+def test_score_batch_matches_score():
+    """Batch scoring returns the same ranking as scoring one text at a time."""
+    engine = TagEngine()
+    texts = ["rust compiler borrow checker", "python packaging wheels", ""]
+    for text in texts:
+        engine.observe(1, text)
+
+    assert engine.score_batch(1, texts, n=2) == [engine.score(1, text, n=2) for text in texts]
+
+
+def test_rebuild_term_stats_from_bookmarks(db_conn):
+    """Rebuilding recomputes document frequencies from the bookmarks table."""
+    cursor = db_conn.cursor()
+    cursor.executemany(
+        "INSERT INTO bookmarks (user_id, url, title, description) VALUES (?, ?, ?, ?)",
+        [(1, 'https://a.example', 'Rust async', 'Tokio'), (1, 'https://b.example', 'Rust macros', ''),
+         (2, 'https://a.example', 'Rust', '')],
+    )
+    engine = TagEngine()
+
+    assert rebuild_term_stats(cursor, engine) == 3
+    assert engine._df[1]['rust'] == 2 and engine._df[2] == {'rust': 1}
+    cursor.execute("SELECT df FROM tag_term_stats WHERE user_id = 1 AND term = 'tokio'")
+    assert cursor.fetchone()[0] == 1
+    assert cursor.execute("SELECT user_id, doc_count FROM tag_corpus_stats ORDER BY user_id").fetchall() == [(1, 2), (2, 1)]
+
+
+def test_generate_tags_uses_engine_once_corpus_is_ready(monkeypatch):
+    """generate_tags switches from raw frequency to TF-IDF when enough documents are known."""
+    engine = TagEngine()
+    monkeypatch.setattr(tagging, '_engine', engine)
+    text = "guide guide introduction sqlite"
+
+    assert generate_tags(text, n=1, user_id=1) == ['guide']
+
+    for i in range(tagging.MIN_CORPUS_DOCS):
+        engine.observe(1, f"guide introduction topic{i}")
+
+    assert generate_tags(text, n=1, user_id=1) == ['sqlite']
+    # Another user's corpus is still too small
+    assert generate_tags(text, n=1, user_id=2) == ['guide']
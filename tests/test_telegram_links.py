@@ -0,0 +1,63 @@
+import sqlite3
+
+import pytest
+
+from shared.database import init_database
+from shared.telegram_links import TelegramUserRouter, link_telegram_user, unlink_telegram_user
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    """File database: change detection relies on commits from other connections."""
+    path = str(tmp_path / "bookmarks.db")
+    conn = sqlite3.connect(path)
+    init_database(conn)
+    conn.executemany("INSERT INTO users (id, username, password_hash) VALUES (?, ?, 'hash')", [(1, 'alice'), (2, 'bob')])
+    conn.commit()
+    conn.close()
+    return path
+
+
+def _write(db_path, action):
+    conn = sqlite3.connect(db_path)
+    try:
+        action(conn.cursor())
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def test_without_links_every_sender_goes_to_the_first_user(db_path):
+    router = TelegramUserRouter(db_path)
+    assert router.resolve(111) == 1
+    assert router.resolve(222) == 1
+    router.close()
+
+
+def test_links_route_senders_and_are_picked_up_without_restart(db_path):
+    router = TelegramUserRouter(db_path)
+    router.load()
+
+    _write(db_path, lambda cursor: link_telegram_user(cursor, 222, 2))
+    assert router.resolve(222) == 2
+    assert router.resolve(111) is None  # unlinked senders are rejected once links exist
+
+    _write(db_path, lambda cursor: link_telegram_user(cursor, 222, 1))
+    assert router.resolve(222) == 1
+
+    _write(db_path, lambda cursor: unlink_telegram_user(cursor, 222))
+    assert router.resolve(111) == 1
+    router.close()
+
+
+def test_unrelated_commits_do_not_reload_the_links(db_path):
+    router = TelegramUserRouter(db_path)
+    router.load()
+    _write(db_path, lambda cursor: cursor.execute(
+        "INSERT INTO bookmarks (user_id, url) VALUES (1, 'https://example.com')"
+    ))
+
+    loaded_links = router._links
+    assert router.resolve(111) == 1
+    assert router._links is loaded_links
+    router.close()
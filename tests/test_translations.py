@@ -0,0 +1,53 @@
+import json
+import os
+
+import pytest
+
+from webserver.server import TRANSLATIONS, load_translations
+from webserver.translations import TranslationCatalogs
+
+
+def _write(directory, lang, catalog, mtime):
+    path = directory / f"{lang}.json"
+    path.write_text(json.dumps(catalog), encoding='utf-8')
+    os.utime(path, (mtime, mtime))
+
+
+def test_languages_are_discovered_and_unknown_ones_fall_back(tmp_path):
+    _write(tmp_path, 'en', {'hello': 'Hello'}, 1)
+    _write(tmp_path, 'de', {'hello': 'Hallo'}, 1)
+    (tmp_path / "notes.txt").write_text("not a catalog")
+    catalogs = TranslationCatalogs(str(tmp_path))
+
+    assert catalogs.languages == ('de', 'en')
+    assert catalogs.get('de')['hello'] == 'Hallo'
+    assert catalogs.get('fr')['hello'] == 'Hello'
+    with pytest.raises(TypeError):
+        catalogs.get('en')['hello'] = 'Hi'
+
+
+def test_catalogs_reload_only_when_the_file_changes(tmp_path, mocker):
+    clock = mocker.patch('webserver.translations.time.monotonic', return_value=100.0)
+    _write(tmp_path, 'en', {'hello': 'Hello'}, 1)
+    catalogs = TranslationCatalogs(str(tmp_path), reload_check_seconds=5)
+    first = catalogs.get('en')
+
+    _write(tmp_path, 'en', {'hello': 'Hi'}, 2)
+    _write(tmp_path, 'it', {'hello': 'Ciao'}, 2)
+    assert catalogs.get('en') is first  # not checked again yet
+    assert catalogs.languages == ('en',)
+
+    clock.return_value = 106.0
+    assert catalogs.get('en')['hello'] == 'Hi'
+    assert catalogs.languages == ('en', 'it')
+
+    (tmp_path / "it.json").write_text("{broken", encoding='utf-8')
+    os.utime(tmp_path / "it.json", (3, 3))
+    clock.return_value = 112.0
+    assert catalogs.get('it')['hello'] == 'Ciao'  # the last valid version is kept
+
+
+def test_load_translations_uses_the_shipped_catalogs():
+    assert {'en', 'it'} <= set(TRANSLATIONS.languages)
+    assert load_translations('it-IT') is TRANSLATIONS.get('it')
+    assert load_translations('../../etc/passwd') is TRANSLATIONS.get('en')
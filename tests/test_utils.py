@@ -1,6 +1,7 @@
+
 import pytest
 import requests
-from shared.utils import extract_domain, get_article_metadata
+from shared.utils import extract_domain, get_article_metadata, generate_tags_llm, TagSuggester
 
 def test_extract_domain_simple():
     """Tests extraction from a standard URL."""
@@ -110,3 +111,57 @@ def test_get_article_metadata_no_protocol(mocker):
 
     # Assert that requests.get was called with the corrected URL
     mock_get.assert_called_once_with('https://example.com', headers=mocker.ANY, timeout=10, allow_redirects=True)
+
+def _python_suggester():
+    suggester = TagSuggester()
+    suggester.add(1, "Python 3.12 release notes", "python.org", ["python", "release"])
+    suggester.add(2, "What's new in Python 3.11", "python.org", ["python", "changelog"])
+    suggester.add(3, "Rust release notes", "blog.rust-lang.org", ["rust", "release"])
+    return suggester
+
+
+def test_tag_suggester_ranks_tags_of_similar_bookmarks():
+    suggestions = _python_suggester().suggest("Python 3.13 release notes", "python.org")
+    # Neighbour similarities: 1.0 (same title shape), 0.5 (python + domain), 0.5 (release notes)
+    assert suggestions == [("python", 0.5), ("release", 0.5), ("changelog", 0.167)]
+
+
+def test_tag_suggester_reindexes_and_removes_bookmarks():
+    suggester = _python_suggester()
+    suggester.add(1, "Python 3.12 release notes", "python.org", ["cpython"])
+    suggester.remove(2)
+    assert [tag for tag, _ in suggester.suggest("Python release", "python.org")][0] == "cpython"
+    suggester.remove(1)
+    assert "cpython" not in dict(suggester.suggest("Python release", "python.org"))
+
+
+def test_tag_suggester_needs_a_shared_title_token():
+    assert _python_suggester().suggest("Completely unrelated words", "python.org") == []
+
+
+def test_generate_tags_llm_skips_gemini_for_confident_suggestions(mocker):
+    suggester = _python_suggester()
+    suggester.add(4, "Python 3.10 release notes", "python.org", ["python", "release", "changelog"])
+    suggester.add(5, "Python 3.9 release notes", "python.org", ["python", "release", "changelog"])
+    suggester.add(6, "Python 3.8 release notes", "python.org", ["python", "release", "changelog"])
+    mocker.patch('shared.utils._suggester', suggester)
+    fetch = mocker.patch('shared.utils._fetch_gemini_tags')
+    mocker.patch('shared.utils._gemini_settings', return_value={'model': 'test'})
+
+    assert generate_tags_llm("Python 3.13 release notes", "", "python.org")[0] == "python"
+    fetch.assert_not_called()
+
+    generate_tags_llm("Kubernetes operators explained", "", "example.com")
+    fetch.assert_called_once()
+
+
+def test_generate_tags_llm_asks_gemini_unless_every_suggestion_is_confident(mocker):
+    suggester = _python_suggester()
+    suggester.add(4, "Python 3.10 release notes", "python.org", ["python", "release"])
+    mocker.patch('shared.utils._suggester', suggester)
+    fetch = mocker.patch('shared.utils._fetch_gemini_tags', return_value=["cpython", "python", "whatsnew"])
+    mocker.patch('shared.utils._gemini_settings', return_value={'model': 'test'})
+
+    # python and release clear the threshold, changelog does not
+    assert generate_tags_llm("Python 3.13 release notes", "", "python.org") == ["python", "release", "cpython"]
+    fetch.assert_called_once()
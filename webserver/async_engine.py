@@ -0,0 +1,220 @@
+"""
+asyncio serving engine for the web server (`--engine asyncio`).
+
+Connections live on an event loop, so an idle or slow client costs a
+coroutine instead of a thread. Each request is handed to the same
+BookmarkHandler as the threaded engine, on an executor: its database calls
+and rendering never block the loop, and the responses are identical. Routes
+flagged `outbound` in the routing table (scrape, which waits on remote sites
+and the LLM) run on their own, larger pool, so they cannot take the workers
+of the other requests.
+
+The handler reads the body and writes the response through file objects
+bridged to the loop's streams, with flow control: exports are streamed, not
+buffered. Connections are persistent (HTTP/1.1): between two requests an
+idle connection only waits on the loop, up to the keep-alive timeout.
+"""
+import io
+import ssl
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from .routing import match_route
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WORKERS = 8
+DEFAULT_OUTBOUND_WORKERS = 32
+MAX_HEADER_BYTES = 64 * 1024
+HEADER_TIMEOUT_SECONDS = 30  # a client has this long to send its request headers
+KEEPALIVE_TIMEOUT_SECONDS = 15  # an idle persistent connection is closed after this long
+BODY_TIMEOUT_SECONDS = 30
+
+
+class _LoopReader:
+    """Blocking file interface (for the handler thread) over the request head and an asyncio StreamReader."""
+
+    def __init__(self, head, reader, loop, timeout=BODY_TIMEOUT_SECONDS):
+        self._head = io.BytesIO(head)
+        self._reader = reader
+        self._loop = loop
+        self._timeout = timeout
+
+    def _call(self, coro):
+        return asyncio.run_coroutine_threadsafe(asyncio.wait_for(coro, self._timeout), self._loop).result()
+
+    async def _read_up_to(self, size):
+        chunks = []
+        while size > 0:
+            chunk = await self._reader.read(size)
+            if not chunk:
+                break
+            chunks.append(chunk)
+            size -= len(chunk)
+        return b"".join(chunks)
+
+    def readline(self, limit=-1):
+        line = self._head.readline(limit)
+        if line.endswith(b"\n") or 0 <= limit <= len(line):
+            return line
+        return line + self._call(self._reader.readline())
+
+    def read(self, size=-1):
+        data = self._head.read(size)
+        if size is None or size < 0:
+            return data + self._call(self._reader.read())
+        if len(data) < size:
+            data += self._call(self._read_up_to(size - len(data)))
+        return data
+
+
+class _LoopWriter:
+    """Blocking file interface over an asyncio StreamWriter; each write waits for the transport to drain."""
+
+    def __init__(self, writer, loop):
+        self._writer = writer
+        self._loop = loop
+
+    async def _write(self, data):
+        self._writer.write(data)
+        await self._writer.drain()
+
+    def write(self, data):
+        if data:
+            asyncio.run_coroutine_threadsafe(self._write(bytes(data)), self._loop).result()
+        return len(data)
+
+    def flush(self):
+        pass
+
+
+class AsyncBookmarkServer:
+    """
+    Serves a BaseHTTPRequestHandler class on an asyncio event loop.
+
+    Args:
+        handler_class (type): Request handler, e.g. BookmarkHandler.
+        routes (list): Routing table of the handler (for the `outbound` flag).
+        host (str): Listening address ('' for all interfaces).
+        port (int): Listening port (0 picks a free one, see `port` once started).
+        ssl_context (ssl.SSLContext, optional): Serves HTTPS when set.
+        workers (int): Threads running the handlers of regular routes.
+        outbound_workers (int): Threads running the handlers of outbound routes.
+        keepalive_timeout (float): Seconds an idle connection is kept open between requests.
+    """
+
+    def __init__(self, handler_class, routes, host='', port=0, ssl_context=None, workers=DEFAULT_WORKERS,
+                 outbound_workers=DEFAULT_OUTBOUND_WORKERS, keepalive_timeout=KEEPALIVE_TIMEOUT_SECONDS):
+        self.handler_class = handler_class
+        self.routes = routes
+        self.host = host
+        self.requested_port = port
+        self.ssl_context = ssl_context
+        self.workers = max(1, workers)
+        self.keepalive_timeout = keepalive_timeout
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="async-http")
+        self._outbound_executor = ThreadPoolExecutor(max_workers=max(1, outbound_workers),
+                                                     thread_name_prefix="async-http-outbound")
+        self._server = None
+        self._connections = set()
+        self._idle = set()
+        self._stopping = None
+
+    @property
+    def keep_alive(self):
+        """False once stopping: responses then ask the clients to close the connection."""
+        return self._stopping is None or not self._stopping.is_set()
+
+    @property
+    def port(self):
+        return self._server.sockets[0].getsockname()[1]
+
+    async def start(self):
+        self._stopping = asyncio.Event()
+        self._server = await asyncio.start_server(
+            self._handle_connection, self.host or None, self.requested_port,
+            ssl=self.ssl_context, limit=MAX_HEADER_BYTES,
+        )
+
+    def stop(self):
+        """Asks serve_until_stopped() to return (call on the loop, e.g. from a signal handler)."""
+        self._stopping.set()
+
+    async def serve_until_stopped(self, drain_timeout=30):
+        """Serves until stop(), then lets the requests in flight finish."""
+        if self._server is None:
+            await self.start()
+        await self._stopping.wait()
+        await self.close(drain_timeout)
+
+    async def close(self, timeout=30):
+        """Stops accepting connections and waits up to `timeout` seconds for the open ones."""
+        self._server.close()
+        self._stopping.set()
+        for task in self._idle:
+            task.cancel()
+        pending = set(self._connections)
+        if pending:
+            _, pending = await asyncio.wait(pending, timeout=timeout)
+            for task in pending:
+                task.cancel()
+        self._executor.shutdown(wait=not pending, cancel_futures=True)
+        self._outbound_executor.shutdown(wait=not pending, cancel_futures=True)
+        return not pending
+
+    async def _handle_connection(self, reader, writer):
+        task = asyncio.current_task()
+        self._connections.add(task)
+        timeout = HEADER_TIMEOUT_SECONDS
+        try:
+            while True:
+                try:
+                    head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), timeout)
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, asyncio.TimeoutError,
+                        asyncio.CancelledError, ConnectionError, ssl.SSLError):
+                    return
+                finally:
+                    self._idle.discard(task)
+                if not await self._serve_request(head, reader, writer) or not self.keep_alive:
+                    return
+                # Idle until the next request of the connection; close() cancels the wait
+                self._idle.add(task)
+                timeout = self.keepalive_timeout
+        finally:
+            self._idle.discard(task)
+            self._connections.discard(task)
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except (ConnectionError, ssl.SSLError):
+                pass
+
+    async def _serve_request(self, head, reader, writer):
+        """Runs the handler on one request; returns True if the connection can serve another one."""
+        loop = asyncio.get_running_loop()
+        request_line = head.split(b"\r\n", 1)[0].decode('iso-8859-1').split()
+        executor = self._executor
+        if len(request_line) >= 2:
+            method, path = request_line[0], request_line[1].split('?', 1)[0]
+            matched, _ = match_route(self.routes, 'GET' if method == 'HEAD' else method, path)
+            if matched is not None and matched.outbound:
+                executor = self._outbound_executor
+
+        handler = self.handler_class.__new__(self.handler_class)
+        handler.server = self
+        handler.request = None
+        handler.client_address = writer.get_extra_info('peername') or ('', 0)
+        handler.rfile = _LoopReader(head, reader, loop)
+        handler.wfile = _LoopWriter(writer, loop)
+        handler.close_connection = True
+        try:
+            # Same parsing, validation and dispatch as on the threaded engine
+            await loop.run_in_executor(executor, handler.handle_one_request)
+        except (ConnectionError, asyncio.TimeoutError) as e:
+            logger.debug("Connection from %s dropped: %s", handler.client_address, e)
+            return False
+        except Exception:
+            logger.exception("Error while serving %s", handler.client_address)
+            return False
+        return not handler.close_connection
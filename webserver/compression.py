@@ -0,0 +1,102 @@
+"""
+Response compression negotiated on Accept-Encoding.
+
+Pages, htmx fragments and exports are repetitive HTML/JSON and shrink
+several times. Brotli is used when the optional `brotli` package is
+installed and the client accepts it, gzip otherwise. Bodies under
+MIN_COMPRESS_SIZE are sent as they are: the framing overhead would eat the
+gain.
+"""
+import io
+import gzip
+
+try:
+    import brotli
+except ImportError:  # optional dependency
+    brotli = None
+
+MIN_COMPRESS_SIZE = 1024  # bytes
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5  # per-response compression: fast, still well ahead of gzip
+BROTLI_STATIC_QUALITY = 11  # static assets are compressed once, at startup
+
+COMPRESSIBLE_TYPES = ('text/', 'application/json', 'application/javascript', 'image/svg+xml')
+
+
+def available_encodings():
+    """Encodings this server can produce, in order of preference."""
+    return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+def is_compressible(content_type):
+    return (content_type or '').lower().startswith(COMPRESSIBLE_TYPES)
+
+
+def choose_encoding(accept_encoding, available=None):
+    """
+    Returns the preferred encoding accepted by the client (e.g. 'br' or
+    'gzip'), or None to send the body as it is.
+    """
+    available = available_encodings() if available is None else available
+    accepted = {}
+    for part in (accept_encoding or '').split(','):
+        name, _, params = part.strip().partition(';')
+        name = name.strip().lower()
+        if not name:
+            continue
+        quality = 1.0
+        for param in params.split(';'):
+            key, _, value = param.strip().partition('=')
+            if key.strip().lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        accepted[name] = quality
+
+    best, best_quality = None, 0.0
+    for encoding in available:
+        quality = accepted.get(encoding, accepted.get('*', 0.0))
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def compress(payload, encoding, static=False):
+    """Compresses a whole body with `encoding` ('br' or 'gzip')."""
+    if encoding == 'br':
+        return brotli.compress(payload, quality=BROTLI_STATIC_QUALITY if static else BROTLI_QUALITY)
+    if encoding == 'gzip':
+        # mtime=0: the same body always gives the same bytes (precompressed assets, ETags)
+        return gzip.compress(payload, compresslevel=9 if static else GZIP_LEVEL, mtime=0)
+    raise ValueError(f"Unsupported encoding: {encoding}")
+
+
+class _BrotliWriter(io.RawIOBase):
+    def __init__(self, fileobj):
+        self._fileobj = fileobj
+        self._compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._fileobj.write(self._compressor.process(bytes(data)))
+        return len(data)
+
+    def close(self):
+        if not self.closed:
+            self._fileobj.write(self._compressor.finish())
+        super().close()
+
+
+def compressing_writer(fileobj, encoding):
+    """
+    Returns a binary file object compressing what is written to it into
+    `fileobj` (left open). Close it to write the end of the stream.
+    """
+    if encoding == 'br':
+        return _BrotliWriter(fileobj)
+    if encoding == 'gzip':
+        return gzip.GzipFile(fileobj=fileobj, mode='wb', compresslevel=GZIP_LEVEL, mtime=0)
+    raise ValueError(f"Unsupported encoding: {encoding}")
@@ -0,0 +1,72 @@
+"""
+LRU cache of rendered bookmark fragments (card and compact item).
+
+Entries are keyed by (bookmark id, row version, language, view). The row
+version is bumped by a database trigger on every change of a displayed
+field, whoever writes the row (web UI, bot, tag worker), so a stale
+fragment is never found: it just ages out. The web UI's own writes also
+drop the fragments of the bookmark right away (`invalidate`).
+"""
+import threading
+from collections import OrderedDict
+
+DEFAULT_MAX_ENTRIES = 5000  # a few MB of HTML
+
+
+class FragmentCache:
+    """
+    Thread-safe LRU of HTML fragments.
+
+    Args:
+        max_entries (int): Fragments kept before the least recently used are evicted.
+    """
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # (id, version, lang, view) -> html
+        self._keys_by_id = {}  # id -> set of keys, for invalidate()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get_or_render(self, bookmark_id, version, lang_code, view, render):
+        """Returns the cached fragment, or calls `render()` and caches its result."""
+        key = (bookmark_id, version, lang_code, view)
+        with self._lock:
+            html = self._entries.get(key)
+            if html is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return html
+            self.misses += 1
+
+        html = render()
+        with self._lock:
+            self._entries[key] = html
+            self._entries.move_to_end(key)
+            self._keys_by_id.setdefault(bookmark_id, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                old_key, _ = self._entries.popitem(last=False)
+                self._discard_key(old_key)
+        return html
+
+    def invalidate(self, bookmark_id):
+        """Drops every fragment of a bookmark (all versions, languages and views)."""
+        with self._lock:
+            for key in self._keys_by_id.pop(bookmark_id, ()):
+                self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._keys_by_id.clear()
+
+    def _discard_key(self, key):
+        keys = self._keys_by_id.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_id[key[0]]
@@ -3,6 +3,11 @@ Module for generating the web page HTML.
 """
 import json
 
+# The export renderers are shared with the bot's /export command
+from shared.export import ICON_HN, ICON_OPEN, build_export_html_document, render_bookmark_card_export
+
+from .static_assets import static_url
+
 def get_login_page(self, error=None):
     """Generates the HTML for the login page."""
     error_html = f'<div class="login-error">{error}</div>' if error else ''
@@ -13,11 +18,11 @@ def get_login_page(self, error=None):
     <meta charset="UTF-8">
     <meta name="viewport" content="width=device-width, initial-scale=1.0">
     <title>Login - Zitzu's Bookmarks</title>
-    <link rel="icon" href="/static/img/favicon.svg" type="image/svg+xml">
+    <link rel="icon" href="{static_url('img/favicon.svg')}" type="image/svg+xml">
     <link rel="alternate icon" href="/favicon.ico" type="image/x-icon">
-    <link rel="apple-touch-icon" href="/static/img/favicon.svg">
-    <link rel="stylesheet" href="/static/style.css">
-    <link rel="stylesheet" href="/static/export-styles.css">
+    <link rel="apple-touch-icon" href="{static_url('img/favicon.svg')}">
+    <link rel="stylesheet" href="{static_url('style.css')}">
+    <link rel="stylesheet" href="{static_url('export-styles.css')}">
     <style nonce="{self.nonce}">
         body {{ display: flex; align-items: center; justify-content: center; }}
         .login-container {{ background: white; padding: 40px; border-radius: 12px; box-shadow: 0 10px 30px rgba(0,0,0,0.1); width: 100%; max-width: 400px; }}
@@ -40,16 +45,14 @@ def get_login_page(self, error=None):
 """
 
 # --- Icon Definitions ---
-ICON_OPEN = '<svg width="16" height="16" viewBox="0 0 24 24" fill="none" stroke="currentColor" stroke-width="2" stroke-linecap="round" stroke-linejoin="round"><path d="M18 13v6a2 2 0 0 1-2 2H5a2 2 0 0 1-2-2V8a2 2 0 0 1 2-2h6"></path><polyline points="15 3 21 3 21 9"></polyline><line x1="10" y1="14" x2="21" y2="3"></line></svg>'
 ICON_EDIT = '<svg width="16" height="16" viewBox="0 0 24 24" fill="none" stroke="currentColor" stroke-width="2" stroke-linecap="round" stroke-linejoin="round"><path d="M11 4H4a2 2 0 0 0-2 2v14a2 2 0 0 0 2 2h14a2 2 0 0 0 2-2v-7"></path><path d="M18.5 2.5a2.121 2.121 0 0 1 3 3L12 15l-4 1 1-4 9.5-9.5z"></path></svg>'
 ICON_DELETE = '<svg width="16" height="16" viewBox="0 0 24 24" fill="none" stroke="currentColor" stroke-width="2" stroke-linecap="round" stroke-linejoin="round"><polyline points="3 6 5 6 21 6"></polyline><path d="M19 6v14a2 2 0 0 1-2 2H7a2 2 0 0 1-2-2V6m3 0V4a2 2 0 0 1 2-2h4a2 2 0 0 1 2 2v2"></path><line x1="10" y1="11" x2="10" y2="17"></line><line x1="14" y1="11" x2="14" y2="17"></line></svg>'
 ICON_READ = '<svg width="16" height="16" viewBox="0 0 24 24" fill="none" stroke="currentColor" stroke-width="2" stroke-linecap="round" stroke-linejoin="round"><path d="M22 11.08V12a10 10 0 1 1-5.93-9.14"></path><polyline points="22 4 12 14.01 9 11.01"></polyline></svg>'
 ICON_UNREAD = '<svg width="16" height="16" viewBox="0 0 24 24" fill="none" stroke="currentColor" stroke-width="2" stroke-linecap="round" stroke-linejoin="round"><circle cx="12" cy="12" r="10"></circle></svg>'
-ICON_HN = '<svg width="16" height="16" viewBox="0 0 24 24" fill="none" stroke="currentColor" stroke-width="2" stroke-linecap="round" stroke-linejoin="round"><path d="M21 15a2 2 0 0 1-2 2H7l-4 4V5a2 2 0 0 1 2-2h14a2 2 0 0 1 2 2z"></path></svg>'
 
 def render_bookmark_card(bookmark, translations):
     """Renders a single bookmark as an HTML card."""
-    (id, url, title, description, image_url, domain, saved_at, telegram_user_id, telegram_message_id, comments_url, tags, is_read) = bookmark
+    (id, url, title, description, image_url, domain, saved_at, telegram_user_id, telegram_message_id, comments_url, tags, is_read) = bookmark[:12]
     
     def escape_html(text):
         if text is None: return ""  # noqa: E701
@@ -115,7 +118,7 @@ def render_bookmark_card(bookmark, translations):
 
 def render_bookmark_compact_item(bookmark, translations):
     """Renders a single bookmark as a compact list item."""
-    (id, url, title, _, image_url, domain, saved_at, telegram_user_id, telegram_message_id, comments_url, tags, is_read) = bookmark
+    (id, url, title, _, image_url, domain, saved_at, telegram_user_id, telegram_message_id, comments_url, tags, is_read) = bookmark[:12]
 
     def escape_html(text):
         if text is None: return ""  # noqa: E701
@@ -171,85 +174,31 @@ def render_bookmark_compact_item(bookmark, translations):
     </div>
     """
 
-def render_bookmarks(bookmarks, translations):
+def _render_items(bookmarks, translations, render_item, view, fragment_cache, lang_key):
+    """
+    Renders each bookmark with `render_item`. With a FragmentCache, rows
+    carrying their row_version (13th column) are looked up by
+    (id, row_version, lang_key, view) and rendered only on a miss.
+    """
+    if fragment_cache is None:
+        return "".join(render_item(b, translations) for b in bookmarks)
+    return "".join(
+        fragment_cache.get_or_render(b[0], b[12], lang_key, view, lambda b=b: render_item(b, translations))
+        if len(b) > 12 else render_item(b, translations)
+        for b in bookmarks
+    )
+
+def render_bookmarks(bookmarks, translations, fragment_cache=None, lang_key=None):
     """Renders a list of bookmarks into HTML cards."""
     if not bookmarks:
         return f"<p>{translations.get('no_bookmarks_found', 'No bookmarks found.')}</p>"
-    return "".join(render_bookmark_card(b, translations) for b in bookmarks)
+    return _render_items(bookmarks, translations, render_bookmark_card, 'cards', fragment_cache, lang_key)
 
-def render_bookmarks_compact(bookmarks, translations):
+def render_bookmarks_compact(bookmarks, translations, fragment_cache=None, lang_key=None):
     """Renders a list of bookmarks into a compact HTML list."""
     if not bookmarks:
         return f"<p>{translations.get('no_bookmarks_found', 'No bookmarks found.')}</p>"
-    return "".join(render_bookmark_compact_item(b, translations) for b in bookmarks)
-
-
-def render_bookmark_card_export(bookmark, translations):
-    """Renders a single bookmark as an HTML card for export (no action buttons)."""
-    # Handle both tuple and dict formats
-    if isinstance(bookmark, tuple):
-        (id, url, title, description, image_url, domain, saved_at, telegram_user_id, telegram_message_id, comments_url, tags, is_read) = bookmark
-    else:  # dict format
-        id = bookmark['id']
-        url = bookmark['url']
-        title = bookmark['title']
-        description = bookmark['description']
-        image_url = bookmark['image_url']
-        domain = bookmark['domain']
-        saved_at = bookmark['saved_at']
-        telegram_user_id = bookmark['telegram_user_id']
-        telegram_message_id = bookmark['telegram_message_id']
-        comments_url = bookmark['comments_url']
-        tags = bookmark['tags']
-        is_read = bookmark['is_read']
-    
-    def escape_html(text):
-        if text is None: return ""  # noqa: E701
-        return str(text).replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;").replace('"', '&quot;')
-
-    # Handle tags safely - they might be JSON string, empty, or invalid
-    try:
-        if isinstance(tags, str) and tags.strip():
-            parsed_tags = json.loads(tags)
-        elif isinstance(tags, (list, dict)):
-            parsed_tags = tags
-        else:
-            parsed_tags = []
-    except (json.JSONDecodeError, AttributeError):
-        parsed_tags = []
-
-    class_attr = f"bookmark-card {'read' if is_read else ''}".strip()
-    read_button_title = translations.get("tooltip_mark_as_unread", "Mark as unread") if is_read else translations.get("tooltip_mark_as_read", "Mark as read")
-    read_button_icon = ICON_READ if is_read else ICON_UNREAD
-
-    return f"""
-    <div id="bookmark-card-{id}" class="{class_attr}" data-id="{id}" data-is-read="{1 if is_read else 0}">
-        <div class="bookmark-main">
-            <div class="bookmark-visuals">
-                <div class="image-placeholder{'' if image_url else ' has-error'}">
-                    {f'<img src="{escape_html(image_url)}" alt="Preview" class="bookmark-image">' if image_url else ''}
-                </div>
-                <div class="bookmark-actions">
-                    <a href="{escape_html(url)}" target="_blank" class="icon-btn" title="{translations.get('tooltip_open_link', 'Open link')}">{ICON_OPEN}</a>                    
-                </div>
-            </div>
-            <div class="bookmark-details">
-                <h3 class="bookmark-title"><a href="{escape_html(url)}" target="_blank">{escape_html(title)}</a></h3>
-            </div>
-        </div>
-        <p class="bookmark-description">{escape_html(description)}</p>
-        <div class="bookmark-tags">
-            {''.join(f'<span class="tag">{escape_html(t)}</span>' for t in parsed_tags)}
-        </div>
-        <div class="bookmark-footer">
-            <div class="bookmark-footer-meta">
-                <span class="bookmark-date">{saved_at.split(' ')[0]}</span>
-                <span class="bookmark-id">ID {id}</span>
-            </div>
-            {f'<a href="{escape_html(comments_url)}" target="_blank" class="hn-link" title="{translations.get("tooltip_hn_comments", "View HN comments")}">{ICON_HN} HN Comments</a>' if comments_url else ''}
-        </div>
-    </div>
-    """
+    return _render_items(bookmarks, translations, render_bookmark_compact_item, 'compact', fragment_cache, lang_key)
 
 
 def render_bookmarks_export(bookmarks, translations):
@@ -259,29 +208,8 @@ def render_bookmarks_export(bookmarks, translations):
     return "".join(render_bookmark_card_export(b, translations) for b in bookmarks)
 
 
-def build_export_html_document(html_content, total_count, generated_at):
-    """Builds a complete HTML document for bookmark export."""
-    generated_at_text = generated_at.strftime('%Y-%m-%d %H:%M:%S')
-    return f"""<!DOCTYPE html>
-<html lang="en">
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>Bookmarks Export</title>
-    <link rel="stylesheet" href="/static/export-page.css">
-</head>
-<body>
-    <div class="container">
-        <h1>📚 Bookmarks Export</h1>
-        <p class="export-info">Exported on {generated_at_text} | Total: {total_count} bookmarks</p>
-        <div class="bookmarks-container">
-            {html_content}
-        </div>
-    </div>
-</body>
-</html>"""
-
-def get_html(self, bookmarks, version="N/A", total_count=0, translations={}, search_query=None, has_more=False):
+def get_html(self, bookmarks, version="N/A", total_count=0, translations={}, search_query=None, has_more=False,
+             fragment_cache=None, lang_key=None, view='cards'):
     # HTML escape function to avoid issues with quotes in data
     def escape_html(text):
         if text is None:
@@ -317,11 +245,11 @@ def get_html(self, bookmarks, version="N/A", total_count=0, translations={}, sea
     <meta charset="UTF-8">
     <meta name="viewport" content="width=device-width, initial-scale=1.0">
     <title>{translations.get('page_title', "Zitzu's Bookmarks")}</title>
-    <link rel="icon" href="/static/img/favicon.svg" type="image/svg+xml">
+    <link rel="icon" href="{static_url('img/favicon.svg')}" type="image/svg+xml">
     <link rel="alternate icon" href="/favicon.ico" type="image/x-icon">
-    <link rel="apple-touch-icon" href="/static/img/favicon.svg">
-    <link rel="stylesheet" href="/static/style.css">
-    <link rel="stylesheet" href="/static/export-styles.css">
+    <link rel="apple-touch-icon" href="{static_url('img/favicon.svg')}">
+    <link rel="stylesheet" href="{static_url('style.css')}">
+    <link rel="stylesheet" href="{static_url('export-styles.css')}">
     <script src="https://cdn.jsdelivr.net/npm/@alpinejs/csp@3.x.x/dist/cdn.min.js" nonce="{self.nonce}" defer></script>
     <meta name="htmx-config" content='{{"defaultSwapTransition": false}}'>
     <script src="https://unpkg.com/htmx.org@1.9.10" integrity="sha384-D1Kt99CQMDuVetoL1lrYwg5t+9QdHe7NLX/SoJYkXDFfX37iInKRy5xLSi8nO7UC" crossorigin="anonymous" nonce="{self.nonce}"></script>
@@ -337,7 +265,8 @@ def get_html(self, bookmarks, version="N/A", total_count=0, translations={}, sea
 
             Alpine.data('viewControls', () => ({{
                 theme: 'light',
-                view: 'cards',
+                // Active view, from the 'view' cookie: only this one is rendered by the server
+                view: '{'compact' if view == 'compact' else 'cards'}',
                 sortOrder: 'desc',
                 hideRead: true,
                 activeSpecialFilter: null,
@@ -349,7 +278,8 @@ def get_html(self, bookmarks, version="N/A", total_count=0, translations={}, sea
                         'filter_type': this.activeSpecialFilter,
                         'search_query': this.searchQuery,
                         'limit': {self.DEFAULT_PAGE_SIZE},
-                        'offset': offset
+                        'offset': offset,
+                        'view': this.view
                     }});
                 }},
                 init: function() {{
@@ -363,8 +293,11 @@ def get_html(self, bookmarks, version="N/A", total_count=0, translations={}, sea
                     const savedSortOrder = localStorage.getItem('sortOrder');
                     this.sortOrder = savedSortOrder || 'desc';
 
+                    // Choice saved before the cookie existed: switch to it once (this also sets the cookie)
                     const savedView = localStorage.getItem('view');
-                    this.view = savedView || 'cards'; // Default to cards if not saved
+                    if (savedView && savedView !== this.view && !document.cookie.includes('view=')) {{
+                        this.toggleView();
+                    }}
 
                     // Apply theme to html tag initially
                     document.documentElement.classList.toggle('dark-mode', this.theme === 'dark');
@@ -383,9 +316,15 @@ def get_html(self, bookmarks, version="N/A", total_count=0, translations={}, sea
                 }},
                 toggleView: function() {{
                     this.view = (this.view === 'cards' ? 'compact' : 'cards');
-                    // Persist view state
+                    // Persist view state (the cookie tells the server which view to render)
                     localStorage.setItem('view', this.view);
-                    // No htmx request needed here, Alpine.js handles the class toggling
+                    document.cookie = 'view=' + this.view + '; path=/; max-age=31536000; SameSite=Lax';
+                    // The other view was not rendered: load the items already shown, in the new view,
+                    // and keep the scroll cursor where it is
+                    const vals = JSON.parse(this.getHtmxVals(0));
+                    const visible = parseInt(document.getElementById('visibleCount').textContent, 10) || 0;
+                    vals.limit = Math.max(visible, {self.DEFAULT_PAGE_SIZE});
+                    window.htmx.ajax('GET', '/ui/bookmarks', {{ values: vals, swap: 'none' }});
                 }},
                 toggleSort: function() {{
                     this.sortOrder = (this.sortOrder === 'desc' ? 'asc' : 'desc');
@@ -450,6 +389,8 @@ def get_html(self, bookmarks, version="N/A", total_count=0, translations={}, sea
 
                 updateField: function(field, value) {{
                     this.bookmark[field] = value;
+                    // Tags typed by the user are final and must not be replaced by LLM tags
+                    if (field === 'tags') this.bookmark.auto_tags = false;
                 }},
 
                 submit: function() {{
@@ -542,6 +483,8 @@ def get_html(self, bookmarks, version="N/A", total_count=0, translations={}, sea
                         this.bookmark.image_url = metadata.image_url || this.bookmark.image_url;
                         if (Array.isArray(metadata.tags) && metadata.tags.length > 0) {{
                             this.bookmark.tags = metadata.tags.join(', ');
+                            // Provisional local tags: the server refines them with the LLM after saving
+                            this.bookmark.auto_tags = metadata.tags_source === 'local';
                         }}
                         showToast(window.TRANSLATIONS.toast_metadata_scraped_success || "Metadata scraped successfully!", false);
                     }} catch (error) {{
@@ -640,12 +583,12 @@ def get_html(self, bookmarks, version="N/A", total_count=0, translations={}, sea
         <div id="bookmarkViewsContainer">
             <!-- Normal view (cards) -->
             <div class="bookmarks-grid" :class="view === 'cards' ? '' : 'hidden'" id="bookmarksGrid">
-                {render_bookmarks(bookmarks, translations)}
+                {render_bookmarks(bookmarks, translations, fragment_cache, lang_key) if view != 'compact' else ''}
             </div>
 
             <!-- Compact view -->
             <div class="bookmarks-compact" :class="view === 'compact' ? '' : 'hidden'" id="bookmarksCompact">
-                {render_bookmarks_compact(bookmarks, translations)}
+                {render_bookmarks_compact(bookmarks, translations, fragment_cache, lang_key) if view == 'compact' else ''}
             </div>
         </div>
         
@@ -739,8 +682,8 @@ def get_html(self, bookmarks, version="N/A", total_count=0, translations={}, sea
             'initialCount': {len(bookmarks)},
             'totalCount': {total_count}
         }};
-        window.TRANSLATIONS = {json.dumps(translations)};
+        window.TRANSLATIONS = {json.dumps(dict(translations))};
     </script>
-    <script src="/static/app.js" defer></script>
+    <script src="{static_url('app.js')}" defer></script>
 </body>
 </html>"""
\ No newline at end of file
@@ -0,0 +1,34 @@
+"""
+Routing table of the web server, shared by its serving engines.
+
+BookmarkHandler dispatches every request through `match_route`, whether it
+runs on the thread pool (PooledHTTPServer) or on the event loop
+(AsyncBookmarkServer, which also reads the `outbound` flag to keep slow
+routes away from the other requests).
+"""
+import re
+from collections import namedtuple
+
+# auth: None (public), 'page' (redirect to /login) or 'api' (401 JSON error).
+# query: the handler receives the bookmark list parameters of the query string.
+# outbound: the route waits on remote sites or the LLM.
+Route = namedtuple('Route', 'method pattern handler auth query outbound')
+
+# Authentication required for paths without a route, before answering 404
+DEFAULT_AUTH = {'GET': 'page', 'POST': 'api', 'PUT': 'api', 'DELETE': 'api'}
+
+
+def route(method, pattern, handler, auth=None, query=False, outbound=False):
+    """Builds a Route; `pattern` must match the whole path, its groups are passed to the handler."""
+    return Route(method, re.compile(pattern), handler, auth, query, outbound)
+
+
+def match_route(routes, method, path):
+    """Returns (route, path arguments) for a request, or (None, ()) if no route matches."""
+    for candidate in routes:
+        if candidate.method != method:
+            continue
+        match = candidate.pattern.fullmatch(path)
+        if match:
+            return candidate, match.groups()
+    return None, ()
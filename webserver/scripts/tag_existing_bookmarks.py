@@ -3,6 +3,7 @@
 Batch script to generate tags for existing bookmarks using the local extractor.
 Usage:
   python scripts/tag_existing_bookmarks.py --dry-run --limit 50
+  python scripts/tag_existing_bookmarks.py --engine frequency
 """
 import argparse
 import sqlite3
@@ -16,6 +17,7 @@ sys.path.append(str(SCRIPT_DIR))
 
 from shared.database import get_db_path, init_database
 from shared.utils import generate_tags
+from shared.tagging import get_tag_engine, rebuild_term_stats
 
 
 def main():
@@ -23,6 +25,8 @@ def main():
     parser.add_argument('--dry-run', action='store_true', help='Do not write changes to the DB')
     parser.add_argument('--limit', type=int, default=0, help='Limit number of bookmarks processed (0 = all)')
     parser.add_argument('--min-empty', action='store_true', help='Only process bookmarks with empty or null tags')
+    parser.add_argument('--engine', choices=['tfidf', 'frequency'], default='tfidf',
+                        help='tfidf rebuilds the corpus statistics and batch-scores all rows; frequency uses raw term counts')
     args = parser.parse_args()
 
     db_path = get_db_path()
@@ -31,25 +35,39 @@ def main():
     init_database(conn)
     cursor = conn.cursor()
 
-    query = "SELECT id, title, description, tags FROM bookmarks"
+    query = "SELECT id, user_id, title, description, tags FROM bookmarks"
     rows = cursor.execute(query).fetchall()
 
     to_process = []
     for r in rows:
-        bid, title, desc, tags = r
+        bid, user_id, title, desc, tags = r
         if args.min_empty:
             if tags and str(tags).strip():
                 continue
-        to_process.append((bid, title or '', desc or '', tags))
+        to_process.append((bid, user_id, title or '', desc or '', tags))
 
     if args.limit and args.limit > 0:
         to_process = to_process[:args.limit]
 
     print(f"Processing {len(to_process)} bookmarks (dry-run={args.dry_run})")
 
-    for bid, title, desc, existing_tags in to_process:
-        combined = f"{title}\n{desc}"
-        tags = generate_tags(combined, n=3)
+    texts = [f"{title}\n{desc}" for _, _, title, desc, _ in to_process]
+    if args.engine == 'tfidf':
+        doc_count = rebuild_term_stats(cursor)
+        print(f"Corpus statistics rebuilt from {doc_count} bookmarks")
+        # Each user's bookmarks are scored against that user's statistics
+        positions = {}
+        for position, (_, user_id, _, _, _) in enumerate(to_process):
+            positions.setdefault(user_id, []).append(position)
+        all_tags = [None] * len(to_process)
+        for user_id, user_positions in positions.items():
+            user_tags = get_tag_engine().score_batch(user_id, [texts[p] for p in user_positions], n=3)
+            for position, tags in zip(user_positions, user_tags):
+                all_tags[position] = tags
+    else:
+        all_tags = [generate_tags(text, n=3) for text in texts]
+
+    for (bid, _, title, desc, existing_tags), tags in zip(to_process, all_tags):
         print(f"{bid}: {tags}")
         if not args.dry_run:
             tags_json = json.dumps(tags, ensure_ascii=False)
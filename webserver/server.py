@@ -6,15 +6,19 @@ import os
 import sqlite3
 import ssl
 import json
-import csv
 import re
+import tempfile
 import logging
+import signal
+import asyncio
+import threading
 from http.server import HTTPServer, BaseHTTPRequestHandler
 from http.cookies import SimpleCookie
 from urllib.parse import urlparse, parse_qs
 import socket
 import sys
 from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
 import argparse
 import secrets
 from datetime import datetime, timedelta
@@ -25,15 +29,23 @@ SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 sys.path.append(os.path.dirname(SCRIPT_DIR))
 
  
-from shared.utils import extract_domain, get_article_metadata, generate_tags, generate_tags_llm
+from shared.utils import extract_domain, get_article_metadata, generate_tags, get_tag_suggester, llm_tagging_enabled
 from shared.database import get_db_path
+from shared.llm_limiter import get_llm_stats
+from shared.tagging import get_tag_engine
+from shared.tag_queue import TagWorker, enqueue_tag_job
+from shared.export import EXPORT_FORMATS, write_export
+from .routing import DEFAULT_AUTH, match_route, route
+from .compression import MIN_COMPRESS_SIZE, choose_encoding, compress, compressing_writer, is_compressible
+from .static_assets import STATIC_ASSETS, asset_etag, asset_last_modified
+from .translations import DEFAULT_LANGUAGE, TranslationCatalogs
+from .fragment_cache import FragmentCache
+from .async_engine import AsyncBookmarkServer
 from .htmldata import (
     get_html,
     render_bookmarks,
     render_bookmarks_compact,
     get_login_page,
-    render_bookmarks_export,
-    build_export_html_document,
 )
 __version__ = "2.0.5"
 
@@ -46,7 +58,20 @@ logger = logging.getLogger(__name__)
 # Default
 DB_PATH = get_db_path()
 DEFAULT_PAGE_SIZE = 20 # Default number of bookmarks per page for infinite scrolling
+EXPORT_CHUNK_SIZE = 64 * 1024 # Bytes copied per write when sending an export
+DEFAULT_WORKERS = 8 # Threads serving requests concurrently (--workers)
+DRAIN_TIMEOUT_SECONDS = 30 # Time given to the requests in flight on shutdown
+TLS_HANDSHAKE_TIMEOUT_SECONDS = 10
+KEEPALIVE_TIMEOUT_SECONDS = 15 # An idle persistent connection is closed after this long
+DB_BUSY_TIMEOUT_SECONDS = 30 # Wait for the write lock (bot, tag worker, other requests)
 PORT = 8443
+# Static URLs carrying the content hash (static_url) never change
+VIEWS = ('cards', 'compact') # Bookmark list layouts; only the active one is rendered
+DEFAULT_VIEW = 'cards'
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+# Background LLM tagging worker, started in main()
+tag_worker = None
 
 
 def load_local_env(env_path):
@@ -70,44 +95,138 @@ def load_local_env(env_path):
 
     return True
 
+_thread_state = threading.local()
+
+
 @contextmanager
 def db_connection():
-    """Context manager to handle database connections safely."""
-    conn = sqlite3.connect(DB_PATH, detect_types=sqlite3.PARSE_DECLTYPES)
+    """
+    Context manager to handle database connections safely.
+
+    Each request thread keeps its connection between requests (the threads
+    are pooled, see PooledHTTPServer); a nested use on the same thread opens
+    its own connection. Commits on success, rolls back on error.
+    """
+    # Taken out while in use, so that a nested call cannot share the transaction
+    conn = _thread_state.__dict__.pop('conn', None)
+    if conn is None:
+        conn = sqlite3.connect(DB_PATH, detect_types=sqlite3.PARSE_DECLTYPES, timeout=DB_BUSY_TIMEOUT_SECONDS)
     try:
         yield conn.cursor()
         conn.commit()
+    except BaseException:
+        try:
+            conn.rollback()
+        except sqlite3.Error:
+            conn.close()
+            conn = None
+        raise
     finally:
-        conn.close()
-
-SUPPORTED_LANGUAGES = ['en', 'it']
-DEFAULT_LANGUAGE = 'en'
+        if conn is not None:
+            if 'conn' in _thread_state.__dict__:
+                conn.close()
+            else:
+                _thread_state.conn = conn
+
+# Catalogs of webserver/locales, parsed once (languages are discovered from the file names)
+TRANSLATIONS = TranslationCatalogs(default_language=DEFAULT_LANGUAGE)
+
+# Rendered cards and compact items, keyed by (id, row_version, language, view)
+FRAGMENTS = FragmentCache()
+
+# Routes of BookmarkHandler, for both engines (see webserver/routing.py).
+# Groups of the patterns are bookmark ids.
+ROUTES = [
+    route('GET', r'/login', 'serve_login_page'),
+    route('GET', r'/logout', 'handle_logout'),
+    # Static files are served without authentication
+    route('GET', r'/static/.*', 'serve_static_file'),
+    route('GET', r'/', 'serve_homepage', auth='page'),
+    route('GET', r'/api/bookmarks', 'serve_bookmarks_api', auth='page', query=True),
+    route('GET', r'/api/llm/stats', 'serve_llm_stats', auth='page'),
+    route('GET', r'/api/export/csv', 'serve_export_csv', auth='page'),
+    route('GET', r'/api/export/json', 'serve_export_json', auth='page'),
+    route('GET', r'/api/export/html', 'serve_export_html', auth='page'),
+    route('GET', r'/ui/bookmarks', 'serve_bookmarks_ui', auth='page', query=True),
+    route('GET', r'/ui/bookmarks/scroll', 'serve_bookmarks_scroll_ui', auth='page', query=True),
+    route('GET', r'/favicon.ico', 'serve_favicon', auth='page'),
+    route('POST', r'/login', 'handle_login'),
+    route('POST', r'/api/bookmarks', 'add_bookmark', auth='api'),
+    route('POST', r'/api/scrape', 'scrape_metadata', auth='api', outbound=True),
+    route('PUT', r'/api/bookmarks/([^/]+)/read/?', 'mark_read', auth='api'),
+    route('PUT', r'/api/bookmarks/([^/]+)(?:/.*)?', 'update_bookmark', auth='api'),
+    route('DELETE', r'/api/bookmarks/([^/]+)/?', 'delete_bookmark', auth='api'),
+]
 
 def load_translations(lang_code):
-    """Loads the translation dictionary from a JSON file."""
-    # Sanitize lang_code to prevent directory traversal
+    """Returns the (read-only) translation dictionary of a language, or of the default one."""
     lang_code = re.sub(r'[^a-zA-Z_-]', '', lang_code).split('-')[0].lower()
-    if lang_code not in SUPPORTED_LANGUAGES:
-        lang_code = DEFAULT_LANGUAGE
-
-    filepath = os.path.join(SCRIPT_DIR, 'locales', f'{lang_code}.json')
-    
-    try:
-        with open(filepath, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except (FileNotFoundError, json.JSONDecodeError):
-        # Fallback to default language if the file is missing or corrupt
-        return load_translations(DEFAULT_LANGUAGE)
+    return TRANSLATIONS.get(lang_code)
 
 class BookmarkHandler(BaseHTTPRequestHandler):
     # Override server_version to prevent revealing Python version
     server_version = "Web Server"
+    # Persistent connections: htmx requests reuse the TCP/TLS connection of the page.
+    # Every response must therefore carry an exact Content-Length.
+    protocol_version = "HTTP/1.1"
+    # Socket timeout, also the idle time allowed between two requests of a connection
+    timeout = KEEPALIVE_TIMEOUT_SECONDS
+    # Headers and body are separate writes: without TCP_NODELAY the body of a
+    # reused connection waits for the delayed ACK of the headers (~40 ms)
+    disable_nagle_algorithm = True
 
     def version_string(self):
         """Overrides the 'Server' header to not reveal the software version."""
         # This method is also called, so we return the same generic string.
         return self.server_version
 
+    def handle_one_request(self):
+        super().handle_one_request()
+        if not self.close_connection and hasattr(self.server, 'connection_idle'):
+            # Waiting for the next request: the server may close the connection on shutdown
+            self.server.connection_idle(self.connection)
+
+    def parse_request(self):
+        """Resets the per-request state: the handler serves every request of a connection."""
+        if hasattr(self.server, 'connection_busy'):
+            self.server.connection_busy(self.connection)
+        self.__dict__.pop('nonce', None)
+        self._body_read = False
+        return super().parse_request()
+
+    def log_error(self, format, *args):
+        # An idle persistent connection reaching its timeout is not an error
+        if format.startswith("Request timed out"):
+            return
+        super().log_error(format, *args)
+
+    def end_headers(self):
+        """Asks the client to close the connection when it cannot be reused for another request."""
+        if not self.close_connection and (self._has_unread_body() or not getattr(self.server, 'keep_alive', True)):
+            # send_header() also sets close_connection
+            self.send_header('Connection', 'close')
+        super().end_headers()
+
+    def _has_unread_body(self):
+        """True if the request body was not consumed, so the next request would start in the middle of it."""
+        if getattr(self, '_body_read', False):
+            return False
+        if self.headers.get('Transfer-Encoding'):
+            return True
+        content_length = self.headers.get('Content-Length')
+        if content_length is None:
+            # Without a length, a body can only end when the client closes the connection
+            return self.command in ('POST', 'PUT', 'PATCH')
+        try:
+            return int(content_length) != 0
+        except ValueError:
+            return True
+
+    def _read_request_body(self, content_length):
+        """Reads the request body (Content-Length bytes)."""
+        self._body_read = True
+        return self.rfile.read(content_length)
+
     def get_current_user(self):
         """Verifies the session cookie and returns the user ID if valid."""
         cookies = SimpleCookie(self.headers.get('Cookie'))
@@ -130,24 +249,46 @@ class BookmarkHandler(BaseHTTPRequestHandler):
         # 1. Check for a language query parameter (e.g., /?lang=it)
         query_components = parse_qs(urlparse(self.path).query)
         lang_param = query_components.get('lang', [None])[0]
-        if lang_param in SUPPORTED_LANGUAGES:
+        if lang_param in TRANSLATIONS.languages:
             return lang_param
 
         # 2. Check for a language cookie
         cookies = SimpleCookie(self.headers.get('Cookie'))
         lang_cookie = cookies.get('lang')
-        if lang_cookie and lang_cookie.value in SUPPORTED_LANGUAGES:
+        if lang_cookie and lang_cookie.value in TRANSLATIONS.languages:
             return lang_cookie.value
 
         # 3. Check the Accept-Language header
         accept_language = self.headers.get('Accept-Language', '')
         for lang in accept_language.split(','):
             code = lang.split(';')[0].strip().lower().split('-')[0]
-            if code in SUPPORTED_LANGUAGES:
+            if code in TRANSLATIONS.languages:
                 return code
 
         return DEFAULT_LANGUAGE
 
+    def get_user_view(self):
+        """Determines the bookmark list layout to render ('cards' or 'compact')."""
+        # 1. Check for a view query parameter (sent in the htmx vals)
+        query_components = parse_qs(urlparse(self.path).query)
+        view_param = query_components.get('view', [None])[0]
+        if view_param in VIEWS:
+            return view_param
+
+        # 2. Check for the view cookie, set by the page when the view is toggled
+        cookies = SimpleCookie(self.headers.get('Cookie'))
+        view_cookie = cookies.get('view')
+        if view_cookie and view_cookie.value in VIEWS:
+            return view_cookie.value
+
+        return DEFAULT_VIEW
+
+    def _render_view(self, bookmarks, translations, lang_key, view):
+        """Renders bookmarks in the given view only."""
+        if view == 'compact':
+            return render_bookmarks_compact(bookmarks, translations, FRAGMENTS, lang_key)
+        return render_bookmarks(bookmarks, translations, FRAGMENTS, lang_key)
+
     def _send_security_headers(self):
         """Adds common security headers to all responses."""
         # Generate a nonce if it doesn't exist for this request.
@@ -177,18 +318,46 @@ class BookmarkHandler(BaseHTTPRequestHandler):
         if extra_headers:
             for key, value in extra_headers.items():
                 self.send_header(key, value)
+        self.send_header('Content-Length', '0')
         self.end_headers()
 
     def _send_html_response(self, status_code, html_content, extra_headers=None):
         """Helper to send HTML responses."""
+        self._send_payload(status_code, 'text/html; charset=utf-8', html_content.encode('utf-8'), extra_headers)
+
+    def _send_payload(self, status_code, content_type, payload, extra_headers=None, encodings=None):
+        """
+        Sends a complete response body with its Content-Length (also for HEAD).
+
+        Text bodies of at least MIN_COMPRESS_SIZE bytes are compressed when the
+        client accepts it; `encodings` ({'gzip': bytes, ...}) gives precompressed
+        variants of the payload instead.
+        """
+        headers = dict(extra_headers or {})
+        if is_compressible(content_type):
+            headers['Vary'] = 'Accept-Encoding'
+            if encodings is not None:
+                encoding = self._negotiate_encoding(tuple(encodings))
+                compressed = encodings.get(encoding)
+            else:
+                encoding = self._negotiate_encoding() if len(payload) >= MIN_COMPRESS_SIZE else None
+                compressed = compress(payload, encoding) if encoding else None
+            if compressed is not None:
+                payload = compressed
+                headers['Content-Encoding'] = encoding
+
         self.send_response(status_code)
         self._send_security_headers()
-        self.send_header('Content-type', 'text/html; charset=utf-8')
-        if extra_headers:
-            for key, value in extra_headers.items():
-                self.send_header(key, value)
+        self.send_header('Content-type', content_type)
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.send_header('Content-Length', str(len(payload)))
         self.end_headers()
-        self._write_response_body(html_content.encode('utf-8'))
+        self._write_response_body(payload)
+
+    def _negotiate_encoding(self, available=None):
+        """Content encoding for the response ('br', 'gzip') from Accept-Encoding, or None."""
+        return choose_encoding(self.headers.get('Accept-Encoding'), available)
 
     def _write_response_body(self, payload_bytes):
         """Writes response body unless the request method is HEAD."""
@@ -240,17 +409,19 @@ class BookmarkHandler(BaseHTTPRequestHandler):
             return ''
         return str(value).replace('&', '&amp;').replace('"', '&quot;').replace("'", '&#39;').replace('<', '&lt;').replace('>', '&gt;')
 
-    def _build_load_more_trigger(self, has_more, translations, offset, limit, sort_order, search_query, hide_read, filter_type):
-        """Renders the shared HTMX trigger for infinite scrolling."""
+    def _build_load_more_trigger(self, has_more, translations, offset, limit, sort_order, search_query, hide_read, filter_type,
+                                 view=DEFAULT_VIEW, page_size=None):
+        """Renders the shared HTMX trigger for infinite scrolling (`page_size` defaults to `limit`)."""
         if has_more:
             next_offset = offset + limit
             vals = {
                 'offset': next_offset,
-                'limit': limit,
+                'limit': page_size or limit,
                 'sort_order': sort_order,
                 'search_query': search_query or '',
                 'hide_read': bool(hide_read),
                 'filter_type': filter_type or '',
+                'view': view,
             }
             vals_json = self._escape_html_attr(json.dumps(vals, ensure_ascii=False))
             return f"""
@@ -276,6 +447,7 @@ class BookmarkHandler(BaseHTTPRequestHandler):
         self._send_security_headers()
         self.send_header('WWW-Authenticate', 'Basic realm=\"Test\"')
         self.send_header('Content-type', 'text/html')
+        self.send_header('Content-Length', '0')
         self.end_headers()
 
     def do_OPTIONS(self):
@@ -285,6 +457,7 @@ class BookmarkHandler(BaseHTTPRequestHandler):
         self.send_header('Access-Control-Allow-Origin', '*') # Or be more restrictive
         self.send_header('Access-Control-Allow-Methods', 'GET, POST, PUT, DELETE, OPTIONS')
         self.send_header('Access-Control-Allow-Headers', 'Content-Type, Authorization')
+        self.send_header('Content-Length', '0')
         self.end_headers()
 
     def do_HEAD(self):
@@ -303,95 +476,59 @@ class BookmarkHandler(BaseHTTPRequestHandler):
             return None
         return user_id
 
-    def _parse_bookmark_id_from_parts(self, parts):
-        """Parses bookmark id from split API path parts."""
+    def _dispatch(self, method):
+        """
+        Routes a request through ROUTES: checks the authentication of the
+        route (or of the method, for unknown paths), converts the bookmark id
+        and calls the handler method. Responds 404 for unknown paths.
+        """
+        path = urlparse(self.path).path
+        matched, args = match_route(ROUTES, method, path)
+
+        auth = matched.auth if matched else DEFAULT_AUTH.get(method)
+        if auth == 'page' and not self.get_current_user():
+            self._redirect('/login')
+            return
+        if auth == 'api' and self._require_authenticated_user() is None:
+            return
+        if matched is None:
+            self._send_error_response(404, "Not Found")
+            return
+
         try:
-            return int(parts[2])
-        except (IndexError, ValueError):
+            args = [int(arg) for arg in args]
+        except ValueError:
             self._send_error_response(400, "Invalid bookmark ID")
-            return None
+            return
+        kwargs = self._parse_bookmark_query_params() if matched.query else {}
+        getattr(self, matched.handler)(*args, **kwargs)
 
     def do_GET(self):
         """
         Handles GET requests.
 
-        Supported routes:
+        Supported routes (see ROUTES):
           - /                 -> main page (HTML generated by get_html)
           - /api/bookmarks     -> JSON API that returns the list of bookmarks
-                    - /favicon.ico       -> served via /static/img/favicon.svg
+          - /api/llm/stats     -> JSON counters of the Gemini rate limiter
+          - /api/export/<fmt>  -> csv, json or html export
+          - /ui/bookmarks[/scroll] -> HTML fragments for htmx
+          - /favicon.ico       -> served via /static/img/favicon.svg
 
-        Effect: analyzes self.path, calls the corresponding service method
-        and sends the HTTP response with the appropriate code and headers.
-        Responds 404 for unknown paths.
+        Pages other than /login and /static/ redirect to /login without a session.
         """
-        path = urlparse(self.path).path
-
-        if path == '/login':
-            self.serve_login_page()
-            return
-        elif path == '/logout':
-            self.handle_logout()
-            return
-
-        # Allow access to static files without authentication
-        if path.startswith('/static/'):
-            self.serve_static_file()
-            return
-
-        # Protect all other routes
-        user_id = self.get_current_user()
-        if not user_id:
-            self._redirect('/login')
-            return
-
-        if path == '/':
-            self.serve_homepage()
-        elif path == '/api/bookmarks':
-            params = self._parse_bookmark_query_params()
-            self.serve_bookmarks_api(**params)
-        elif path == '/api/export/csv':
-            self.serve_export_csv()
-        elif path == '/api/export/json':
-            self.serve_export_json()
-        elif path == '/api/export/html':
-            self.serve_export_html()
-        elif path == '/ui/bookmarks': # Exact path match
-            params = self._parse_bookmark_query_params()
-            self.serve_bookmarks_ui(**params)
-        elif path == '/ui/bookmarks/scroll':  # New endpoint for infinite scrolling
-            params = self._parse_bookmark_query_params()
-            self.serve_bookmarks_scroll_ui(**params)
-        elif path == '/favicon.ico':
-            self.path = '/static/img/favicon.svg' # Redirect the standard request to our SVG
-            self.serve_static_file()
-        else:
-            self._send_error_response(404, "Not Found")
+        self._dispatch('GET')
 
     def do_POST(self):
         """
         Handles POST requests.
 
-        Currently only supports the route:
+        Supported routes:
+          - POST /login          : form login
           - POST /api/bookmarks  : adds a new bookmark by reading JSON from the body
-
-        Responds with 404 if the path is not recognized.
+          - POST /api/scrape     : fetches the metadata and tags of a URL
         """
-        path = urlparse(self.path).path
-
-        if path == '/login':
-            self.handle_login()
-            return
-
-        # Protect all other routes
-        if self._require_authenticated_user() is None:
-            return
-
-        if path == '/api/bookmarks':
-            self.add_bookmark()
-        elif path == '/api/scrape':
-            self.scrape_metadata()
-        else:
-            self._send_error_response(404, "Not Found")
+        self._dispatch('POST')
 
     def do_PUT(self):
         """
@@ -401,29 +538,10 @@ class BookmarkHandler(BaseHTTPRequestHandler):
           - PUT /api/bookmarks/<id>        -> updates bookmark fields (calls update_bookmark)
           - PUT /api/bookmarks/<id>/read   -> sets the "is_read" flag (calls mark_read)
 
-        The method parses the path to extract the id. If the id is not
-        an integer, it responds with 400. If the route is not recognized, it responds with 404.
+        A non-integer id gets 400, an unknown route 404.
         """
         logger.info(f"PUT request for: {self.path}")
-
-        if self._require_authenticated_user() is None:
-            return
-
-        parts = urlparse(self.path).path.strip('/').split('/')
-
-        # Supports: /api/bookmarks/<id>  (update)
-        # and /api/bookmarks/<id>/read (set read flag)
-        if len(parts) >= 3 and parts[0] == 'api' and parts[1] == 'bookmarks':
-            bookmark_id = self._parse_bookmark_id_from_parts(parts)
-            if bookmark_id is None:
-                return
-
-            if len(parts) == 4 and parts[3] == 'read':
-                self.mark_read(bookmark_id)
-            else:
-                self.update_bookmark(bookmark_id)
-        else:
-            self._send_error_response(404, "Not Found")
+        self._dispatch('PUT')
 
     def do_DELETE(self):
         """
@@ -432,25 +550,19 @@ class BookmarkHandler(BaseHTTPRequestHandler):
         Supported route:
           - DELETE /api/bookmarks/<id>  -> deletes the bookmark with the specified id
 
-        Parses the id from the path; if it's invalid, it responds with 400.
-        On success, it calls delete_bookmark which sends the JSON response.
+        A non-integer id gets 400, an unknown route 404.
         """
         logger.info(f"DELETE request for: {self.path}")
+        self._dispatch('DELETE')
 
-        if self._require_authenticated_user() is None:
-            return
-
-        parts = urlparse(self.path).path.strip('/').split('/')
+    def serve_llm_stats(self):
+        """Sends the counters of the Gemini rate limiter."""
+        self._send_json_response(200, get_llm_stats())
 
-        # Supports: /api/bookmarks/<id>
-        if len(parts) == 3 and parts[0] == 'api' and parts[1] == 'bookmarks':
-            bookmark_id = self._parse_bookmark_id_from_parts(parts)
-            if bookmark_id is None:
-                return
-
-            self.delete_bookmark(bookmark_id)
-        else:
-            self._send_error_response(404, "Not Found")
+    def serve_favicon(self):
+        """Serves the standard /favicon.ico request with our SVG."""
+        self.path = '/static/img/favicon.svg'
+        self.serve_static_file()
 
     def serve_login_page(self):
         """Serves the HTML login page."""
@@ -482,7 +594,7 @@ class BookmarkHandler(BaseHTTPRequestHandler):
                 self._send_html_response(400, get_login_page(self, error=malformed_request_error))
                 return
 
-            post_data = self.rfile.read(content_length)
+            post_data = self._read_request_body(content_length)
             credentials = parse_qs(post_data.decode('utf-8'))
 
             username = credentials.get('username', [''])[0]
@@ -527,6 +639,7 @@ class BookmarkHandler(BaseHTTPRequestHandler):
         self.send_response(302)
         self.send_header('Location', '/login')
         self.send_header('Set-Cookie', 'session_id=; Path=/; Max-Age=0') # Delete the cookie
+        self.send_header('Content-Length', '0')
         self.end_headers()
 
     def serve_homepage(self):
@@ -561,40 +674,24 @@ class BookmarkHandler(BaseHTTPRequestHandler):
         # The total count always refers to all bookmarks in the DB
         total_count_for_filters = self.get_total_bookmark_count(current_user_id, filter_type=None, hide_read=hide_read_default, search_query=None) # Initial filter
         
-        html = get_html(self, bookmarks_to_render, __version__, total_count_for_filters, translations, has_more=has_more)
-
-        # Send headers in the correct order
-        self.send_response(200)
-        self._send_security_headers()
-        self.send_header('Content-type', 'text/html; charset=utf-8')
+        html = get_html(self, bookmarks_to_render, __version__, total_count_for_filters, translations, has_more=has_more,
+                        fragment_cache=FRAGMENTS, lang_key=TRANSLATIONS.revision(lang_code), view=self.get_user_view())
 
         # Set a cookie to remember the user's language choice
         cookie = SimpleCookie()
         cookie['lang'] = lang_code
-        self.send_header('Set-Cookie', cookie.output(header='').lstrip())
-
-        self.end_headers()
-        self._write_response_body(html.encode('utf-8'))
+        self._send_html_response(200, html, extra_headers={'Set-Cookie': cookie.output(header='').lstrip()})
 
     def _send_json_response(self, status_code, data):
         """Helper to send JSON responses."""
-        self.send_response(status_code)
-        self._send_security_headers()
-        self.send_header('Content-type', 'application/json; charset=utf-8')
-        self.end_headers()
-        self._write_response_body(json.dumps(data, ensure_ascii=False).encode('utf-8'))
+        self._send_payload(status_code, 'application/json; charset=utf-8', json.dumps(data, ensure_ascii=False).encode('utf-8'))
 
     def _send_error_response(self, status_code, message):
         """Helper to send error responses in JSON format."""
-        error_data = {'error': message}
-        self.send_response(status_code)
-        self._send_security_headers()
-        self.send_header('Content-type', 'application/json; charset=utf-8')
-        self.end_headers()
-        self._write_response_body(json.dumps(error_data, ensure_ascii=False).encode('utf-8'))
+        self._send_json_response(status_code, {'error': message})
 
-    def _send_export_attachment(self, payload_bytes, content_type, filename, export_kind):
-        """Sends a file attachment response for export endpoints."""
+    def _send_export_file(self, export_file, size, content_type, filename, export_kind, encoding=None):
+        """Sends an export file as an attachment, copying it to the socket in chunks."""
         headers_sent = False
         try:
             self.send_response(200)
@@ -602,44 +699,55 @@ class BookmarkHandler(BaseHTTPRequestHandler):
             self._send_security_headers()
             self.send_header('Content-Type', content_type)
             self.send_header('Content-Disposition', f'attachment; filename="{filename}"')
-            self.send_header('Content-Length', str(len(payload_bytes)))
+            self.send_header('Vary', 'Accept-Encoding')
+            if encoding:
+                self.send_header('Content-Encoding', encoding)
+            self.send_header('Content-Length', str(size))
             self.end_headers()
-            self._write_response_body(payload_bytes)
+            while True:
+                chunk = export_file.read(EXPORT_CHUNK_SIZE)
+                if not chunk:
+                    break
+                self._write_response_body(chunk)
             return True
         except Exception as e:
             logger.error("Error sending %s export attachment: %s", export_kind, e)
             if not headers_sent:
                 self._send_error_response(500, f"Failed to export {export_kind.upper()}")
+            else:
+                # The body is shorter than its Content-Length: the connection cannot be reused
+                self.close_connection = True
             return False
 
     def serve_static_file(self):
         """Serves a static file from the 'static' folder."""
         try:
-            static_path = os.path.join(SCRIPT_DIR, self.path.lstrip('/'))
+            relative_path = urlparse(self.path).path[len('/static/'):]
 
             # Verify that the resolved path is actually inside the 'static' folder
             # to prevent directory traversal attacks.
-            if not os.path.abspath(static_path).startswith(os.path.join(SCRIPT_DIR, 'static')):
+            if STATIC_ASSETS.resolve(relative_path) is None:
                 self._send_error_response(403, "Forbidden")
                 return
 
-            if os.path.exists(static_path) and os.path.isfile(static_path):
-                if static_path.endswith('.js'):
-                    content_type = 'application/javascript'
-                elif static_path.endswith('.css'):
-                    content_type = 'text/css'
-                elif static_path.endswith('.svg'):
-                    content_type = 'image/svg+xml'
-                else:
-                    content_type = 'application/octet-stream' # Generic fallback
-                self.send_response(200)
-                self._send_security_headers()
-                self.send_header('Content-type', content_type)
-                self.end_headers()
-                with open(static_path, 'rb') as f:
-                    self._write_response_body(f.read())
-            else:
+            # Served from memory, with the variants precompressed at startup
+            asset = STATIC_ASSETS.get(relative_path)
+            if asset is None:
                 self._send_error_response(404, "Static file not found")
+                return
+
+            encoding = self._negotiate_encoding(tuple(asset.encodings)) if asset.encodings else None
+            fingerprinted = parse_qs(urlparse(self.path).query).get('v', [None])[0] == asset.digest
+            headers = {
+                'ETag': asset_etag(asset, encoding),
+                'Last-Modified': asset_last_modified(asset),
+                # Without the current hash in the URL, the browser revalidates with If-None-Match
+                'Cache-Control': IMMUTABLE_CACHE_CONTROL if fingerprinted else 'no-cache',
+            }
+            if self._etag_matches(asset):
+                self._send_not_modified(headers, vary=bool(asset.encodings))
+            else:
+                self._send_payload(200, asset.content_type, asset.body, headers, encodings=asset.encodings)
 
         except (ConnectionAbortedError, BrokenPipeError):
             # This happens if the client closes the connection while we are sending data.
@@ -650,6 +758,31 @@ class BookmarkHandler(BaseHTTPRequestHandler):
             logger.error(f"Error serving static file {self.path}: {e}")
             self._send_error_response(500, "Internal Server Error")
 
+    def _etag_matches(self, asset):
+        """True if If-None-Match names a representation of the asset the client already has."""
+        if_none_match = self.headers.get('If-None-Match')
+        if not if_none_match:
+            return False
+        if if_none_match.strip() == '*':
+            return True
+        etags = {asset_etag(asset, encoding) for encoding in (None, *asset.encodings)}
+        for tag in if_none_match.split(','):
+            tag = tag.strip()
+            if tag.startswith('W/'):
+                tag = tag[2:]
+            if tag in etags:
+                return True
+        return False
+
+    def _send_not_modified(self, headers, vary=False):
+        """Sends 304 Not Modified (no body) with the validators and caching headers of the resource."""
+        self.send_response(304)
+        for key, value in headers.items():
+            self.send_header(key, value)
+        if vary:
+            self.send_header('Vary', 'Accept-Encoding')
+        self.end_headers()
+
     def serve_bookmarks_api(self, limit=20, offset=0, filter_type=None, hide_read=False, search_query=None, sort_order='desc'):
         """
         API that returns the list of bookmarks in JSON format.
@@ -701,6 +834,9 @@ class BookmarkHandler(BaseHTTPRequestHandler):
         """
         API that returns bookmarks rendered as HTML fragments for htmx.
         This endpoint is used for initial loads (search, sort, filter) and returns full divs.
+        Only the active view is rendered: the other container is emptied, and
+        filled by a new request (with the items already shown) when the user
+        switches to it.
         """
         user_id = self.get_current_user()
 
@@ -713,9 +849,11 @@ class BookmarkHandler(BaseHTTPRequestHandler):
         lang_code = self.get_user_language()
         translations = load_translations(lang_code)
 
-        # Render the actual bookmarks
-        rendered_cards = render_bookmarks(bookmarks_to_render, translations)
-        rendered_compact = render_bookmarks_compact(bookmarks_to_render, translations)
+        # Render the actual bookmarks in the active view (mostly fragment cache hits)
+        view = self.get_user_view()
+        rendered = self._render_view(bookmarks_to_render, translations, TRANSLATIONS.revision(lang_code), view)
+        rendered_cards = rendered if view == 'cards' else ''
+        rendered_compact = rendered if view == 'compact' else ''
 
         # Calculate total count for the current filters
         total_count_for_filters = self.get_total_bookmark_count(user_id, filter_type=filter_type, hide_read=hide_read, search_query=search_query)
@@ -730,6 +868,9 @@ class BookmarkHandler(BaseHTTPRequestHandler):
             search_query=search_query,
             hide_read=hide_read,
             filter_type=filter_type,
+            view=view,
+            # A view switch reloads every item shown so far: scrolling goes on page by page
+            page_size=min(len(bookmarks_to_render), DEFAULT_PAGE_SIZE),
         )
 
         html_response = f"""
@@ -759,9 +900,9 @@ class BookmarkHandler(BaseHTTPRequestHandler):
         lang_code = self.get_user_language()
         translations = load_translations(lang_code)
 
-        # Render the actual bookmarks
-        rendered_cards = render_bookmarks(bookmarks_to_render, translations)
-        rendered_compact = render_bookmarks_compact(bookmarks_to_render, translations)
+        # Render the actual bookmarks in the active view (mostly fragment cache hits)
+        view = self.get_user_view()
+        rendered = self._render_view(bookmarks_to_render, translations, TRANSLATIONS.revision(lang_code), view)
 
         # Build the "load more" trigger for the next page
         current_total = offset + len(bookmarks_to_render)
@@ -774,167 +915,66 @@ class BookmarkHandler(BaseHTTPRequestHandler):
             search_query=search_query,
             hide_read=hide_read,
             filter_type=filter_type,
+            view=view,
         )
 
-        # When scrolling, we append the new items to their containers
+        # When scrolling, we append the new items to the container of the active view
         # and replace the trigger with the next one.
         # The response should contain the items to append AND the next trigger.
+        container_id = 'bookmarksCompact' if view == 'compact' else 'bookmarksGrid'
         html_response = f"""
-        <div id="bookmarksGrid" hx-swap-oob="beforeend">
-            {rendered_cards}
-        </div>
-        <div id="bookmarksCompact" hx-swap-oob="beforeend">
-            {rendered_compact}
+        <div id="{container_id}" hx-swap-oob="beforeend">
+            {rendered}
         </div>
         <span id="visibleCount" hx-swap-oob="innerHTML">{current_total}</span>
         {load_more_trigger}
         """
         self._send_html_response(200, html_response)
 
-    def serve_export_csv(self):
-        """
-        Exports all bookmarks for the current user to a CSV file.
+    def serve_export(self, export_format):
         """
-        bookmarks = self._get_export_bookmarks()
-        if bookmarks is None:
-            return
-
-        try:
-            # Send headers for file download
-            from io import StringIO
-            # Use StringIO with newline='' as recommended by Python's csv module documentation
-            # This correctly handles multiline fields.
-            output = StringIO(newline='')
-            writer = csv.writer(output, quoting=csv.QUOTE_ALL)
-
-            # Write header
-            header = ['id', 'url', 'title', 'description', 'image_url', 'domain', 'saved_at', 'telegram_user_id', 'telegram_message_id', 'comments_url', 'tags', 'is_read']
-            writer.writerow(header)
-
-            # Write data rows, manually sanitizing fields to prevent issues.
-            def sanitize_field(field):
-                if field is None:
-                    return ""
-                # Replace quotes with double quotes and remove newlines to ensure single-line rows.
-                return str(field).replace('"', '""').replace('\n', ' ').replace('\r', ' ')
-
-            for row in bookmarks:
-                # Ensure tags (which may be JSON) are serialized as a string
-                row_list = list(row)
-                if len(row_list) > 10:
-                    try:
-                        tags_val = row_list[10]
-                        if isinstance(tags_val, (list, dict)):
-                            row_list[10] = json.dumps(tags_val, ensure_ascii=False)
-                        else:
-                            row_list[10] = tags_val or ''
-                    except Exception:
-                        row_list[10] = ''
-                sanitized_row = [sanitize_field(field) for field in row_list]
-                writer.writerow(sanitized_row)
-
-            csv_data = output.getvalue().encode('utf-8')
-            self._send_export_attachment(
-                payload_bytes=csv_data,
-                content_type='text/csv; charset=utf-8',
-                filename='bookmarks.csv',
-                export_kind='csv',
-            )
-        except Exception as e:
-            logger.error(f"Error exporting CSV: {e}")
-            self._send_error_response(500, "Failed to export CSV")
-
-    def _parse_tags_for_export(self, tags):
-        """Normalizes tag values from DB rows for export payloads."""
-        if isinstance(tags, str) and tags:
-            try:
-                return json.loads(tags)
-            except json.JSONDecodeError:
-                return [tags]
-        if isinstance(tags, (list, dict)):
-            return tags
-        return []
+        Exports all bookmarks of the current user as an attachment (csv, json or html).
 
-    def _bookmark_row_to_export_dict(self, row):
-        """Converts a bookmark DB row to a dictionary used by export endpoints."""
-        return {
-            'id': row[0],
-            'url': row[1],
-            'title': row[2],
-            'description': row[3],
-            'image_url': row[4],
-            'domain': row[5],
-            'saved_at': row[6],
-            'telegram_user_id': row[7],
-            'telegram_message_id': row[8],
-            'comments_url': row[9],
-            'tags': self._parse_tags_for_export(row[10]),
-            'is_read': bool(row[11]),
-        }
-
-    def _get_export_bookmarks(self):
-        """Returns all bookmarks for the authenticated user, or None if unauthorized."""
+        The rows are streamed into a temporary file by the shared exporter
+        (shared/export.py), compressed on the way if the client accepts it,
+        then copied to the response in chunks: memory use does not grow with
+        the size of the library.
+        """
         user_id = self.get_current_user()
         if not user_id:
             self._send_error_response(401, "Authentication required")
-            return None
-        return self.get_bookmarks(user_id, limit=-1)
-
-    def serve_export_json(self):
-        """
-        Exports all bookmarks for the current user to a JSON file.
-        """
-        bookmarks = self._get_export_bookmarks()
-        if bookmarks is None:
             return
 
+        content_type, filename = EXPORT_FORMATS[export_format]
+        # English is the default language for exports
+        translations = load_translations('en') if export_format == 'html' else None
+        encoding = self._negotiate_encoding()
         try:
-            # Convert bookmarks to a list of dictionaries for JSON export
-            export_data = [self._bookmark_row_to_export_dict(row) for row in bookmarks]
-
-            json_data = json.dumps(export_data, indent=2, ensure_ascii=False).encode('utf-8')
-            self._send_export_attachment(
-                payload_bytes=json_data,
-                content_type='application/json; charset=utf-8',
-                filename='bookmarks.json',
-                export_kind='json',
-            )
+            with tempfile.TemporaryFile() as export_file:
+                with db_connection() as cursor:
+                    if encoding:
+                        with compressing_writer(export_file, encoding) as out:
+                            write_export(cursor, user_id, export_format, out, translations)
+                    else:
+                        write_export(cursor, user_id, export_format, export_file, translations)
+                size = export_file.tell()
+                export_file.seek(0)
+                self._send_export_file(export_file, size, content_type, filename, export_format, encoding)
         except Exception as e:
-            logger.error(f"Error exporting JSON: {e}")
-            self._send_error_response(500, "Failed to export JSON")
-
-    def serve_export_html(self):
-        """
-        Exports all bookmarks for the current user to an HTML file.
-        """
-        bookmarks = self._get_export_bookmarks()
-        if bookmarks is None:
-            return
+            logger.error(f"Error exporting {export_format.upper()}: {e}")
+            self._send_error_response(500, f"Failed to export {export_format.upper()}")
 
-        try:
-            bookmarks_for_rendering = [self._bookmark_row_to_export_dict(row) for row in bookmarks]
-
-            # Get translations for the current user (we'll use English as default for export)
-            translations = load_translations('en')
+    def serve_export_csv(self):
+        """Exports all bookmarks for the current user to a CSV file."""
+        self.serve_export('csv')
 
-            # Generate export cards and wrap them in a full document.
-            html_content = render_bookmarks_export(bookmarks_for_rendering, translations)
-            full_html = build_export_html_document(
-                html_content=html_content,
-                total_count=len(bookmarks_for_rendering),
-                generated_at=datetime.now(),
-            )
+    def serve_export_json(self):
+        """Exports all bookmarks for the current user to a JSON file."""
+        self.serve_export('json')
 
-            html_data = full_html.encode('utf-8')
-            self._send_export_attachment(
-                payload_bytes=html_data,
-                content_type='text/html; charset=utf-8',
-                filename='bookmarks.html',
-                export_kind='html',
-            )
-        except Exception as e:
-            logger.error(f"Error exporting HTML: {e}")
-            self._send_error_response(500, "Failed to export HTML")
+    def serve_export_html(self):
+        """Exports all bookmarks for the current user to an HTML file."""
+        self.serve_export('html')
 
     def delete_bookmark(self, bookmark_id):
         """
@@ -949,6 +989,8 @@ class BookmarkHandler(BaseHTTPRequestHandler):
         try:
             with db_connection() as cursor:
                 cursor.execute("DELETE FROM bookmarks WHERE id = ?", (bookmark_id,))
+            get_tag_suggester().remove(bookmark_id)
+            FRAGMENTS.invalidate(bookmark_id)
             self._send_json_response(200, {"status": "deleted"})
         except sqlite3.Error as e:
             self._send_error_response(500, str(e))
@@ -1025,7 +1067,7 @@ class BookmarkHandler(BaseHTTPRequestHandler):
                 self._send_error_response(400, "Request body is empty")
                 return
 
-            post_data = self.rfile.read(content_length)
+            post_data = self._read_request_body(content_length)
             data = json.loads(post_data.decode('utf-8'))
 
             # Filter only allowed fields from the incoming request
@@ -1087,6 +1129,8 @@ class BookmarkHandler(BaseHTTPRequestHandler):
                             fields_to_update['tags'] = json.dumps(fields_to_update['tags'], ensure_ascii=False)
                         except Exception:
                             fields_to_update['tags'] = '[]'
+                        # Tags edited by the user are final: a queued LLM job must not overwrite them
+                        fields_to_update['tags_status'] = 'done'
 
                     set_clause = ', '.join([f"{k} = ?" for k in fields_to_update.keys()])
                     params = list(fields_to_update.values())
@@ -1097,15 +1141,20 @@ class BookmarkHandler(BaseHTTPRequestHandler):
                     SELECT id, url, title, description, image_url, domain,
                         datetime(saved_at, 'localtime') as saved_at,
                         telegram_user_id, telegram_message_id, comments_url, tags,
-                        COALESCE(is_read, 0) as is_read
+                        COALESCE(is_read, 0) as is_read, row_version
                     FROM bookmarks WHERE id = ?
                 """, (bookmark_id,))
                 updated_bookmark_tuple = cursor.fetchone()
+            FRAGMENTS.invalidate(bookmark_id)
 
             if not updated_bookmark_tuple:
                 self._send_error_response(404, "Bookmark not found after update")
                 return
 
+            if 'tags' in fields_to_update:
+                _, _, title, _, _, domain, _, _, _, _, tags_json, _ = updated_bookmark_tuple[:12]
+                get_tag_suggester().add(bookmark_id, title, domain, json.loads(tags_json or '[]'))
+
             # Check if the request is from htmx
             is_htmx_request = self.headers.get('HX-Request') == 'true'
 
@@ -1114,15 +1163,9 @@ class BookmarkHandler(BaseHTTPRequestHandler):
                 lang_code = self.get_user_language()
                 translations = load_translations(lang_code)
                 
-                # The render functions expect a list of tuples
-                rendered_card = render_bookmarks([updated_bookmark_tuple], translations)
-                rendered_compact = render_bookmarks_compact([updated_bookmark_tuple], translations)
-
-                # Respond with Out-of-Band swaps for both views
-                html_response = f"""
-                {rendered_card}
-                {rendered_compact}
-                """
+                # The render functions expect a list of tuples; only the active view is on the page
+                html_response = self._render_view([updated_bookmark_tuple], translations,
+                                                  TRANSLATIONS.revision(lang_code), self.get_user_view())
                 self._send_html_response(200, html_response, extra_headers={'HX-Trigger': 'bookmark-updated'})
             else:
                 # For non-htmx requests, return JSON as before
@@ -1153,7 +1196,7 @@ class BookmarkHandler(BaseHTTPRequestHandler):
             content_length = int(self.headers.get('Content-Length', 0))
             is_read = 1
             if content_length > 0:
-                post_data = self.rfile.read(content_length)
+                post_data = self._read_request_body(content_length)
                 try:
                     data = json.loads(post_data.decode('utf-8'))
                 except json.JSONDecodeError:
@@ -1165,6 +1208,7 @@ class BookmarkHandler(BaseHTTPRequestHandler):
             user_id = self.get_current_user()
             with db_connection() as cursor:
                 cursor.execute("UPDATE bookmarks SET is_read = ? WHERE id = ? AND user_id = ?", (int(is_read), bookmark_id, user_id))
+            FRAGMENTS.invalidate(bookmark_id)
             self._send_json_response(200, {'status': 'ok', 'is_read': is_read})
 
         except sqlite3.Error as e:
@@ -1190,7 +1234,7 @@ class BookmarkHandler(BaseHTTPRequestHandler):
         """
         try:
             content_length = int(self.headers.get('Content-Length', 0))
-            post_data = self.rfile.read(content_length) if content_length > 0 else b''
+            post_data = self._read_request_body(content_length) if content_length > 0 else b''
             content_type = self.headers.get('Content-Type', '')
 
             data = None
@@ -1232,6 +1276,10 @@ class BookmarkHandler(BaseHTTPRequestHandler):
                 title = data.get('title') or ''
                 description = data.get('description') or ''
                 # Determine tags: prefer user-provided tags, else generate
+                # local ones and queue the bookmark for LLM tagging.
+                # `auto_tags` marks tags the form prefilled from the scraper.
+                auto_tags = data.get('auto_tags') in [True, 'true', '1', 1]
+                tags_status = 'done'
                 if 'tags' in data and data.get('tags'):
                     provided = data.get('tags')
                     if isinstance(provided, str):
@@ -1240,13 +1288,17 @@ class BookmarkHandler(BaseHTTPRequestHandler):
                         tags_list = [str(x).strip() for x in provided if str(x).strip()]
                     else:
                         tags_list = []
+                    if auto_tags and llm_tagging_enabled():
+                        tags_status = 'pending'
                 else:
-                    tags_list = generate_tags(f"{title} \n {description}", n=3)
+                    tags_list = generate_tags(f"{title} \n {description}", n=3, user_id=user_id)
+                    if llm_tagging_enabled():
+                        tags_status = 'pending'
                 tags_json = json.dumps(tags_list, ensure_ascii=False)
 
                 cursor.execute("""
-                    INSERT INTO bookmarks (user_id, url, title, description, image_url, domain, telegram_user_id, telegram_message_id, comments_url, tags, is_read)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    INSERT INTO bookmarks (user_id, url, title, description, image_url, domain, telegram_user_id, telegram_message_id, comments_url, tags, tags_status, is_read)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
                 """, (
                     user_id,
                     url,
@@ -1258,10 +1310,16 @@ class BookmarkHandler(BaseHTTPRequestHandler):
                     data.get('telegram_message_id') if data.get('telegram_message_id') else None,
                     data.get('comments_url'),
                     tags_json,
+                    tags_status,
                     is_read_value
                 ))
 
                 new_bookmark_id = cursor.lastrowid
+                if tags_status == 'pending':
+                    enqueue_tag_job(cursor, new_bookmark_id, origin='web')
+                else:
+                    get_tag_suggester().add(new_bookmark_id, title, domain, tags_list)
+                observed_terms = get_tag_engine().persist(user_id, f"{title}\n{description}", cursor)
                 cursor.execute("""
                     SELECT id, url, title, description, image_url, domain,
                         datetime(saved_at, 'localtime') as saved_at,
@@ -1270,12 +1328,17 @@ class BookmarkHandler(BaseHTTPRequestHandler):
                     FROM bookmarks WHERE id = ?
                 """, (new_bookmark_id,))
                 new_bookmark_tuple = cursor.fetchone()
+            # Committed: the tag engine can count the new bookmark
+            get_tag_engine().apply(user_id, observed_terms)
 
             if not new_bookmark_tuple:
                 self._send_error_response(500, "Failed to retrieve newly created bookmark")
                 return
 
             new_bookmark = self._bookmark_row_to_api_dict(new_bookmark_tuple)
+            new_bookmark['tags_status'] = tags_status
+            if tags_status == 'pending' and tag_worker is not None:
+                tag_worker.wake()
             self._send_json_response(201, new_bookmark)
 
         except ValueError as e:
@@ -1297,7 +1360,7 @@ class BookmarkHandler(BaseHTTPRequestHandler):
                 self._send_error_response(400, "Request body is empty")
                 return
 
-            post_data = self.rfile.read(content_length)
+            post_data = self._read_request_body(content_length)
             try:
                 data = json.loads(post_data.decode('utf-8'))
             except json.JSONDecodeError:
@@ -1312,11 +1375,13 @@ class BookmarkHandler(BaseHTTPRequestHandler):
 
             logger.info("Scrape request received for url=%s", url)
             metadata = get_article_metadata(url)
-            metadata['tags'] = generate_tags_llm(
-                metadata.get('title', ''),
-                metadata.get('description', ''),
-                metadata.get('domain', ''),
+            # Local tags only: LLM tags are fetched by the tag queue once the bookmark is saved.
+            tags = generate_tags(
+                f"{metadata.get('title', '')}\n{metadata.get('description', '')}".strip(),
+                user_id=self.get_current_user(),
             )
+            metadata['tags'] = tags
+            metadata['tags_source'] = 'local'
             logger.info(
                 "Scrape completed for url=%s domain=%s tags=%s",
                 url,
@@ -1384,11 +1449,12 @@ class BookmarkHandler(BaseHTTPRequestHandler):
                 limit_clause = "LIMIT ? OFFSET ?" if limit != -1 else ""
                 query_params = params + [limit, offset] if limit != -1 else params
 
+                # row_version (13th column) keys the fragment cache of the renderers
                 query = """
                     SELECT id, url, title, description, image_url, domain,
                         datetime(saved_at, 'localtime') as saved_at,
                         telegram_user_id, telegram_message_id, comments_url, tags,
-                        COALESCE(is_read, 0) as is_read
+                        COALESCE(is_read, 0) as is_read, row_version
                     FROM bookmarks
                     WHERE {where_clause}
                     ORDER BY id {order}
@@ -1403,6 +1469,134 @@ class BookmarkHandler(BaseHTTPRequestHandler):
             logger.error(f"Database error fetching bookmarks: {e}")
             return []
 
+class PooledHTTPServer(HTTPServer):
+    """
+    HTTPServer handling connections on a bounded pool of worker threads.
+
+    A slow request (scrape with LLM tagging, large export) occupies a single
+    worker instead of the whole server. Past `workers` running and
+    `max_pending` queued connections the accept loop waits, and new clients
+    stay in the listen backlog. With an `ssl_context`, the TLS handshake runs
+    on the worker as well.
+
+    Connections are persistent (HTTP/1.1): a worker keeps serving its
+    connection until the client closes it or stays idle for the handler
+    `timeout`. When a connection has to wait for a worker, or on shutdown,
+    responses ask the clients to close their connections, and the idle ones
+    are closed at once to free their workers.
+
+    Args:
+        server_address (tuple): (host, port) to listen on.
+        handler_class (type): Request handler, e.g. BookmarkHandler.
+        workers (int): Number of worker threads.
+        max_pending (int, optional): Accepted connections waiting for a worker (default 4 per worker).
+        ssl_context (ssl.SSLContext, optional): Serves HTTPS when set.
+    """
+
+    def __init__(self, server_address, handler_class, workers=DEFAULT_WORKERS, max_pending=None, ssl_context=None):
+        super().__init__(server_address, handler_class)
+        self.workers = max(1, workers)
+        self.ssl_context = ssl_context
+        pending = max_pending if max_pending is not None else self.workers * 4
+        self._slots = threading.BoundedSemaphore(self.workers + pending)
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="http-worker")
+        self._in_flight = 0
+        self._idle = threading.Condition()
+        self._idle_connections = set()
+        self._closing = False
+
+    @property
+    def keep_alive(self):
+        """False when the connection should be closed after the current response."""
+        return not self._closing and self._in_flight <= self.workers
+
+    def connection_idle(self, connection):
+        with self._idle:
+            if self._closing or self._in_flight > self.workers:
+                # Connections are waiting for this worker
+                self._close_idle_connection(connection)
+            else:
+                self._idle_connections.add(connection)
+
+    def connection_busy(self, connection):
+        with self._idle:
+            self._idle_connections.discard(connection)
+
+    @staticmethod
+    def _close_idle_connection(connection):
+        try:
+            # The worker waiting on it reads EOF and ends the connection
+            connection.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    def _close_idle_connections(self):
+        # Called with self._idle held
+        for connection in self._idle_connections:
+            self._close_idle_connection(connection)
+        self._idle_connections.clear()
+
+    def get_request(self):
+        request, client_address = super().get_request()
+        if self.ssl_context is not None:
+            request = self.ssl_context.wrap_socket(request, server_side=True, do_handshake_on_connect=False)
+        return request, client_address
+
+    def process_request(self, request, client_address):
+        self._slots.acquire()
+        with self._idle:
+            self._in_flight += 1
+            if self._in_flight > self.workers:
+                # Every worker is taken: free the ones waiting on idle keep-alive connections
+                self._close_idle_connections()
+        try:
+            self._executor.submit(self._process_request_worker, request, client_address)
+        except RuntimeError:
+            # The pool is shut down
+            self._request_done(request)
+
+    def _process_request_worker(self, request, client_address):
+        try:
+            if isinstance(request, ssl.SSLSocket):
+                request.settimeout(TLS_HANDSHAKE_TIMEOUT_SECONDS)
+                request.do_handshake()
+                request.settimeout(None)
+            self.finish_request(request, client_address)
+        except (ssl.SSLError, ConnectionError, socket.timeout) as e:
+            logger.debug("Connection from %s dropped: %s", client_address, e)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self._request_done(request)
+
+    def _request_done(self, request):
+        self.shutdown_request(request)
+        self._slots.release()
+        with self._idle:
+            self._idle_connections.discard(request)
+            self._in_flight -= 1
+            self._idle.notify_all()
+
+    def drain(self, timeout=DRAIN_TIMEOUT_SECONDS):
+        """Waits for the requests in flight. Returns False if some are still running after `timeout`."""
+        with self._idle:
+            return self._idle.wait_for(lambda: self._in_flight == 0, timeout)
+
+    def close_gracefully(self, timeout=DRAIN_TIMEOUT_SECONDS):
+        """Stops accepting connections, then lets the requests in flight finish (up to `timeout` seconds)."""
+        super().server_close()
+        with self._idle:
+            self._closing = True
+            self._close_idle_connections()
+        drained = self.drain(timeout)
+        self._executor.shutdown(wait=drained, cancel_futures=True)
+        return drained
+
+    def server_close(self):
+        super().server_close()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
 def create_self_signed_cert(cert_file_path, key_file_path):
     """
     Creates a self-signed certificate (if it doesn't exist) using OpenSSL.
@@ -1443,16 +1637,38 @@ def create_self_signed_cert(cert_file_path, key_file_path):
         logger.error("❌ OpenSSL not found in the system's PATH")
         sys.exit(1)
 
+def run_async_engine(httpd):
+    """Runs an AsyncBookmarkServer until Ctrl+C or SIGTERM, then lets the requests in flight finish."""
+    async def serve():
+        await httpd.start()
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGINT, getattr(signal, 'SIGTERM', None)):
+            if signum is None:
+                continue
+            try:
+                loop.add_signal_handler(signum, httpd.stop)
+            except NotImplementedError:
+                pass  # Windows: Ctrl+C raises KeyboardInterrupt instead
+        await httpd.serve_until_stopped(DRAIN_TIMEOUT_SECONDS)
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+
+
 def main():
     """
     Main entry-point that starts the web server.
 
     Main actions:
       - initializes the DB (init_database)
-      - configures HTTPServer (HTTP by default, HTTPS with --https flag)
+      - configures a PooledHTTPServer, or an AsyncBookmarkServer with --engine asyncio
+        (HTTP by default, HTTPS with --https flag)
       - starts the serve_forever loop
 
-    Handles KeyboardInterrupt to shut down the server gracefully.
+    Handles KeyboardInterrupt and SIGTERM to shut down the server gracefully,
+    letting the requests in flight finish.
     """
     env_path = os.path.join(SCRIPT_DIR, '.env')
     env_loaded = load_local_env(env_path)
@@ -1461,11 +1677,24 @@ def main():
     parser = argparse.ArgumentParser(description="HackerNews Bookmarks Web Server", formatter_class=argparse.ArgumentDefaultsHelpFormatter)
     parser.add_argument('--https', action='store_true', help='Enable HTTPS mode (default is HTTP on port 80)')
     parser.add_argument('--port', type=int, help='Specify the port for the server to listen on')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help='Number of requests served concurrently')
+    parser.add_argument('--engine', choices=['threads', 'asyncio'], default='threads',
+                        help='Serve connections on a thread pool or on an asyncio event loop')
     args = parser.parse_args()
 
     # Initialize the database only after parsing args, so --help doesn't trigger it.
     logger.info("Initializing database...")
-    init_database()
+    conn = init_database()
+    try:
+        get_tag_engine().load(conn.cursor())
+        get_tag_suggester().load(conn.cursor())
+    finally:
+        conn.close()
+
+    # Drain the LLM tagging queue for bookmarks added from the web interface
+    global tag_worker
+    tag_worker = TagWorker(origin='web')
+    tag_worker.start()
 
     # Get the local IP
     try:
@@ -1512,23 +1741,28 @@ def main():
             if not (os.path.exists(cert_file) and os.path.exists(key_file)):
                 create_self_signed_cert(cert_file, key_file)
 
-        server_address = ('', port)
-        httpd = HTTPServer(server_address, BookmarkHandler)
-
         try:
             context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
             context.minimum_version = ssl.TLSVersion.TLSv1_2
             context.load_cert_chain(cert_file, key_file)
-            httpd.socket = context.wrap_socket(httpd.socket, server_side=True)
             logger.info(f"🔒 Certificate: {os.path.abspath(cert_file)}")
         except ssl.SSLError as e:
             logger.error(f"❌ SSL error: {e}")
             return
+
     else:
         # --- HTTP Mode (Default) ---
         protocol = "http"
-        server_address = ('', port)
-        httpd = HTTPServer(server_address, BookmarkHandler)
+        context = None
+
+    logger.info(f"Loaded {STATIC_ASSETS.preload()} static files")
+    logger.info(f"Languages: {', '.join(TRANSLATIONS.languages)}")
+
+    if args.engine == 'asyncio':
+        httpd = AsyncBookmarkServer(BookmarkHandler, ROUTES, port=port, ssl_context=context, workers=args.workers)
+    else:
+        # Connections are wrapped on the worker threads: a slow handshake does not block the others
+        httpd = PooledHTTPServer(('', port), BookmarkHandler, workers=args.workers, ssl_context=context)
 
     access_url = f"{protocol}://localhost:{port}"
 
@@ -1540,6 +1774,7 @@ def main():
    • {protocol}://{local_ip}:{port}
 
 📁 Database: {os.path.abspath(DB_PATH)}
+🧵 Engine: {args.engine}, {httpd.workers} workers
 
 ✨ NEW FEATURES:
    • ➕ Hidden form (show on request)
@@ -1552,11 +1787,24 @@ def main():
 Press Ctrl+C to stop the server.
     """)
 
+    if args.engine == 'asyncio':
+        run_async_engine(httpd)
+        tag_worker.stop()
+        logger.info("\n🛑 Server stopped gracefully")
+        return
+
+    if hasattr(signal, 'SIGTERM'):
+        # docker stop: leave serve_forever (shutdown() must run on another thread)
+        signal.signal(signal.SIGTERM, lambda signum, frame: threading.Thread(target=httpd.shutdown, daemon=True).start())
     try:
         httpd.serve_forever()
     except KeyboardInterrupt:
-        logger.info("\n🛑 Server stopped gracefully")
-        httpd.shutdown()
+        pass
+    logger.info("Stopping: waiting for the requests in flight...")
+    if not httpd.close_gracefully():
+        logger.warning("Requests still running after %ss; stopping anyway", DRAIN_TIMEOUT_SECONDS)
+    tag_worker.stop()
+    logger.info("\n🛑 Server stopped gracefully")
 
 if __name__ == '__main__':
     # Add the project root to the path to import the shared library
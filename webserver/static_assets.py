@@ -0,0 +1,134 @@
+"""
+Static files of the web UI (webserver/static), kept in memory.
+
+`preload()` reads every file at startup and precompresses the compressible
+ones once, at the highest level, in each encoding the server supports:
+requests for app.js or style.css are then answered without touching the
+disk or compressing anything. A file changed on disk is reloaded (its
+mtime is checked at most every RELOAD_CHECK_SECONDS).
+
+Pages link the files with `static_url()`, which appends a hash of the
+content (/static/style.css?v=1f2e3d4c5b6a): such URLs are served as
+immutable and cached by browsers for a year, and a new version of the file
+gets a new URL. Requests without the current hash get an ETag to revalidate.
+"""
+import os
+import time
+import hashlib
+import threading
+from collections import namedtuple
+from email.utils import formatdate
+
+from .compression import MIN_COMPRESS_SIZE, available_encodings, compress, is_compressible
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+RELOAD_CHECK_SECONDS = 2
+DIGEST_LENGTH = 12  # hex characters of the SHA-256 used in URLs and ETags
+
+CONTENT_TYPES = {
+    '.js': 'application/javascript',
+    '.css': 'text/css',
+    '.svg': 'image/svg+xml',
+}
+DEFAULT_CONTENT_TYPE = 'application/octet-stream'  # Generic fallback
+
+# encodings: {'gzip': bytes, 'br': bytes} for the precompressed variants
+StaticAsset = namedtuple('StaticAsset', 'path content_type body encodings digest mtime')
+
+
+def asset_etag(asset, encoding=None):
+    """Strong ETag of a representation of the asset (each encoding has its own)."""
+    return f'"{asset.digest}-{encoding}"' if encoding else f'"{asset.digest}"'
+
+
+def asset_last_modified(asset):
+    return formatdate(asset.mtime, usegmt=True)
+
+
+class StaticAssets:
+    """
+    In-memory store of the files under `directory`.
+
+    Args:
+        directory (str): Root of the static files.
+        reload_check_seconds (float): Minimum time between two mtime checks of a file.
+    """
+
+    def __init__(self, directory, reload_check_seconds=RELOAD_CHECK_SECONDS):
+        self.directory = os.path.abspath(directory)
+        self.reload_check_seconds = reload_check_seconds
+        self._assets = {}  # path -> (StaticAsset, time of the last mtime check)
+        self._lock = threading.Lock()
+
+    def resolve(self, relative_path):
+        """Absolute path of a file under the directory, or None if it points outside of it."""
+        path = os.path.abspath(os.path.join(self.directory, relative_path.lstrip('/')))
+        if os.path.commonpath([path, self.directory]) != self.directory:
+            return None
+        return path
+
+    def preload(self):
+        """Loads and precompresses every file of the directory; returns their number."""
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                self.get(os.path.relpath(os.path.join(root, name), self.directory))
+        return len(self._assets)
+
+    def get(self, relative_path):
+        """Returns the StaticAsset of `relative_path` (loaded on first use), or None if there is no such file."""
+        path = self.resolve(relative_path)
+        if path is None:
+            return None
+        now = time.monotonic()
+        cached = self._assets.get(path)
+        if cached is not None and now - cached[1] < self.reload_check_seconds:
+            return cached[0]
+
+        try:
+            mtime = os.stat(path).st_mtime
+        except OSError:
+            mtime = None
+        if cached is not None and cached[0].mtime == mtime:
+            asset = cached[0]
+        else:
+            asset = self._load(path) if mtime is not None else None
+        with self._lock:
+            if asset is None:
+                self._assets.pop(path, None)
+            else:
+                self._assets[path] = (asset, now)
+        return asset
+
+    def url(self, relative_path):
+        """URL of a static file with its content hash, e.g. /static/app.js?v=3f1c9a0b2d4e."""
+        relative_path = relative_path.lstrip('/')
+        asset = self.get(relative_path)
+        if asset is None:
+            return f"/static/{relative_path}"
+        return f"/static/{relative_path}?v={asset.digest}"
+
+    def _load(self, path):
+        try:
+            mtime = os.stat(path).st_mtime
+            with open(path, 'rb') as f:
+                body = f.read()
+        except (FileNotFoundError, IsADirectoryError, NotADirectoryError):
+            return None
+        content_type = CONTENT_TYPES.get(os.path.splitext(path)[1].lower(), DEFAULT_CONTENT_TYPE)
+        encodings = {}
+        if is_compressible(content_type) and len(body) >= MIN_COMPRESS_SIZE:
+            for encoding in available_encodings():
+                compressed = compress(body, encoding, static=True)
+                if len(compressed) < len(body):
+                    encodings[encoding] = compressed
+        digest = hashlib.sha256(body).hexdigest()[:DIGEST_LENGTH]
+        return StaticAsset(path, content_type, body, encodings, digest, mtime)
+
+
+# Files of webserver/static, shared by the server and the page templates
+STATIC_ASSETS = StaticAssets(STATIC_DIR)
+
+
+def static_url(relative_path):
+    """Content-hashed URL of a file of webserver/static (see StaticAssets.url)."""
+    return STATIC_ASSETS.url(relative_path)
@@ -0,0 +1,101 @@
+"""
+Translation catalogs of the web UI (webserver/locales/<lang>.json), kept in memory.
+
+Every page and htmx fragment needs a catalog: they are parsed once and
+served as read-only mappings. The locales directory is checked again at
+most every RELOAD_CHECK_SECONDS: a new <lang>.json adds a language, an
+edited one (new mtime) is reloaded, a removed one drops its language. A
+catalog that fails to parse keeps its previous version.
+"""
+import os
+import json
+import time
+import logging
+import threading
+from types import MappingProxyType
+
+logger = logging.getLogger(__name__)
+
+LOCALES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'locales')
+DEFAULT_LANGUAGE = 'en'
+RELOAD_CHECK_SECONDS = 5
+
+
+class TranslationCatalogs:
+    """
+    Registry of the catalogs found in `directory`.
+
+    Args:
+        directory (str): Folder of the <lang>.json files.
+        default_language (str): Catalog used for unknown languages.
+        reload_check_seconds (float): Minimum time between two scans of the folder.
+    """
+
+    def __init__(self, directory=LOCALES_DIR, default_language=DEFAULT_LANGUAGE,
+                 reload_check_seconds=RELOAD_CHECK_SECONDS):
+        self.directory = directory
+        self.default_language = default_language
+        self.reload_check_seconds = reload_check_seconds
+        self._catalogs = {}  # lang -> (mtime, read-only catalog); replaced as a whole, never mutated
+        self._checked_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def languages(self):
+        """Codes of the available languages, e.g. ('en', 'it')."""
+        return tuple(sorted(self._current()))
+
+    def get(self, lang_code):
+        """Returns the read-only catalog of `lang_code`, or of the default language if there is none."""
+        catalogs = self._current()
+        entry = catalogs.get(lang_code) or catalogs.get(self.default_language)
+        return entry[1] if entry else MappingProxyType({})
+
+    def revision(self, lang_code):
+        """Identifies the version of the catalog get(lang_code) returns (changes on reload)."""
+        catalogs = self._current()
+        if lang_code not in catalogs:
+            lang_code = self.default_language
+        entry = catalogs.get(lang_code)
+        return (lang_code, entry[0] if entry else None)
+
+    def _current(self):
+        checked_at = self._checked_at
+        if checked_at is not None and time.monotonic() - checked_at < self.reload_check_seconds:
+            return self._catalogs
+        with self._lock:
+            # Another thread may have refreshed while this one waited
+            if self._checked_at is None or time.monotonic() - self._checked_at >= self.reload_check_seconds:
+                self._catalogs = self._scan(self._catalogs)
+                self._checked_at = time.monotonic()
+            return self._catalogs
+
+    def _scan(self, previous):
+        catalogs = {}
+        try:
+            names = os.listdir(self.directory)
+        except OSError as e:
+            logger.error(f"Cannot list the translation catalogs in {self.directory}: {e}")
+            return previous
+        for name in names:
+            lang_code, extension = os.path.splitext(name)
+            if extension != '.json':
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                mtime = os.stat(path).st_mtime
+            except OSError:
+                continue
+            cached = previous.get(lang_code)
+            if cached and cached[0] == mtime:
+                catalogs[lang_code] = cached
+                continue
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    catalogs[lang_code] = (mtime, MappingProxyType(json.load(f)))
+                logger.info(f"Loaded translations for '{lang_code}'")
+            except (OSError, ValueError) as e:
+                logger.error(f"Invalid translation catalog {path}: {e}")
+                if cached:
+                    catalogs[lang_code] = cached
+        return catalogs